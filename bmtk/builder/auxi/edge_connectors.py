@@ -22,6 +22,7 @@
 #
 import numpy as np
 import random
+from scipy.spatial import cKDTree
 
 
 def distance_connector(source, target, d_weight_min, d_weight_max, d_max, nsyn_min, nsyn_max):
@@ -52,5 +53,171 @@ def distance_connector(source, target, d_weight_min, d_weight_max, d_max, nsyn_m
     return tmp_nsyn
 
 
+def spatial_distance_connector(source_cols, target_cols, d_weight_min, d_weight_max, d_max, nsyn_min, nsyn_max,
+                               positions='positions'):
+    """Same rule as distance_connector but for the 'all_to_all' iterator, eg
+
+        net.add_edges(..., iterator='all_to_all', connection_rule=spatial_distance_connector,
+                      connection_params={'d_weight_min': 0.0, 'd_weight_max': 0.34, 'd_max': 300.0, 'nsyn_min': 3,
+                                         'nsyn_max': 7})
+
+    Source and target positions are put into a KD-tree so only the pairs within d_max of each other are visited, and
+    the random numbers for all those pairs are drawn at once using numpy.
+
+    :param positions: name of the node property with the x, y, z coordinates of each node.
+    :return: (source indices, target indices, nsyns) of all the connected pairs
+    """
+    src_pos = np.asarray(source_cols[positions], dtype=np.float64).reshape(len(source_cols), -1)
+    trg_pos = np.asarray(target_cols[positions], dtype=np.float64).reshape(len(target_cols), -1)
+    if len(src_pos) == 0 or len(trg_pos) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    pairs = cKDTree(src_pos).sparse_distance_matrix(cKDTree(trg_pos), d_max, output_type='ndarray')
+    src_idxs = pairs['i'].astype(np.int64)
+    trg_idxs = pairs['j'].astype(np.int64)
+    r = pairs['v']
+
+    # order of the pairs found by the trees is arbitrary, sort them so results are reproducible for a given seed
+    order = np.lexsort((trg_idxs, src_idxs))
+    src_idxs, trg_idxs, r = src_idxs[order], trg_idxs[order], r[order]
+
+    # Avoid self-connections.
+    keep = source_cols.node_ids[src_idxs] != target_cols.node_ids[trg_idxs]
+    src_idxs, trg_idxs, r = src_idxs[keep], trg_idxs[keep], r[keep]
+
+    # weights by euclidean distance, used as the probability of connection
+    t = r / d_max
+    dw = d_weight_max * (1.0 - t) + d_weight_min * t
+    keep = (dw > 0) & (np.random.random(len(dw)) <= dw)
+    src_idxs, trg_idxs = src_idxs[keep], trg_idxs[keep]
+
+    # Add the number of synapses for every connection.
+    nsyns = np.random.randint(nsyn_min, nsyn_max + 1, size=len(src_idxs))
+    return src_idxs, trg_idxs, nsyns
+
+
 def connect_random(source, target, nsyn_min=0, nsyn_max=10, distribution=None):
-    return np.random.randint(nsyn_min, nsyn_max)
\ No newline at end of file
+    return np.random.randint(nsyn_min, nsyn_max)
+
+########################################################################
+# Sampling connectors, for iterator='all_to_all'
+#
+# Instead of evaluating every source/target pair, the connected pairs are drawn directly, so the time it takes only
+# depends on the number of edges created. Random numbers come from numpy's global generator (seeded by
+# build(seed=...)) unless a seed is given.
+########################################################################
+def _get_prng(seed):
+    return np.random if seed is None else np.random.RandomState(seed)
+
+
+def _sample_columns(prng, row_idxs, n_cols, row_ids, col_ids, allow_self_connections):
+    """For every row in row_idxs picks a random column, a row will never get the same column twice (or the column with
+    the same node id when allow_self_connections is False). row_idxs must be sorted.
+    """
+    n_rows = len(row_ids)
+    if len(row_idxs) > 0.5*n_rows*n_cols:
+        # dense, it's cheaper to shuffle all the columns of each row and take the first k of them
+        rand_vals = prng.random_sample((n_rows, n_cols))
+        if not allow_self_connections:
+            rand_vals[row_ids[:, np.newaxis] == col_ids[np.newaxis, :]] = np.inf
+        row_counts = np.bincount(row_idxs, minlength=n_rows)
+        col_order = np.argsort(rand_vals, axis=1, kind='stable')
+        col_idxs = col_order[np.arange(n_cols)[np.newaxis, :] < row_counts[:, np.newaxis]]
+        return row_idxs, col_idxs.astype(np.int64)
+
+    # sparse, draw the columns with replacement then redraw the duplicated and self-connected pairs until there are
+    # none left
+    col_idxs = prng.randint(n_cols, size=len(row_idxs)).astype(np.int64)
+    redraw = np.arange(len(row_idxs))
+    while len(redraw) > 0:
+        invalid = np.ones(len(row_idxs), dtype=bool)
+        _, first_idxs = np.unique(row_idxs*n_cols + col_idxs, return_index=True)
+        invalid[first_idxs] = False
+        if not allow_self_connections:
+            invalid |= row_ids[row_idxs] == col_ids[col_idxs]
+        redraw = np.flatnonzero(invalid)
+        col_idxs[redraw] = prng.randint(n_cols, size=len(redraw))
+
+    order = np.lexsort((col_idxs, row_idxs))
+    return row_idxs[order], col_idxs[order]
+
+
+def _n_candidates(row_ids, col_ids, allow_self_connections):
+    """Number of columns each row can be connected to."""
+    n_candidates = np.full(len(row_ids), len(col_ids), dtype=np.int64)
+    if not allow_self_connections:
+        n_candidates -= np.in1d(row_ids, col_ids)
+    return n_candidates
+
+
+def _sample_degrees(prng, degrees, row_ids, col_ids, allow_self_connections):
+    n_candidates = _n_candidates(row_ids, col_ids, allow_self_connections)
+    degrees = np.broadcast_to(np.asarray(degrees, dtype=np.int64), (len(row_ids),))
+    if np.any(degrees > n_candidates) or np.any(degrees < 0):
+        raise Exception('Degree must be between 0 and the number of nodes available to connect to ({}).'.format(
+            n_candidates.min() if len(n_candidates) > 0 else 0))
+
+    row_idxs = np.repeat(np.arange(len(row_ids), dtype=np.int64), degrees)
+    return _sample_columns(prng, row_idxs, len(col_ids), row_ids, col_ids, allow_self_connections)
+
+
+def fixed_indegree_connector(source_cols, target_cols, indegree, nsyns=1, allow_self_connections=False, seed=None):
+    """Connects every target to indegree sources picked at random (without replacement), eg
+
+        net.add_edges(..., iterator='all_to_all', connection_rule=fixed_indegree_connector,
+                      connection_params={'indegree': 100, 'nsyns': 2})
+
+    :param indegree: number of sources for each target.
+    :param nsyns: number of synapses of each connection.
+    :param allow_self_connections: if False a node will not be connected to itself.
+    :param seed: seed for the connector's own random number generator.
+    :return: (source indices, target indices, nsyns) of all the connected pairs
+    """
+    trg_idxs, src_idxs = _sample_degrees(_get_prng(seed), indegree, target_cols.node_ids, source_cols.node_ids,
+                                         allow_self_connections)
+    return src_idxs, trg_idxs, np.full(len(src_idxs), nsyns, dtype=np.int64)
+
+
+def fixed_outdegree_connector(source_cols, target_cols, outdegree, nsyns=1, allow_self_connections=False,
+                              seed=None):
+    """Connects every source to outdegree targets picked at random (without replacement). Same parameters as
+    fixed_indegree_connector.
+    """
+    src_idxs, trg_idxs = _sample_degrees(_get_prng(seed), outdegree, source_cols.node_ids, target_cols.node_ids,
+                                         allow_self_connections)
+    return src_idxs, trg_idxs, np.full(len(src_idxs), nsyns, dtype=np.int64)
+
+
+def binomial_connector(source_cols, target_cols, p, nsyns=1, allow_self_connections=False, seed=None):
+    """Connects every source/target pair independently with probability p (an Erdos-Renyi network). The in-degree of
+    each target is drawn from a binomial distribution, then that many sources are picked at random.
+    """
+    prng = _get_prng(seed)
+    src_ids, trg_ids = source_cols.node_ids, target_cols.node_ids
+    indegrees = prng.binomial(_n_candidates(trg_ids, src_ids, allow_self_connections), p)
+    trg_idxs, src_idxs = _sample_degrees(prng, indegrees, trg_ids, src_ids, allow_self_connections)
+    return src_idxs, trg_idxs, np.full(len(src_idxs), nsyns, dtype=np.int64)
+
+
+def fixed_total_connector(source_cols, target_cols, n_edges, nsyns=1, allow_self_connections=False, seed=None):
+    """Creates exactly n_edges connections between source/target pairs picked at random (without replacement)."""
+    prng = _get_prng(seed)
+    src_ids, trg_ids = source_cols.node_ids, target_cols.node_ids
+    n_candidates = _n_candidates(trg_ids, src_ids, allow_self_connections)
+    if n_edges > np.sum(n_candidates) or n_edges < 0:
+        raise Exception('Number of edges must be between 0 and the number of source/target pairs ({}).'.format(
+            np.sum(n_candidates)))
+
+    # the number of edges of each target follows a multivariate hypergeometric distribution, drawn one target at a
+    # time from the pairs that are left
+    indegrees = np.zeros(len(trg_ids), dtype=np.int64)
+    n_left, pairs_left = n_edges, np.sum(n_candidates)
+    for i, n_cands in enumerate(n_candidates):
+        if n_left == 0:
+            break
+        pairs_left -= n_cands
+        indegrees[i] = n_left if pairs_left == 0 else prng.hypergeometric(n_cands, pairs_left, n_left)
+        n_left -= indegrees[i]
+
+    trg_idxs, src_idxs = _sample_degrees(prng, indegrees, trg_ids, src_ids, allow_self_connections)
+    return src_idxs, trg_idxs, np.full(len(src_idxs), nsyns, dtype=np.int64)
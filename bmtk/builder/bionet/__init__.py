@@ -1 +1,7 @@
-from .swc_reader import SWCReader
+from .synapse_placement import SynapsePlacer, MorphologySegments, load_morphology_segments
+
+try:
+    from .swc_reader import SWCReader
+except ImportError:
+    # SWCReader requires NEURON, synapses can still be placed on morphologies that have already been loaded
+    pass
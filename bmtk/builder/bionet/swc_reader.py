@@ -3,6 +3,7 @@ from neuron import h
 
 from bmtk.simulator.bionet import nrn
 from bmtk.simulator.bionet.morphology import Morphology
+from .synapse_placement import MorphologySegments
 
 
 class SWCReader(object):
@@ -19,12 +20,14 @@ class SWCReader(object):
         self._prng = np.random.RandomState(random_seed)
 
         self._secs = []
+        self._seg_sec_ids = []  # index of the section of every segment in the "all" section-list
         self._save_sections()
 
     def _save_sections(self):
-        for sec in self._hobj.all:
+        for sec_id, sec in enumerate(self._hobj.all):
             for _ in sec:
                 self._secs.append(sec)
+                self._seg_sec_ids.append(sec_id)
 
     def _fix_axon(self):
         """Removes and refixes axon"""
@@ -58,6 +61,12 @@ class SWCReader(object):
         secs_ix = self._prng.choice(secs, n_sections, p=probs)
         return secs_ix, self._morphology.seg_prop['x'][secs_ix]
 
+    def segments(self):
+        """Returns the MorphologySegments table of the morphology, for placing many synapses at once."""
+        seg_prop = self._morphology.seg_prop
+        return MorphologySegments(self._seg_sec_ids, seg_prop['x'], seg_prop['type'], seg_prop['dist'],
+                                  seg_prop['length'])
+
     def get_coord(self, sec_ids, sec_xs, soma_center=(0.0, 0.0, 0.0), rotations=None):
         adjusted = self._morphology.get_soma_pos() - np.array(soma_center)
         absolute_coords = []
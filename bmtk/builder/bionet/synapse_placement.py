@@ -0,0 +1,166 @@
+# Copyright 2017. Allen Institute. All rights reserved
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import os
+import numpy as np
+
+
+# section and section-list names --> swc type, same as bmtk.simulator.bionet.morphology.Morphology
+SWC_SECTION_TYPES = {'soma': 1, 'somatic': 1,
+                     'axon': 2, 'axonal': 2,
+                     'dend': 3, 'basal': 3,
+                     'apic': 4, 'apical': 4}
+
+_segments_cache = {}  # (morphology file, fix_axon) --> MorphologySegments
+
+
+class MorphologySegments(object):
+    """Segment table of a morphology, one row for every segment with the id of its section (the index of the section
+    in the cell's "all" section-list), its position along the section, its swc type, its distance from the soma and
+    its length. Everything needed to place synapses, so NEURON is only needed to create the table.
+    """
+    def __init__(self, sec_ids, sec_xs, seg_types, seg_dists, seg_lengths):
+        self._sec_ids = np.asarray(sec_ids, dtype=np.int64)
+        self._sec_xs = np.asarray(sec_xs, dtype=np.float64)
+        self._seg_types = np.asarray(seg_types)
+        self._seg_lengths = np.asarray(seg_lengths, dtype=np.float64)
+        seg_dists = np.asarray(seg_dists, dtype=np.float64)
+        self._seg_d0 = seg_dists - self._seg_lengths/2
+        self._seg_d1 = seg_dists + self._seg_lengths/2
+        self._targets = {}  # (section names, distance range) --> (segment indices, probabilities)
+
+    @property
+    def sec_ids(self):
+        return self._sec_ids
+
+    @property
+    def sec_xs(self):
+        return self._sec_xs
+
+    def __len__(self):
+        return len(self._sec_ids)
+
+    def find_segments(self, section_names, distance_range):
+        """Returns the indices of the segments that are in the given sections and overlap with the distance range,
+        along with the probability of a synapse being placed on each of them (proportional to the length of the
+        overlap). Same as bmtk.simulator.bionet.morphology.Morphology.find_sections().
+        """
+        key = (tuple(section_names), tuple(distance_range))
+        if key not in self._targets:
+            dmin, dmax = distance_range[0], distance_range[1]
+            frac_overlap = np.maximum(0, np.minimum(self._seg_d1, dmax) - np.maximum(self._seg_d0, dmin))
+            frac_overlap /= self._seg_lengths
+            sec_types = [SWC_SECTION_TYPES[name] for name in section_names]
+            seg_ix = np.flatnonzero((frac_overlap > 0) & np.in1d(self._seg_types, sec_types))
+            if len(seg_ix) == 0:
+                raise Exception('Morphology has no {} segments within distance {} of the soma.'.format(
+                    list(section_names), list(distance_range)))
+
+            seg_weights = self._seg_lengths[seg_ix]*frac_overlap[seg_ix]
+            self._targets[key] = (seg_ix, seg_weights/np.sum(seg_weights))
+
+        return self._targets[key]
+
+    def choose_sections(self, section_names, distance_range, n_sections=1, prng=np.random):
+        """Randomly picks n_sections synapse locations, returns their section ids and section positions."""
+        seg_ix, seg_probs = self.find_segments(section_names, distance_range)
+        segs = prng.choice(seg_ix, n_sections, p=seg_probs)
+        return self._sec_ids[segs], self._sec_xs[segs]
+
+
+def load_morphology_segments(morphology_file, fix_axon=True):
+    """Returns the MorphologySegments of an swc file. Each file is only loaded once (with SWCReader) per process."""
+    key = (os.path.abspath(morphology_file), fix_axon)
+    if key not in _segments_cache:
+        # NEURON is only required when a morphology has to be loaded
+        from .swc_reader import SWCReader
+        _segments_cache[key] = SWCReader(morphology_file, fix_axon=fix_axon).segments()
+
+    return _segments_cache[key]
+
+
+class SynapsePlacer(object):
+    """A vectorized property rule that places the synapses of a connection map on their target's morphology.
+
+    For all the synapses onto targets with the same morphology the locations are picked in a single draw, and the
+    segment table of each morphology is only built once, so the rule can be used for connection maps with millions of
+    synapses. Targets use the swc file of their "morphology" property (or morphology_column)::
+
+        cm.add_properties(['sec_id', 'sec_x'],
+                          rule=SynapsePlacer(['basal', 'apical'], [50.0, 150.0], morphology_dir='morphologies'),
+                          dtypes=[np.int32, np.float64], vectorized=True)
+
+    Synapses are drawn from the numpy global random number generator, so they depend on the seed of build(seed=...),
+    unless a seed is given. With a seed the generator is restarted for every connection map from the seed and the
+    index of the connection map (see reseed()), so serial and parallel builds place the same synapses.
+
+    :param section_names: names of the sections the synapses are placed on (somatic, basal, apical, axonal).
+    :param distance_range: [min, max] arc-length distance from the soma.
+    :param morphology_dir: directory of the swc files.
+    :param morphology_column: name of the target property with the swc file name.
+    :param seed: seed of the rule's own random number generator.
+    :param fix_axon: passed to SWCReader.
+    :param morphologies: optional dictionary of already loaded morphology name --> MorphologySegments.
+    """
+    def __init__(self, section_names=('basal', 'apical'), distance_range=(0.0, 1.0e20), morphology_dir=None,
+                 morphology_column='morphology', seed=None, fix_axon=True, morphologies=None):
+        self._section_names = list(section_names)
+        self._distance_range = list(distance_range)
+        self._morphology_dir = morphology_dir
+        self._morphology_column = morphology_column
+        self._seed = seed
+        self._prng = np.random.RandomState(seed) if seed is not None else np.random
+        self._fix_axon = fix_axon
+        self._morphologies = dict(morphologies or {})
+
+    def reseed(self, cm_index):
+        if self._seed is not None:
+            self._prng = np.random.RandomState([self._seed, cm_index])
+
+    def get_segments(self, morphology):
+        if morphology not in self._morphologies:
+            morphology_file = morphology if self._morphology_dir is None \
+                else os.path.join(self._morphology_dir, morphology)
+            self._morphologies[morphology] = load_morphology_segments(morphology_file, self._fix_axon)
+        return self._morphologies[morphology]
+
+    def __call__(self, source_cols, target_cols):
+        morphologies = np.asarray(target_cols[self._morphology_column])
+        sec_ids = np.zeros(len(morphologies), dtype=np.int64)
+        sec_xs = np.zeros(len(morphologies), dtype=np.float64)
+        if len(morphologies) == 0:
+            return sec_ids, sec_xs
+
+        morphology_names, morphology_rows = np.unique(morphologies.astype(str), return_inverse=True)
+        for i, morphology in enumerate(morphology_names):
+            rows = np.flatnonzero(morphology_rows == i)
+            segments = self.get_segments(morphology)
+            sec_ids[rows], sec_xs[rows] = segments.choose_sections(self._section_names, self._distance_range,
+                                                                   len(rows), self._prng)
+
+        return sec_ids, sec_xs
+
+    def __repr__(self):
+        # used by the build cache to tell if the rule has changed
+        return 'SynapsePlacer({}, {}, morphology_dir={}, morphology_column={}, seed={}, fix_axon={})'.format(
+            self._section_names, self._distance_range, self._morphology_dir, self._morphology_column, self._seed,
+            self._fix_axon)
@@ -0,0 +1,176 @@
+# Copyright 2017. Allen Institute. All rights reserved
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import os
+import sys
+import types
+import hashlib
+import functools
+import numpy as np
+import six
+from six.moves import cPickle as pickle
+
+
+CACHE_VERSION = 1
+
+
+class BuildCache(object):
+    """On-disk cache of the edge tables built for each ConnectionMap.
+
+    Every connection map gets a key made from the nodes it connects (node ids, the inputs of the node-sets and the
+    properties and node types of imported nodes), the connection and property rules (their byte-code, constants, closures and parameters), the edge-type properties and
+    the build seed. If a table with the same key has been saved before it is loaded from the cache directory instead
+    of being rebuilt, so after editing one connection rule only that connection map is recomputed.
+
+    Rules that read global variables are only keyed on globals with simple values (numbers, strings, lists, ...) and on
+    the functions they call, and rules without a seed will reuse a previously drawn random network. Delete the cache
+    directory to start fresh.
+    """
+    def __init__(self, cache_dir):
+        self._cache_dir = cache_dir
+        self._network_hashes = {}  # network name --> hash of the node inputs
+        self.hits = 0
+        self.misses = 0
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    @property
+    def cache_dir(self):
+        return self._cache_dir
+
+    def connection_map_key(self, connection_map, cm_index, seed=None):
+        key = hashlib.sha1()
+        _update_hash(key, ('bmtk-build-cache', CACHE_VERSION, sys.version_info[:2]))
+        for node_pool in [connection_map.source_nodes, connection_map.target_nodes]:
+            key.update(self._network_hash(node_pool.network).encode())
+            key.update(np.ascontiguousarray(node_pool.columns().node_ids, dtype=np.int64).tobytes())
+
+        _update_hash(key, connection_map.connector)
+        _update_hash(key, connection_map.connector_params)
+        _update_hash(key, connection_map.iterator)
+        _update_hash(key, connection_map.edge_type_properties)
+        _update_hash(key, connection_map.symmetric)
+        for param in connection_map.params:
+            _update_hash(key, (param.names, param.dtypes, param.vectorized))
+            _update_hash(key, param.rule)
+
+        # Each connection map has its own random seed derived from the build seed and its index
+        _update_hash(key, (seed, cm_index) if seed is not None else None)
+        return key.hexdigest()
+
+    def _network_hash(self, network):
+        if network.name not in self._network_hashes:
+            key = hashlib.sha1()
+            for node_set in network._node_sets:
+                _update_hash(key, (node_set.N, node_set.node_type_properties))
+                for param_name in sorted(node_set.params_keys):
+                    _update_hash(key, (param_name, node_set.params_column(param_name)))
+
+            for imported_nodes in getattr(network, '_imported_nodes', []):
+                _update_hash(key, (imported_nodes.node_ids, imported_nodes.node_type_ids, imported_nodes.group_ids,
+                                   imported_nodes.group_indices))
+                _update_hash(key, (imported_nodes.node_types, imported_nodes.group_columns))
+
+            self._network_hashes[network.name] = key.hexdigest()
+        return self._network_hashes[network.name]
+
+    def _cache_file(self, key):
+        return os.path.join(self._cache_dir, '{}.pkl'.format(key))
+
+    def load(self, key):
+        """Returns the edge table saved under key, or None if it has not been cached."""
+        cache_file = self._cache_file(key)
+        if not os.path.exists(cache_file):
+            self.misses += 1
+            return None
+
+        with open(cache_file, 'rb') as f:
+            edge_table = pickle.load(f)
+        self.hits += 1
+        return edge_table
+
+    def save(self, key, edge_table):
+        # Write to a temp file first so that an interrupted build doesn't leave a corrupted table in the cache
+        cache_file = self._cache_file(key)
+        tmp_file = '{}.{}.tmp'.format(cache_file, os.getpid())
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(edge_table, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_file, cache_file)
+
+
+_SIMPLE_TYPES = six.string_types + six.integer_types + (bool, float, complex, bytes, type(None))
+_GLOBAL_TYPES = _SIMPLE_TYPES + (list, tuple, dict, np.ndarray, types.FunctionType, types.MethodType,
+                                 functools.partial)
+
+
+def _update_hash(key, obj):
+    """Adds a deterministic representation of obj to the hash."""
+    key.update(_fingerprint(obj).encode('utf-8', 'backslashreplace'))
+
+
+def _fingerprint(obj, depth=0, visited=None):
+    if depth > 10:
+        return '...'
+
+    visited = set() if visited is None else visited
+    if isinstance(obj, functools.partial):
+        return 'partial({}, {}, {})'.format(_fingerprint(obj.func, depth + 1, visited),
+                                            _fingerprint(obj.args, depth + 1, visited),
+                                            _fingerprint(obj.keywords, depth + 1, visited))
+
+    elif isinstance(obj, (types.FunctionType, types.MethodType)):
+        func = obj.__func__ if isinstance(obj, types.MethodType) else obj
+        if id(func) in visited:
+            # recursive functions, or a helper used more than once, are only fingerprinted the first time
+            return 'function({})'.format(func.__name__)
+        visited.add(id(func))
+
+        closure = [_fingerprint(c.cell_contents, depth + 1, visited) for c in (func.__closure__ or [])]
+        # helper functions called by the rule are included so that editing them also changes the key
+        func_globals = [(n, _fingerprint(func.__globals__[n], depth + 1, visited)) for n in func.__code__.co_names
+                        if n in func.__globals__ and isinstance(func.__globals__[n], _GLOBAL_TYPES)]
+        return 'function({}, {}, {}, {})'.format(_code_fingerprint(func.__code__), closure,
+                                                 _fingerprint(func.__defaults__, depth + 1, visited), func_globals)
+
+    elif isinstance(obj, types.CodeType):
+        return _code_fingerprint(obj)
+
+    elif isinstance(obj, dict):
+        items = sorted((str(k), _fingerprint(v, depth + 1, visited)) for k, v in obj.items())
+        return 'dict({})'.format(items)
+
+    elif isinstance(obj, (list, tuple)):
+        return '{}({})'.format(type(obj).__name__, [_fingerprint(v, depth + 1, visited) for v in obj])
+
+    elif isinstance(obj, np.ndarray):
+        if obj.dtype == object:
+            return 'ndarray({})'.format([_fingerprint(v, depth + 1, visited) for v in obj.ravel()])
+        return 'ndarray({}, {}, {})'.format(obj.dtype.str, obj.shape,
+                                            hashlib.sha1(np.ascontiguousarray(obj).tobytes()).hexdigest())
+
+    else:
+        return '{}:{}'.format(type(obj).__name__, repr(obj))
+
+
+def _code_fingerprint(code):
+    consts = [_code_fingerprint(c) if isinstance(c, types.CodeType) else repr(c) for c in code.co_consts]
+    return 'code({}, {}, {})'.format(hashlib.sha1(code.co_code).hexdigest(), consts, code.co_names)
@@ -0,0 +1,110 @@
+# Copyright 2017. Allen Institute. All rights reserved
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import os
+import sys
+import csv
+import json
+
+try:
+    import resource
+except ImportError:
+    # not available on windows
+    resource = None
+
+
+def peak_rss():
+    """Returns the peak resident memory of the current process in bytes, or None if it can't be measured. This is the
+    high-water mark over the whole life of the process, not of a single step."""
+    if resource is None:
+        return None
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on mac and kilobytes on linux
+    return int(max_rss) if sys.platform == 'darwin' else int(max_rss)*1024
+
+
+def current_rss():
+    """Returns the current resident memory of the process in bytes, or None if it can't be measured (needs /proc)."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1])*os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, AttributeError):
+        return None
+
+
+class BuildReport(object):
+    """Records the wall time and memory of every step of building and saving a network.
+
+    Each connection map gets its own record with the size of its connection matrix (max_pairs, the number of
+    source/target pairs; connectors that sample or search for neighbors evaluate fewer), the number of pairs that were
+    connected (edges) and their total number of synapses, so slow or large connection rules are easy to find. rss is
+    the resident memory at the end of the step, peak_rss the peak of the process so far (it never decreases). Enabled
+    with Network.build(profile=True) or save_edges(profile=True), the report is written as
+    <network>_build_report.json and .csv next to the saved nodes/edges files.
+    """
+    columns = ['stage', 'network', 'cm_index', 'source_network', 'target_network', 'connector', 'max_pairs',
+               'edges', 'synapses', 'cached', 'wall_time', 'rss', 'peak_rss']
+
+    def __init__(self, network_name):
+        self._network_name = network_name
+        self._records = []
+
+    @property
+    def records(self):
+        return self._records
+
+    def add(self, stage, wall_time, peak_rss_bytes=None, rss_bytes=None, **values):
+        record = {c: None for c in self.columns}
+        record.update(values)
+        record['stage'] = stage
+        record['network'] = self._network_name
+        record['wall_time'] = float(wall_time)
+        record['rss'] = rss_bytes if rss_bytes is not None else current_rss()
+        record['peak_rss'] = peak_rss_bytes if peak_rss_bytes is not None else peak_rss()
+        self._records.append(record)
+        return record
+
+    def add_connection_map(self, connection_map, cm_index, nedges, nsyns, wall_time, cached=False,
+                           peak_rss_bytes=None, rss_bytes=None):
+        connector = connection_map.connector
+        return self.add('connection_map', wall_time, peak_rss_bytes, rss_bytes,
+                        cm_index=cm_index,
+                        source_network=connection_map.source_network_name,
+                        target_network=connection_map.target_network_name,
+                        connector=getattr(connector, '__name__', repr(connector)),
+                        max_pairs=int(connection_map.max_connections()),
+                        edges=int(nedges),
+                        synapses=int(nsyns),
+                        cached=cached)
+
+    def save(self, output_dir):
+        """Writes the records into <output_dir>/<network>_build_report.json and .csv"""
+        file_prefix = os.path.join(output_dir, '{}_build_report'.format(self._network_name))
+        with open(file_prefix + '.json', 'w') as json_file:
+            json.dump({'network': self._network_name, 'records': self._records}, json_file, indent=2)
+
+        with open(file_prefix + '.csv', 'w') as csv_file:
+            csvw = csv.writer(csv_file, delimiter=' ')
+            csvw.writerow(self.columns)
+            for record in self._records:
+                csvw.writerow(['NULL' if record[c] is None else record[c] for c in self.columns])
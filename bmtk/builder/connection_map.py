@@ -37,11 +37,12 @@ class ConnectionMap(object):
 
     class ParamsRules(object):
         """A subclass to store indvidiual synpatic parameter rules"""
-        def __init__(self, names, rule, rule_params, dtypes):
+        def __init__(self, names, rule, rule_params, dtypes, vectorized=False):
             self._names = names
             self._rule = rule
             self._rule_params = rule_params
             self._dtypes = self.__create_dtype_dict(names, dtypes)
+            self._vectorized = vectorized
 
         def __create_dtype_dict(self, names, dtypes):
             if isinstance(names, list):
@@ -62,6 +63,10 @@ class ConnectionMap(object):
         def dtypes(self):
             return self._dtypes
 
+        @property
+        def vectorized(self):
+            return self._vectorized
+
         def get_prop_dtype(self, prop_name):
             return self._dtypes[prop_name]
 
@@ -76,6 +81,7 @@ class ConnectionMap(object):
 
         self._params = []
         self._param_keys = []
+        self._symmetric = False
 
     @property
     def params(self):
@@ -113,6 +119,16 @@ class ConnectionMap(object):
     def edge_type_properties(self):
         return self._edge_type_properties or {}
 
+    @property
+    def symmetric(self):
+        """If True a connection from a to b and one from b to a are the same connection (eg. gap junctions) and only
+        one of them is kept."""
+        return self._symmetric
+
+    @symmetric.setter
+    def symmetric(self, value):
+        self._symmetric = value
+
     @property
     def edge_type_id(self):
         # TODO: properly implement edge_type
@@ -133,17 +149,35 @@ class ConnectionMap(object):
     def max_connections(self):
         return len(self._source_nodes) * len(self._target_nodes)
 
-    def add_properties(self, names, rule, rule_params=None, dtypes=None):
+    def add_properties(self, names, rule, rule_params=None, dtypes=None, vectorized=False):
         """A a synaptic property
 
+        By default rule is called once for every synapse with the source and target node. When vectorized is True the
+        rule is called only once for all the synapses of the connection map, with the source and target node
+        properties as columns of numpy arrays (see NodePool.columns()) containing one row for every synapse. It should
+        return an array of values, or a list of arrays if there are multiple names.
+
+        cm.add_properties('syn_weight', rule=lambda srcs, trgs: np.random.normal(1.0, 0.1, len(trgs)),
+                          dtypes=float, vectorized=True)
+
         :param names: list, or single string, of the property
         :param rule: function, list or value of property
         :param rule_params: when rule is a function, rule_params will be passed into function when called.
         :param dtypes: expected property type
+        :param vectorized: set to True to call the rule once with the columns of all synapses.
         """
-        self._params.append(self.ParamsRules(names, rule, rule_params, dtypes))
+        self._params.append(self.ParamsRules(names, rule, rule_params, dtypes, vectorized))
         self._param_keys += names
 
+    def reseed_rules(self, cm_index):
+        """Calls reseed(cm_index) on the connector and property rules that have their own random number generator (eg.
+        SynapsePlacer(seed=...)), so they draw the same values for this connection map whether it's built in this
+        process or a forked worker, and regardless of the connection maps built before it.
+        """
+        for rule in [self._connector] + [p._rule for p in self._params]:
+            if hasattr(rule, 'reseed'):
+                rule.reseed(cm_index)
+
     def connection_itr(self):
         """Returns a generator that will iterate through the source/target pairs (as specified by the iterator function,
         and create a connection rule based on the connector.
@@ -151,3 +185,17 @@ class ConnectionMap(object):
         conr = connector.create(self.connector, **(self.connector_params or {}))
         itr = iterator.create(self.iterator, conr, **({}))
         return itr(self.source_nodes, self.target_nodes, conr)
+
+    @property
+    def vectorized(self):
+        """True if the connections are generated in blocks of numpy arrays (eg. iterator='all_to_all')."""
+        conr = connector.create(self.connector, **(self.connector_params or {}))
+        return iterator.is_vectorized(self.iterator, conr)
+
+    def connection_blocks(self):
+        """Returns a generator of (source_node_ids, target_node_ids, nsyns) numpy arrays, for connection maps using a
+        vectorized iterator.
+        """
+        conr = connector.create(self.connector, **(self.connector_params or {}))
+        itr = iterator.create_block_iterator(self.iterator, conr, **({}))
+        return itr(self.source_nodes, self.target_nodes, conr)
@@ -45,6 +45,12 @@ class IDGenerator(object):
         if gid >= self.__counter:
             self.__taken.add(gid)
 
+    def remove_ids(self, gids):
+        """Same as remove_id() for an array of ids."""
+        gids = np.asarray(gids)
+        assert(np.issubdtype(gids.dtype, np.integer))
+        self.__taken.update(int(gid) for gid in gids[gids >= self.__counter])
+
     def next(self):
         self.__lock.acquire()
         while self.__counter in self.__taken:
@@ -57,6 +63,27 @@ class IDGenerator(object):
 
         return nid
 
+    def next_ids(self, n):
+        """Returns an array of the next n ids, same as calling next() n times."""
+        with self.__lock:
+            taken = np.array(sorted(self.__taken), dtype=np.int64)
+            taken = taken[taken >= self.__counter]
+
+            # every removed id before the end of the range pushes the end back by one
+            end = self.__counter + n
+            n_taken = np.searchsorted(taken, end)
+            while self.__counter + n + n_taken != end:
+                end = self.__counter + n + n_taken
+                n_taken = np.searchsorted(taken, end)
+
+            ids = np.arange(self.__counter, end, dtype=np.int64)
+            if n_taken > 0:
+                ids = ids[~np.in1d(ids, taken[:n_taken])]
+                self.__taken.difference_update(int(gid) for gid in taken[:n_taken])
+            self.__counter = end
+
+        return ids
+
     def __contains__(self, gid):
         return gid < self.__counter
 
@@ -23,6 +23,7 @@
 import itertools
 import functools
 import types
+import numpy as np
 
 
 class IteratorCache(object):
@@ -43,6 +44,9 @@ class IteratorCache(object):
     def register(self, name, itr_type, func):
         self.cache[(name, itr_type)] = func
 
+    def __contains__(self, item):
+        return item in self.cache
+
 
 def create(iterator, connector, **params):
     return ITERATOR_CACHE.create(iterator, type(connector), **params)
@@ -52,6 +56,30 @@ def register(name, dtype, func):
     ITERATOR_CACHE.register(name, dtype, func)
 
 
+def create_block_iterator(iterator, connector, **params):
+    return BLOCK_ITERATOR_CACHE.create(iterator, type(connector), **params)
+
+
+def register_block_iterator(name, dtype, func):
+    """Registers an iterator that returns whole blocks of edges at a time, as (source_ids, target_ids, nsyns) numpy
+    arrays, rather than one source/target pair at a time. A regular pair iterator is also registered under the same
+    name so the connection can still be iterated over edge-by-edge.
+    """
+    BLOCK_ITERATOR_CACHE.register(name, dtype, func)
+
+    def pairs_iterator(source_nodes, target_nodes, connector):
+        for src_ids, trg_ids, nsyns in func(source_nodes, target_nodes, connector):
+            for src_id, trg_id, nsyn in zip(src_ids, trg_ids, nsyns):
+                yield (src_id, trg_id, nsyn)
+
+    ITERATOR_CACHE.register(name, dtype, pairs_iterator)
+
+
+def is_vectorized(iterator, connector):
+    """Returns True if the connections can be generated in blocks of numpy arrays."""
+    return (iterator, type(connector)) in BLOCK_ITERATOR_CACHE
+
+
 ########################################################################
 # Pre-defined iterators
 ########################################################################
@@ -111,7 +139,29 @@ def lambda_iterator(source_nodes, target_nodes, lambda_val):
         yield (source.node_id, target.node_id, lambda_val())
 
 
+def all_to_all_iterator(source_nodes, target_nodes, connector):
+    """Calls the connector function only once, passing in the properties of all the sources and all the targets as
+    columns of numpy arrays (see NodePool.columns()). The connector should either return an array of shape
+    (n_sources, n_targets) with the number of synapses between each pair, or a tuple of arrays
+    (source_indices, target_indices, nsyns) where the indices are the row of the node in the source/target columns.
+    """
+    source_cols = source_nodes.columns()
+    target_cols = target_nodes.columns()
+    vals = connector(source_cols, target_cols)
+    if isinstance(vals, tuple) and len(vals) == 3:
+        src_idxs, trg_idxs, nsyns = (np.asarray(v) for v in vals)
+        src_idxs = src_idxs.astype(np.int64)
+        trg_idxs = trg_idxs.astype(np.int64)
+    else:
+        nsyns_table = np.broadcast_to(vals, (len(source_cols), len(target_cols)))
+        src_idxs, trg_idxs = np.nonzero(nsyns_table)
+        nsyns = nsyns_table[src_idxs, trg_idxs]
+
+    yield source_cols.node_ids[src_idxs], target_cols.node_ids[trg_idxs], nsyns
+
+
 ITERATOR_CACHE = IteratorCache()
+BLOCK_ITERATOR_CACHE = IteratorCache()
 register('one_to_one', functools.partial, one_to_one_iterator)
 register('all_to_one', functools.partial, all_to_one_iterator)
 register('one_to_all', functools.partial, one_to_all_iterator)
@@ -122,3 +172,5 @@ register('all_to_one', list, all_to_one_list_iterator)
 
 
 register('one_to_one', types.FunctionType, lambda_iterator)
+
+register_block_iterator('all_to_all', functools.partial, all_to_all_iterator)
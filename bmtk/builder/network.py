@@ -21,14 +21,19 @@
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
 import os
+import time
 import numpy as np
 import types
 import csv
 import six
+import random
+import multiprocessing
 
-from .node_pool import NodePool
+from .node_pool import NodePool, NodeColumns
 from .connection_map import ConnectionMap
 from .node_set import NodeSet
+from .build_cache import BuildCache
+from .build_report import BuildReport, peak_rss, current_rss
 from .id_generator import IDGenerator
 
 
@@ -46,6 +51,8 @@ class Network (object):
         
         self._node_sets = []
         self.__external_node_sets = []
+        self.__nodes_columns = None  # columnar view of all the nodes, see _nodes_columns()
+        self.__nodes_queries = {}
         self.__node_id_counter = 0
 
         self._node_types_properties = {}
@@ -70,6 +77,10 @@ class Network (object):
         self._network_conns = set()
         self._connected_networks = {}
 
+        self._build_cache = None  # only set while edges are being built
+        self._build_seed = None
+        self._build_report = None  # BuildReport, only when profiling is enabled
+
     @property
     def name(self):
         return self._network_name
@@ -93,6 +104,15 @@ class Network (object):
     def get_connections(self):
         return self._connection_maps
 
+    @property
+    def build_report(self):
+        """The BuildReport of the network, None unless profiling was enabled with build(profile=True)."""
+        return self._build_report
+
+    def _enable_profiling(self):
+        if self._build_report is None:
+            self._build_report = BuildReport(self.name)
+
     def _add_node_type(self, props):
         node_type_id = props.get('node_type_id', None)
         if node_type_id is None:
@@ -107,6 +127,7 @@ class Network (object):
 
     def add_nodes(self, N=1, **properties):
         self._clear()
+        self._reset_nodes_columns()
 
         # categorize properties as either a node-params (for nodes file) or node-type-property (for node_types files)
         node_params = {}
@@ -135,12 +156,20 @@ class Network (object):
         self._node_sets.append(NodeSet(N, node_params, node_properties))
 
     def add_gap_junctions(self, source=None, target=None, iterator='one_to_one', resistance=1, target_sections=['somatic'],
-                            connection_rule=1, connection_params=None):
+                            connection_rule=1, connection_params=None, symmetric=False):
+        """Adds gap junctions between cells of the network.
+
+        If symmetric is True a gap junction from cell a to b is the same as one from b to a, when the connection rule
+        creates both only the one from the smaller to the larger node id is kept. Cells connected to themselves are
+        dropped too.
+        """
         if target_sections != None:
             print("Warning: For gap junctions, the target sections variable is used for both the source and target sections.")
-        return self.add_edges(source=source, target=target, iterator=iterator, distance_range=[0.0,300.0],
-                    syn_weight=resistance, is_gap_junction=True, target_sections=target_sections,
-                    connection_rule=connection_rule, connection_params=connection_params)
+        connection = self.add_edges(source=source, target=target, iterator=iterator, distance_range=[0.0,300.0],
+                                    syn_weight=resistance, is_gap_junction=True, target_sections=target_sections,
+                                    connection_rule=connection_rule, connection_params=connection_params)
+        connection.symmetric = symmetric
+        return connection
 
     def add_edges(self, source=None, target=None, connection_rule=1, connection_params=None, iterator='one_to_one',
                   **edge_type_properties):
@@ -194,6 +223,34 @@ class Network (object):
     def nodes_iter(self, nids=None):
         raise NotImplementedError
 
+    def _nodes_columns(self):
+        """Returns a columnar NodeColumns view of all the nodes in the network. It is shared by all the NodePools so
+        every column is only built once, until the nodes change."""
+        if self.__nodes_columns is None:
+            self.__nodes_columns = NodeColumns(self.nodes_iter())
+            self.__nodes_queries = {}
+        return self.__nodes_columns
+
+    def _query_nodes(self, properties):
+        """Returns the rows in _nodes_columns() of the nodes matching a NodePool query. Results are cached so that
+        repeated queries (eg. the same source in many add_edges calls) are only evaluated once.
+        """
+        nodes_columns = self._nodes_columns()
+        try:
+            query_key = tuple(sorted((k, tuple(v) if isinstance(v, list) else v) for k, v in properties.items()))
+            hash(query_key)
+        except TypeError:
+            return nodes_columns.query(properties)
+
+        if query_key not in self.__nodes_queries:
+            self.__nodes_queries[query_key] = nodes_columns.query(properties)
+        return self.__nodes_queries[query_key]
+
+    def _reset_nodes_columns(self):
+        """Needs to be called whenever nodes are added or rebuilt."""
+        self.__nodes_columns = None
+        self.__nodes_queries = {}
+
     def edges(self, target_nodes=None, source_nodes=None, target_network=None, source_network=None, **properties):
         """Returns a list of dictionary-like Edge objects, given filter parameters.
 
@@ -286,6 +343,7 @@ class Network (object):
         self._nodes_built = False
         self._edges_built = False
         self._clear()
+        self._reset_nodes_columns()
 
     def _node_id(self, N):
         for i in six.moves.range(N):
@@ -295,6 +353,7 @@ class Network (object):
     def _build_nodes(self):
         """Builds or rebuilds all the nodes, clear out both node and edge sets."""
         # print 'build_nodes'
+        start_time = time.time()
         self._clear()
         self._initialize()
 
@@ -302,26 +361,131 @@ class Network (object):
             nodes = ns.build(nid_generator=self._node_id)
             self._add_nodes(nodes)
         self._nodes_built = True
+        self._reset_nodes_columns()
+
+        if self._build_report is not None:
+            self._build_report.add('build_nodes', time.time() - start_time)
 
-    def __build_edges(self):
+    def __build_edges(self, nprocs=1, seed=None, cache_dir=None):
         """Builds network edges"""
         if not self.nodes_built:
             # only rebuild nodes if necessary.
             self._build_nodes()
 
-        for i, conn_map in enumerate(self._connection_maps):
-            # print conn_map
-            self._add_edges(conn_map, i)
+        self._build_cache = BuildCache(cache_dir) if cache_dir is not None else None
+        self._build_seed = seed
+        try:
+            if nprocs > 1 and len(self._connection_maps) > 1 and _can_fork():
+                self.__build_edges_parallel(nprocs, seed)
+
+            else:
+                if nprocs > 1 and len(self._connection_maps) > 1:
+                    print('Warning: Unable to fork processes on this platform, building edges serially.')
+
+                for i, conn_map in enumerate(self._connection_maps):
+                    # print conn_map
+                    if seed is not None:
+                        _seed_connection_map(seed, i)
+                    conn_map.reseed_rules(i)
+                    self._add_edges(conn_map, i)
+        finally:
+            self._build_cache = None
 
         self._edges_built = True
 
-    def build(self, force=False):
+    def __build_edges_parallel(self, nprocs, seed):
+        """Builds the connection maps on a pool of forked processes. The workers inherit a copy of the network so
+        connection rules don't need to be picklable, only the resulting edge tables are sent back. Results are added in
+        the same order as the connection maps.
+        """
+        # Forked workers all inherit the random state of this process, so without a seed every connection map would
+        # draw the same numbers. Draw a base seed so each worker is still seeded differently.
+        worker_seed = seed if seed is not None else np.random.randint(2**31 - 1)
+
+        # Only send the connection maps missing from the build cache to the workers
+        cached_tables = {}
+        cache_keys = {}
+        tasks = []
+        for i, conn_map in enumerate(self._connection_maps):
+            if self._build_cache is not None:
+                start_time = time.time()
+                cache_keys[i] = self._build_cache.connection_map_key(conn_map, i, seed)
+                edge_table = self._build_cache.load(cache_keys[i])
+                if edge_table is not None:
+                    cached_tables[i] = (edge_table, time.time() - start_time)
+                    continue
+            tasks.append((i, worker_seed))
+
+        global _BUILD_NETWORK
+        _BUILD_NETWORK = self
+        pool = _fork_context().Pool(max(min(nprocs, len(tasks)), 1))
+        try:
+            built_tables = pool.imap(_build_edge_table_worker, tasks)
+            for i, conn_map in enumerate(self._connection_maps):
+                if i in cached_tables:
+                    edge_table, wall_time = cached_tables[i]
+                    self._record_edge_table(conn_map, i, edge_table, wall_time, cached=True)
+                else:
+                    _, edge_table, wall_time, worker_rss, worker_peak_rss = next(built_tables)
+                    if self._build_cache is not None:
+                        self._build_cache.save(cache_keys[i], edge_table)
+                    self._record_edge_table(conn_map, i, edge_table, wall_time, peak_rss_bytes=worker_peak_rss,
+                                            rss_bytes=worker_rss)
+                self._add_edge_table(conn_map, edge_table)
+        finally:
+            pool.close()
+            pool.join()
+            _BUILD_NETWORK = None
+
+    def _cached_edge_table(self, connection_map, i):
+        """Builds the edge table of the i'th connection map, or loads it from the build cache if it is unchanged."""
+        start_time = time.time()
+        if self._build_cache is None:
+            edge_table = self._build_edge_table(connection_map, i)
+            self._record_edge_table(connection_map, i, edge_table, time.time() - start_time)
+            return edge_table
+
+        cache_key = self._build_cache.connection_map_key(connection_map, i, self._build_seed)
+        edge_table = self._build_cache.load(cache_key)
+        cached = edge_table is not None
+        if not cached:
+            edge_table = self._build_edge_table(connection_map, i)
+            self._build_cache.save(cache_key, edge_table)
+        self._record_edge_table(connection_map, i, edge_table, time.time() - start_time, cached=cached)
+        return edge_table
+
+    def _record_edge_table(self, connection_map, i, edge_table, wall_time, cached=False, peak_rss_bytes=None,
+                           rss_bytes=None):
+        if self._build_report is not None:
+            nedges, nsyns = self._edge_table_size(edge_table)
+            self._build_report.add_connection_map(connection_map, i, nedges, nsyns, wall_time, cached=cached,
+                                                  peak_rss_bytes=peak_rss_bytes, rss_bytes=rss_bytes)
+
+    def _save_build_report(self, output_dir):
+        if self._build_report is not None:
+            self._build_report.save(output_dir)
+
+    def build(self, force=False, nprocs=1, seed=None, cache_dir=None, profile=False):
         """ Builds nodes (assigns gids) and edges.
 
         Args:
             force (bool): set true to force complete rebuilding of nodes and edges, if nodes() or save_nodes() has been
                 called before then forcing a rebuild may change gids of each node.
+            nprocs (int): number of local processes used to build the edges, each connection map is built
+                independently in a worker process (requires a platform that can fork processes).
+            seed (int): if set the numpy and python random number generators are re-seeded before building each
+                connection map using the seed and the index of the connection map. The resulting edges will be
+                identical regardless of nprocs.
+            cache_dir (str): if set the edges of every connection map are saved in this directory, and connection
+                maps whose nodes, rules, parameters and seed have not changed since a previous build are loaded from
+                it instead of being rebuilt (see bmtk.builder.build_cache.BuildCache).
+            profile (bool): set true to record the wall time, number of edges and memory use of every connection map,
+                as well as of building and saving the nodes and edges. The report is saved next to the network files
+                by save_nodes() and save_edges(), or can be accessed with the build_report property.
         """
+        if profile:
+            self._enable_profiling()
+        start_time = time.time()
 
         # if nodes() or save_nodes() is called by user prior to calling build() - make sure the nodes
         # are completely rebuilt (unless a node set has been added).
@@ -331,7 +495,10 @@ class Network (object):
             self._build_nodes()
 
         # always build the edges.
-        self.__build_edges()
+        self.__build_edges(nprocs=nprocs, seed=seed, cache_dir=cache_dir)
+
+        if self._build_report is not None:
+            self._build_report.add('build', time.time() - start_time)
 
     def __get_path(self, filename, path_dir, ftype):
         if filename is None:
@@ -342,11 +509,18 @@ class Network (object):
         else:
             return os.path.join(path_dir, filename)
 
-    def save(self, output_dir='.'):
-        self.save_nodes(output_dir=output_dir)
-        self.save_edges(output_dir=output_dir)
+    def save(self, output_dir='.', **h5_options):
+        self.save_nodes(output_dir=output_dir, **h5_options)
+        self.save_edges(output_dir=output_dir, **h5_options)
+
+    def save_nodes(self, nodes_file_name=None, node_types_file_name=None, output_dir='.', force_overwrite=True,
+                   chunks=None, compression=None, shuffle=False, narrow_dtypes=False):
+        """Saves the nodes and node-types of the network into SONATA files.
 
-    def save_nodes(self, nodes_file_name=None, node_types_file_name=None, output_dir='.', force_overwrite=True):
+        The layout of the hdf5 datasets can be changed with chunks (True or number of rows per chunk), compression
+        ('gzip', 'lzf' or a gzip level between 0 and 9) and shuffle. If narrow_dtypes is True, 64 bit integer and float
+        columns are saved as 32 bit when no values would be lost (see bmtk.utils.sonata.utils.create_dataset()).
+        """
         nodes_file = self.__get_path(nodes_file_name, output_dir, 'nodes.h5')
         if not force_overwrite and os.path.exists(nodes_file):
             raise Exception('File {} exists. Please use different name or use force_overwrite'.format(nodes_file))
@@ -361,10 +535,16 @@ class Network (object):
         if not os.path.exists(ntf_dir):
             os.makedirs(ntf_dir)
 
-        self._save_nodes(nodes_file)
+        start_time = time.time()
+        h5_options = {'chunks': chunks, 'compression': compression, 'shuffle': shuffle, 'narrow_dtypes': narrow_dtypes}
+        self._save_nodes(nodes_file, h5_options)
         self._save_node_types(node_types_file)
 
-    def _save_nodes(self, nodes_file_name):
+        if self._build_report is not None:
+            self._build_report.add('save_nodes', time.time() - start_time)
+            self._save_build_report(nf_dir)
+
+    def _save_nodes(self, nodes_file_name, h5_options=None):
         raise NotImplementedError
 
     def _save_node_types(self, node_types_file_name):
@@ -379,14 +559,45 @@ class Network (object):
         raise NotImplementedError
 
     def save_edges(self, edges_file_name=None, edge_types_file_name=None, output_dir='.', src_network=None,
-                   trg_network=None, name=None, force_build=True, force_overwrite=False):
+                   trg_network=None, name=None, force_build=True, force_overwrite=False, max_memory=None,
+                   profile=False, chunks=None, compression=None, shuffle=False, narrow_dtypes=False, append=False):
+        """Saves the edges and edge-types of the network into SONATA files.
+
+        If max_memory (in bytes) is set and the edges have not been built yet, the edges are built and written one
+        connection map at a time; once the buffered edges go over max_memory they are appended to the edges file and
+        released, so the whole network never has to be in memory. Edges built this way (other than gap junctions)
+        are not kept and build() must still be called to access them from the network.
+
+        If profile is True, or profiling was enabled by build(), a build report is also saved in output_dir (see
+        bmtk.builder.build_report.BuildReport).
+
+        The chunks, compression, shuffle and narrow_dtypes options are the same as in save_nodes(). Edges saved with
+        max_memory are appended to the file block by block so their dtypes are never narrowed.
+
+        If append is True the edges are added to existing edges files instead of overwriting them. A population that
+        isn't already in the file is added next to the others, otherwise the edges are appended to the end of the
+        population (re-using the edge-groups with the same properties) and only its indices are rebuilt. New edge
+        types are added to the existing edge-types csv, the edge_type_id of a new connection must not be used by a
+        different edge type of the file (set edge_type_id in add_edges()). Datasets are saved resizable so later appends
+        don't have to copy them, a dataset that can't be resized is copied once. HDF5 doesn't reclaim the space of
+        copied datasets, use h5repack to shrink the file.
+        """
+        if profile:
+            self._enable_profiling()
+
         # Make sure edges exists and are built
         if len(self._connection_maps) == 0:
             print("Warning: no edges have been made for this network, skipping saving.")
             return
 
+        stream_edges = False
         if self._edges_built is False:
-            if force_build:
+            if force_build and max_memory is not None:
+                print("Message: building and saving edges")
+                stream_edges = True
+                if not self.nodes_built:
+                    self._build_nodes()
+            elif force_build:
                 print("Message: building edges")
                 self.__build_edges()
             else:
@@ -410,16 +621,38 @@ class Network (object):
         if not os.path.exists(output_dir):
             os.mkdir(output_dir)
 
-        self._save_gap_junctions(os.path.join(output_dir, self._network_name + '_gap_juncs.h5'))
+        h5_options = {'chunks': chunks, 'compression': compression, 'shuffle': shuffle, 'narrow_dtypes': narrow_dtypes}
+        start_time = time.time()
+        if stream_edges:
+            for p in network_params:
+                if p[3] is not None:
+                    self._save_edge_types(os.path.join(output_dir, p[3]), p[0], p[1], append)
+
+            self._stream_edges(network_params, output_dir, name, max_memory, h5_options, append)
+            self._save_gap_junctions(os.path.join(output_dir, self._network_name + '_gap_juncs.h5'), append)
+            if self._build_report is not None:
+                self._build_report.add('stream_edges', time.time() - start_time)
+                self._save_build_report(output_dir)
+            return
+
+        self._save_gap_junctions(os.path.join(output_dir, self._network_name + '_gap_juncs.h5'), append)
 
         for p in network_params:
             if p[3] is not None:
-                self._save_edge_types(os.path.join(output_dir, p[3]), p[0], p[1])
+                self._save_edge_types(os.path.join(output_dir, p[3]), p[0], p[1], append)
 
             if p[2] is not None:
-                self._save_edges(os.path.join(output_dir, p[2]), p[0], p[1], name)
+                self._save_edges(os.path.join(output_dir, p[2]), p[0], p[1], name, h5_options, append)
+
+            if self._build_report is not None:
+                self._build_report.add('save_edges', time.time() - start_time, source_network=p[0],
+                                       target_network=p[1])
+                start_time = time.time()
+
+        if self._build_report is not None:
+            self._save_build_report(output_dir)
 
-    def _save_edge_types(self, edge_types_file_name, src_network, trg_network):
+    def _save_edge_types(self, edge_types_file_name, src_network, trg_network, append=False):
 
         # Get edge-type properties for connections with matching source/target networks
         matching_et = [c.edge_type_properties for c in self._connection_maps
@@ -430,18 +663,49 @@ class Network (object):
         merged_keys = [k for et in matching_et for k in et.keys() if k not in cols]
         cols += list(set(merged_keys))
 
+        rows = [[edge_type.get(cname, 'NULL') if edge_type.get(cname, 'NULL') is not None else 'NULL'
+                 for cname in cols] for edge_type in matching_et]
+        if append and os.path.exists(edge_types_file_name):
+            cols, rows = self._merge_edge_types(edge_types_file_name, cols, rows)
+
         # Write to csv
         with open(edge_types_file_name, 'w') as csvfile:
             csvw = csv.writer(csvfile, delimiter=' ')
             csvw.writerow(cols)
-            for edge_type in matching_et:
-                csvw.writerow([edge_type.get(cname, 'NULL') if edge_type.get(cname, 'NULL') is not None else 'NULL'
-                               for cname in cols])
+            for row in rows:
+                csvw.writerow(row)
 
-    def _save_edges(self, edges_file_name, src_network, trg_network):
+    @staticmethod
+    def _merge_edge_types(edge_types_file_name, cols, rows):
+        """Merges new edge-type rows with the ones of an existing edge-types csv. An edge type already in the file is
+        kept as long as it has the same properties.
+        """
+        with open(edge_types_file_name, 'r') as csvfile:
+            csvr = csv.reader(csvfile, delimiter=' ')
+            old_cols = next(csvr)
+            old_rows = [dict(zip(old_cols, r)) for r in csvr]
+
+        merged_cols = old_cols + [c for c in cols if c not in old_cols]
+        merged_rows = [[r.get(c, 'NULL') for c in merged_cols] for r in old_rows]
+        old_types = {r['edge_type_id']: r for r in old_rows}
+        for row in rows:
+            edge_type = dict(zip(cols, (str(v) for v in row)))
+            old_type = old_types.get(edge_type['edge_type_id'], None)
+            if old_type is None:
+                merged_rows.append([edge_type.get(c, 'NULL') for c in merged_cols])
+            elif any(old_type.get(c, 'NULL') != edge_type.get(c, 'NULL') for c in merged_cols):
+                raise Exception('edge_type_id {} already exists in {} with different properties.'.format(
+                    edge_type['edge_type_id'], edge_types_file_name))
+
+        return merged_cols, merged_rows
+
+    def _save_edges(self, edges_file_name, src_network, trg_network, name=None, h5_options=None, append=False):
         raise NotImplementedError
 
-    def _save_gap_junctions(self, gj_file_name):
+    def _stream_edges(self, network_params, output_dir, name=None, max_memory=None, h5_options=None, append=False):
+        raise NotImplementedError
+
+    def _save_gap_junctions(self, gj_file_name, append=False):
         raise NotImplementedError
 
     def _initialize(self):
@@ -453,6 +717,20 @@ class Network (object):
     def _add_edges(self, edge_tuples, i):
         raise NotImplementedError
 
+    def _build_edge_table(self, connection_map, i):
+        """Builds and returns the (picklable) edges of a connection map without adding them to the network. Required
+        for building edges on multiple processes.
+        """
+        raise NotImplementedError
+
+    def _add_edge_table(self, connection_map, edge_table):
+        """Adds the edges created by _build_edge_table() to the network."""
+        raise NotImplementedError
+
+    def _edge_table_size(self, edge_table):
+        """Returns the number of edges and of synapses in a table created by _build_edge_table()."""
+        raise NotImplementedError
+
     def _clear(self):
         raise NotImplementedError
 
@@ -461,6 +739,45 @@ class Network (object):
         raise NotImplementedError
     """
 
+_BUILD_NETWORK = None  # network being built by the worker processes
+
+
+def _can_fork():
+    if os.name != 'posix':
+        return False
+
+    try:
+        _fork_context()
+        return True
+    except ValueError:
+        return False
+
+
+def _fork_context():
+    if hasattr(multiprocessing, 'get_context'):
+        return multiprocessing.get_context('fork')
+    else:
+        # python 2 always forks on posix
+        return multiprocessing
+
+
+def _seed_connection_map(seed, cm_index):
+    """Seeds the random number generators from the build seed and the index of the connection map."""
+    cm_seed = np.random.RandomState([seed, cm_index]).randint(2**31 - 1)
+    np.random.seed(cm_seed)
+    random.seed(cm_seed)
+
+
+def _build_edge_table_worker(task):
+    cm_index, seed = task
+    _seed_connection_map(seed, cm_index)
+    conn_map = _BUILD_NETWORK.get_connections()[cm_index]
+    conn_map.reseed_rules(cm_index)
+    start_time = time.time()
+    edge_table = _BUILD_NETWORK._build_edge_table(conn_map, cm_index)
+    return cm_index, edge_table, time.time() - start_time, current_rss(), peak_rss()
+
+
 """
 class ConnectionTable(object):
     def __init__(self):
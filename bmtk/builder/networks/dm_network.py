@@ -25,11 +25,14 @@ import numpy as np
 import h5py
 import six
 import csv
+from array import array
 
 from ..network import Network
-from bmtk.builder.node import Node
 from bmtk.builder.edge import Edge
+from bmtk.builder.node_pool import NodeColumns
+from bmtk.builder.node_set import ImportedNodeSet, ChainedNodes
 from bmtk.utils import sonata
+from bmtk.utils.sonata.utils import create_index, create_dataset
 
 
 class DenseNetwork(Network):
@@ -41,18 +44,19 @@ class DenseNetwork(Network):
 
         self.__networks = {}
         self.__node_count = 0
-        self._nodes = []
+        self._nodes = []  # built NodeSets, Node objects are only created when a node is accessed
 
         self.__edges_tables = []
         self._target_networks = {}
+        self._imported_nodes = []  # ImportedNodeSets, kept apart from the node-sets built by the network
 
     def _initialize(self):
         self.__id_map = []
         self.__lookup = []
 
     def _add_nodes(self, nodes):
-        self._nodes.extend(nodes)
-        self._nnodes = len(self._nodes)
+        self._nodes.append(nodes)
+        self._nnodes = sum(len(ns) for ns in self._nodes) + sum(len(ns) for ns in self._imported_nodes)
 
         """
         id_label = 'node_id' if 'node_id' in nodes[0].keys() else 'id'
@@ -68,7 +72,7 @@ class DenseNetwork(Network):
     def edges_table(self):
         return self.__edges_tables
 
-    def _save_nodes(self, nodes_file_name):
+    def _save_nodes(self, nodes_file_name, h5_options=None):
         if not self._nodes_built:
             self._build_nodes()
 
@@ -76,44 +80,51 @@ class DenseNetwork(Network):
         # TODO: how do we add attributes to the h5
         group_indx = 0
         groups_lookup = {}
-        group_indicies = {}
         group_props = {}
         for ns in self._node_sets:
             if ns.params_hash in groups_lookup:
                 continue
             else:
                 groups_lookup[ns.params_hash] = group_indx
-                group_indicies[group_indx] = 0
                 group_props[group_indx] = {k: [] for k in ns.params_keys if k != 'node_id'}
                 group_indx += 1
 
-        node_gid_table = np.zeros(self._nnodes)  # todo: set dtypes
-        node_type_id_table = np.zeros(self._nnodes)
-        node_group_table = np.zeros(self._nnodes)
-        node_group_index_tables = np.zeros(self._nnodes)
-
-        for i, node in enumerate(self.nodes()):
-            node_gid_table[i] = node.node_id
-            node_type_id_table[i] = node.node_type_id
-            group_id = groups_lookup[node.params_hash]
-            node_group_table[i] = group_id
-            node_group_index_tables[i] = group_indicies[group_id]
-            group_indicies[group_id] += 1
-
-            group_dict = group_props[group_id]
-            for key, prop_ds in group_dict.items():
-                prop_ds.append(node.params[key])
+        # Node-sets already store their params as columns, so the node tables are built one node-set at a time
+        node_gid_table = []
+        node_type_id_table = []
+        node_group_table = []
+        node_group_index_tables = []
+        group_sizes = {grp_id: 0 for grp_id in group_props.keys()}
+        for ns in self._node_sets:
+            group_id = groups_lookup[ns.params_hash]
+            node_gid_table.append(ns.node_ids)
+            node_type_id_table.append(np.full(ns.N, ns.node_type_id, dtype=np.uint64))
+            node_group_table.append(np.full(ns.N, group_id, dtype=np.uint32))
+            node_group_index_tables.append(np.arange(ns.N, dtype=np.uint64) + group_sizes[group_id])
+            group_sizes[group_id] += ns.N
+
+            for key, prop_ds in group_props[group_id].items():
+                prop_ds.append(np.asarray(ns.params_column(key)))
+
+        node_gid_table = np.concatenate(node_gid_table) if node_gid_table else np.zeros(0)
+        node_type_id_table = np.concatenate(node_type_id_table) if node_type_id_table else np.zeros(0)
+        node_group_table = np.concatenate(node_group_table) if node_group_table else np.zeros(0)
+        node_group_index_tables = np.concatenate(node_group_index_tables) if node_group_index_tables else np.zeros(0)
+        for props in group_props.values():
+            for key, prop_ds in props.items():
+                props[key] = np.concatenate(prop_ds)
 
         # TODO: open in append mode
         with h5py.File(nodes_file_name, 'w') as hf:
             # Add magic and version attribute
             add_hdf5_attrs(hf)
 
+            h5_options = h5_options or {}
             pop_grp = hf.create_group('/nodes/{}'.format(self.name))
-            pop_grp.create_dataset('node_id', data=node_gid_table, dtype='uint64')
-            pop_grp.create_dataset('node_type_id', data=node_type_id_table, dtype='uint64')
-            pop_grp.create_dataset('node_group_id', data=node_group_table, dtype='uint32')
-            pop_grp.create_dataset('node_group_index', data=node_group_index_tables, dtype='uint64')
+            create_dataset(pop_grp, 'node_id', data=node_gid_table, dtype='uint64', **h5_options)
+            create_dataset(pop_grp, 'node_type_id', data=node_type_id_table, dtype='uint64', **h5_options)
+            create_dataset(pop_grp, 'node_group_id', data=node_group_table, dtype='uint32', **h5_options)
+            create_dataset(pop_grp, 'node_group_index', data=node_group_index_tables, dtype='uint64', **h5_options)
 
             for grp_id, props in group_props.items():
                 model_grp = pop_grp.create_group('{}'.format(grp_id))
@@ -121,16 +132,17 @@ class DenseNetwork(Network):
                 for key, dataset in props.items():
                     # ds_path = 'nodes/{}/{}'.format(grp_id, key)
                     try:
-                        model_grp.create_dataset(key, data=dataset)
+                        create_dataset(model_grp, key, data=dataset, **h5_options)
                     except TypeError:
                         str_list = [str(d) for d in dataset]
                         hf.create_dataset(key, data=str_list)
 
     def nodes_iter(self, node_ids=None):
+        nodes = ChainedNodes(self._nodes + self._imported_nodes)
         if node_ids is not None:
-            return [n for n in self._nodes if n.node_id in node_ids]
+            return [n for n in nodes if n.node_id in node_ids]
         else:
-            return self._nodes
+            return nodes
 
     def _process_nodepool(self, nodepool):
         return nodepool
@@ -158,22 +170,39 @@ class DenseNetwork(Network):
         for node_type_props in node_pop.node_types_table:
             self._add_node_type(node_type_props)
 
-        for node in node_pop:
-            self._node_id_gen.remove_id(node.node_id)
-            self._nodes.append(Node(node.node_id, node.group_props, node.node_type_properties))
+        # Keep the nodes as columns, Node objects are only created if a node is accessed
+        imported_nodes = ImportedNodeSet(node_pop)
+        self._node_id_gen.remove_ids(imported_nodes.node_ids)
+        self._imported_nodes.append(imported_nodes)
+        self._reset_nodes_columns()
 
     def _add_edges(self, connection_map, i):
-        syn_table = self.EdgeTable(connection_map)
-        connections = connection_map.connection_itr()
-        for con in connections:
-            if con[2] is not None:
-                syn_table[con[0], con[1]] = con[2]
+        self._add_edge_table(connection_map, self._cached_edge_table(connection_map, i))
 
+    def _add_edge_table(self, connection_map, edge_table):
         target_net = connection_map.target_nodes
         self._target_networks[target_net.network_name] = target_net.network
+        self._nedges += edge_table['nsyns']
+        self.__edges_tables.append(edge_table)
+
+    def _edge_table_size(self, edge_table):
+        return edge_table['syn_table'].nedges, edge_table['nsyns']
+
+    def _build_edge_table(self, connection_map, i):
+        syn_table = self.EdgeTable(connection_map)
+        if connection_map.vectorized:
+            for src_ids, trg_ids, nsyns in connection_map.connection_blocks():
+                syn_table.add_block(src_ids, trg_ids, nsyns)
+        else:
+            connections = connection_map.connection_itr()
+            for con in connections:
+                if con[2] is not None:
+                    syn_table[con[0], con[1]] = con[2]
 
-        nsyns = np.sum(syn_table.nsyn_table)
-        self._nedges += int(nsyns)
+        if connection_map.symmetric:
+            syn_table.remove_reversed_pairs()
+
+        nsyns = syn_table.nsyns
         edge_table = {'syn_table': syn_table,
                       'nsyns': nsyns,
                       'edge_types': connection_map.edge_type_properties,
@@ -185,229 +214,165 @@ class DenseNetwork(Network):
                       'source_query': connection_map.source_nodes.filter_str,
                       'target_query': connection_map.target_nodes.filter_str}
 
+        if connection_map.params:
+            # Only visit the pairs that have synapses. Edges are ordered by source then target so that the rules are
+            # called in the same order as when iterating over every source/target pair.
+            source_nodes = list(connection_map.source_nodes)
+            target_nodes = list(connection_map.target_nodes)
+            src_idxs, trg_idxs, nsyns_list = syn_table.indexed_edges(by_source=True)
 
         for param in connection_map.params:
             rule = param.rule
             param_names = param.names
             edge_table['params_dtypes'].update(param.dtypes)
-            if isinstance(param_names, list) or isinstance(param_names, tuple):
+            if param.vectorized:
+                for name, pt in self._vectorized_properties(param, syn_table, source_nodes, target_nodes).items():
+                    edge_table['params'][name] = pt
+
+            elif isinstance(param_names, list) or isinstance(param_names, tuple):
                 tmp_tables = [self.PropertyTable(nsyns) for _ in range(len(param_names))]
-                for source in connection_map.source_nodes:
-                    src_node_id = source.node_id
-                    for target in connection_map.target_nodes:
-                        trg_node_id = target.node_id  # TODO: pull this out and put in it's own list
-                        for _ in range(syn_table[src_node_id, trg_node_id]):
-                            pvals = rule(source, target)
-                            for i in range(len(param_names)):
-                                tmp_tables[i][src_node_id, trg_node_id] = pvals[i]
+                for src_idx, trg_idx, n_syns in zip(src_idxs, trg_idxs, nsyns_list):
+                    source = source_nodes[src_idx]
+                    target = target_nodes[trg_idx]
+                    for _ in range(n_syns):
+                        pvals = rule(source, target)
+                        for i in range(len(param_names)):
+                            tmp_tables[i][source.node_id, target.node_id] = pvals[i]
 
                 for i, name in enumerate(param_names):
                     # TODO: I think a copy constructor might get called, move this out.
                     edge_table['params'][name] = tmp_tables[i]
 
             else:
-                pt = self.PropertyTable(np.sum(nsyns))
-                for source in connection_map.source_nodes:
-                    src_node_id = source.node_id
-                    for target in connection_map.target_nodes:
-                        trg_node_id = target.node_id  # TODO: pull this out and put in it's own list
-                        #print('{}, {}: {}'.format(src_node_id, trg_node_id, edge_table[src_node_id, trg_node_id]))
-                        for _ in range(syn_table[src_node_id, trg_node_id]):
-                            pt[src_node_id, trg_node_id] = rule(source, target)
+                pt = self.PropertyTable(nsyns)
+                for src_idx, trg_idx, n_syns in zip(src_idxs, trg_idxs, nsyns_list):
+                    source = source_nodes[src_idx]
+                    target = target_nodes[trg_idx]
+                    for _ in range(n_syns):
+                        pt[source.node_id, target.node_id] = rule(source, target)
                 edge_table['params'][param_names] = pt
 
-        self.__edges_tables.append(edge_table)
-
+        return edge_table
 
-    def _save_gap_junctions(self, gj_file_name):
+    def _vectorized_properties(self, param, syn_table, source_nodes, target_nodes):
+        """Calls a vectorized property rule once for all the synapses in syn_table, returns a PropertyTable for every
+        property name.
+        """
+        src_idxs, trg_idxs, nsyns = syn_table.indexed_edges()
+        src_idxs = np.repeat(src_idxs, nsyns)
+        trg_idxs = np.repeat(trg_idxs, nsyns)
+        n_syns = len(src_idxs)
+        source_cols = NodeColumns(source_nodes).take(src_idxs)
+        target_cols = NodeColumns(target_nodes).take(trg_idxs)
+
+        param_names = param.names
+        pvals = param.rule(source_cols, target_cols)
+        if isinstance(param_names, (list, tuple)):
+            if isinstance(pvals, np.ndarray) and pvals.ndim == 2 and pvals.shape == (n_syns, len(param_names)):
+                pvals = pvals.T
+            if len(pvals) != len(param_names):
+                raise Exception('Rule for properties {} returned {} values.'.format(param_names, len(pvals)))
+        else:
+            param_names = [param_names]
+            pvals = [pvals]
+
+        src_ids = syn_table.source_ids[src_idxs]
+        trg_ids = syn_table.target_ids[trg_idxs]
+        prop_tables = {}
+        for name, vals in zip(param_names, pvals):
+            vals = np.asarray(vals)
+            if vals.ndim == 0:
+                vals = np.full(n_syns, vals)
+            elif len(vals) != n_syns:
+                raise Exception('Rule for property {} returned {} values, expected {}.'.format(name, len(vals), n_syns))
+
+            pt = self.PropertyTable(n_syns)
+            pt.set_values(src_ids, trg_ids, vals)
+            prop_tables[name] = pt
+
+        return prop_tables
+
+    def _save_gap_junctions(self, gj_file_name, append=False):
         source_ids = []
         target_ids = []
-        src_gap_ids = []
-        trg_gap_ids = []
-
         for et in self.__edges_tables:
-            try:
-                is_gap = et['edge_types']['is_gap_junction']
-            except:
+            if not et['edge_types'].get('is_gap_junction', False):
                 continue
-            if is_gap:
-                if et['source_network'] != et['target_network']:
-                    raise Exception("All gap junctions must be two cells in the same network builder.")
-                
-                table = et['syn_table']
-                junc_table = table.nsyn_table
-                locs = np.where(junc_table > 0)
-                for i in range(len(locs[0])):
-                    source_ids.append(table.source_ids[locs[0][i]])
-                    target_ids.append(table.target_ids[locs[1][i]])
-                    src_gap_ids.append(self._gj_id_gen.next())
-                    trg_gap_ids.append(self._gj_id_gen.next())
-            else:
-                continue
-        
-        if len(source_ids) > 0:
-            with h5py.File(gj_file_name, 'w') as f:
-                add_hdf5_attrs(f)
-                f.create_dataset('source_ids', data=np.array(source_ids))
-                f.create_dataset('target_ids', data=np.array(target_ids))
-                f.create_dataset('src_gap_ids', data=np.array(src_gap_ids))
-                f.create_dataset('trg_gap_ids', data=np.array(trg_gap_ids))
 
+            if et['source_network'] != et['target_network']:
+                raise Exception("All gap junctions must be two cells in the same network builder.")
+
+            src_ids, trg_ids, _ = et['syn_table'].edges(by_source=True)
+            source_ids.append(src_ids)
+            target_ids.append(trg_ids)
+
+        n_gap_juncs = sum(len(src_ids) for src_ids in source_ids)
+        if n_gap_juncs > 0:
+            # Every gap junction gets two consecutive ids, one for the source and one for the target side
+            gap_ids = self._gj_id_gen.next_ids(2*n_gap_juncs)
+            gap_juncs = {'source_ids': np.concatenate(source_ids).astype(np.int64),
+                         'target_ids': np.concatenate(target_ids).astype(np.int64),
+                         'src_gap_ids': gap_ids[0::2],
+                         'trg_gap_ids': gap_ids[1::2]}
+            if append and os.path.exists(gj_file_name):
+                with h5py.File(gj_file_name, 'r') as f:
+                    gap_juncs = {k: np.concatenate((f[k][()], v)) for k, v in gap_juncs.items()}
 
-    def _save_edges(self, edges_file_name, src_network, trg_network, name=None):
-        groups = {}
-        group_dtypes = {}  # TODO: this should be stored in PropertyTable
-        grp_id_itr = 0
-        groups_lookup = {}
-        total_syns = 0
+            with h5py.File(gj_file_name, 'w') as f:
+                add_hdf5_attrs(f)
+                for ds_name in ['source_ids', 'target_ids', 'src_gap_ids', 'trg_gap_ids']:
+                    f.create_dataset(ds_name, data=gap_juncs[ds_name])
 
+    def _save_edges(self, edges_file_name, src_network, trg_network, name=None, h5_options=None, append=False):
         matching_edge_tables = [et for et in self.__edges_tables
                                 if et['source_network'] == src_network and et['target_network'] == trg_network]
 
-        for ets in matching_edge_tables:
-            params_hash = str(ets['params'].keys())
-            group_id = groups_lookup.get(params_hash, None)
-            if group_id is None:
-                group_id = grp_id_itr
-                groups_lookup[params_hash] = group_id
-                grp_id_itr += 1
-
-            ets['group_id'] = group_id
-            groups[group_id] = {}
-            group_dtypes[group_id] = ets['params_dtypes']
-            for param_name in ets['params'].keys():
-                groups[group_id][param_name] = []
-
-            total_syns += int(ets['nsyns'])
-
-        group_index_itrs = [0 for _ in range(grp_id_itr)]
-        trg_gids = np.zeros(total_syns)  # set dtype to uint64
-        src_gids = np.zeros(total_syns)
-        edge_groups = np.zeros(total_syns)  # dtype uint16 or uint8
-        edge_group_index = np.zeros(total_syns)  # uint32
-        edge_type_ids = np.zeros(total_syns)  # uint32
-
-        # TODO: Another potential issue if node-ids don't start with 0
-        index_ptrs = np.zeros(len(self._target_networks[trg_network].nodes()) + 1)
-        #index_ptrs = np.zeros(len(self._nodes)+1)  # TODO: issue when target nodes come from another network
-        index_ptr_itr = 0
-
-        gid_indx = 0
-        for trg_node in self._target_networks[trg_network].nodes():
-            index_ptrs[index_ptr_itr] = gid_indx
-            index_ptr_itr += 1
+        writer = self._open_edges_writer(edges_file_name, src_network, trg_network,
+                                         self._target_networks[trg_network], name, h5_options=h5_options,
+                                         append=append)
+        for edge_table in matching_edge_tables:
+            writer.add_table(edge_table)
+        self._close_edges_writer(writer)
+
+    def _stream_edges(self, network_params, output_dir, name=None, max_memory=None, h5_options=None, append=False):
+        # Only gap junctions are kept in memory, every other edge table is dropped once it has been written.
+        edges_files = {(p[0], p[1]): os.path.join(output_dir, p[2]) for p in network_params if p[2] is not None}
+        writers = {}
+        for i, connection_map in enumerate(self._connection_maps):
+            net_key = (connection_map.source_network_name, connection_map.target_network_name)
+            is_gap = connection_map.edge_type_properties.get('is_gap_junction', False)
+            if net_key not in edges_files and not is_gap:
+                continue
 
-            for ets in matching_edge_tables:
-                edge_group_id = ets['group_id']
-                group_table = groups[edge_group_id]
+            edge_table = self._cached_edge_table(connection_map, i)
+            if is_gap:
+                self._add_edge_table(connection_map, edge_table)
 
-                syn_table = ets['syn_table']
-                if syn_table.has_target(trg_node.node_id):
-                    if ets['params']:
-                        for src_id, nsyns in syn_table.trg_itr(trg_node.node_id):
-                            # Add on to the edges index
-                            indx_end = gid_indx+nsyns
-                            while gid_indx < indx_end:
-                                trg_gids[gid_indx] = trg_node.node_id
-                                src_gids[gid_indx] = src_id
-                                edge_type_ids[gid_indx] = ets['edge_type_id']
-                                edge_groups[gid_indx] = edge_group_id
-                                edge_group_index[gid_indx] = group_index_itrs[edge_group_id]
-                                group_index_itrs[edge_group_id] += 1
-                                gid_indx += 1
+            if net_key in edges_files:
+                if net_key not in writers:
+                    writers[net_key] = self._open_edges_writer(edges_files[net_key], net_key[0], net_key[1],
+                                                               connection_map.target_nodes.network, name, max_memory,
+                                                               h5_options, append)
+                writers[net_key].add_table(edge_table)
 
-                            for param_name, param_table in ets['params'].items():
-                                param_vals = group_table[param_name]
-                                for val in param_table.itr_vals(src_id, trg_node.node_id):
-                                    param_vals.append(val)
-
-                    else:
-                        # If no properties just print nsyns table.
-                        if 'nsyns' not in group_table:
-                            group_table['nsyns'] = []
-                        group_dtypes[edge_group_id]['nsyns'] = 'uint16'
-                        for src_id, nsyns in syn_table.trg_itr(trg_node.node_id):
-                            trg_gids[gid_indx] = trg_node.node_id
-                            src_gids[gid_indx] = src_id
-                            edge_type_ids[gid_indx] = ets['edge_type_id']
-                            edge_groups[gid_indx] = edge_group_id
-                            edge_group_index[gid_indx] = group_index_itrs[edge_group_id]
-                            # group_dtypes
-                            group_index_itrs[edge_group_id] += 1
-                            gid_indx += 1
-
-                            group_table['nsyns'].append(nsyns)
-
-        trg_gids = trg_gids[:gid_indx]
-        src_gids = src_gids[:gid_indx]
-        edge_groups = edge_groups[:gid_indx]
-        edge_group_index = edge_group_index[:gid_indx]
-        edge_type_ids = edge_type_ids[:gid_indx]
+        for writer in writers.values():
+            self._close_edges_writer(writer)
 
+    def _open_edges_writer(self, edges_file_name, src_network, trg_network, trg_net, name=None, max_memory=None,
+                           h5_options=None, append=False):
         pop_name = '{}_to_{}'.format(src_network, trg_network) if name is None else name
-
-        index_ptrs[index_ptr_itr] = gid_indx
-        with h5py.File(edges_file_name, 'w') as hf:
-            add_hdf5_attrs(hf)
-            pop_grp = hf.create_group('/edges/{}'.format(pop_name))
-            pop_grp.create_dataset('target_node_id', data=trg_gids, dtype='uint64')
-            pop_grp['target_node_id'].attrs['node_population'] = trg_network
-            pop_grp.create_dataset('source_node_id', data=src_gids, dtype='uint64')
-            pop_grp['source_node_id'].attrs['node_population'] = src_network
-
-            pop_grp.create_dataset('edge_group_id', data=edge_groups, dtype='uint16')
-            pop_grp.create_dataset('edge_group_index', data=edge_group_index, dtype='uint32')
-            pop_grp.create_dataset('edge_type_id', data=edge_type_ids, dtype='uint32')
-            # pop_grp.create_dataset('edges/index_pointer', data=index_ptrs, dtype='uint32')
-
-            for group_id, params_dict in groups.items():
-                model_grp = pop_grp.create_group(str(group_id))
-                for params_key, params_vals in params_dict.items():
-                    #group_path = 'edges/{}/{}'.format(group_id, params_key)
-                    dtype = group_dtypes[group_id][params_key]
-                    if dtype is not None:
-                        model_grp.create_dataset(params_key, data=list(params_vals), dtype=dtype)
-                    else:
-                        model_grp.create_dataset(params_key, data=list(params_vals))
-
-            self._create_index(pop_grp['target_node_id'], pop_grp, index_type='target')
-            self._create_index(pop_grp['source_node_id'], pop_grp, index_type='source')
-
-    def _create_index(self, node_ids_ds, output_grp, index_type='target'):
-        if index_type == 'target':
-            edge_nodes = np.array(node_ids_ds, dtype=np.int64)
-            output_grp = output_grp.create_group('indicies/target_to_source')
-        elif index_type == 'source':
-            edge_nodes = np.array(node_ids_ds, dtype=np.int64)
-            output_grp = output_grp.create_group('indicies/source_to_target')
-
-        edge_nodes = np.append(edge_nodes, [-1])
-        n_targets = np.max(edge_nodes)
-        ranges_list = [[] for _ in six.moves.range(n_targets + 1)]
-
-        n_ranges = 0
-        begin_index = 0
-        cur_trg = edge_nodes[begin_index]
-        for end_index, trg_gid in enumerate(edge_nodes):
-            if cur_trg != trg_gid:
-                ranges_list[cur_trg].append((begin_index, end_index))
-                cur_trg = int(trg_gid)
-                begin_index = end_index
-                n_ranges += 1
-
-        node_id_to_range = np.zeros((n_targets + 1, 2))
-        range_to_edge_id = np.zeros((n_ranges, 2))
-        range_index = 0
-        for node_index, trg_ranges in enumerate(ranges_list):
-            if len(trg_ranges) > 0:
-                node_id_to_range[node_index, 0] = range_index
-                for r in trg_ranges:
-                    range_to_edge_id[range_index, :] = r
-                    range_index += 1
-                node_id_to_range[node_index, 1] = range_index
-
-        output_grp.create_dataset('range_to_edge_id', data=range_to_edge_id, dtype='uint64')
-        output_grp.create_dataset('node_id_to_range', data=node_id_to_range, dtype='uint64')
+        trg_node_ids = [n.node_id for n in trg_net.nodes()]
+        return self.EdgesWriter(edges_file_name, pop_name, src_network, trg_network, trg_node_ids, max_memory,
+                                h5_options, append)
+
+    def _close_edges_writer(self, writer):
+        writer.flush()
+        if 'indicies' in writer.pop_grp:
+            # appended to an existing population, the old indices don't cover the new edges
+            del writer.pop_grp['indicies']
+        create_index(writer.pop_grp['target_node_id'], writer.pop_grp, index_type='target')
+        create_index(writer.pop_grp['source_node_id'], writer.pop_grp, index_type='source')
+        writer.close()
 
     def _clear(self):
         self._nedges = 0
@@ -449,34 +414,159 @@ class DenseNetwork(Network):
         return self._nedges
 
     class EdgeTable(object):
+        """Sparse table of the number of synapses between the source and target nodes of a ConnectionMap.
+
+        Connections are appended in coordinate (COO) format and only pairs with a non-zero number of synapses are
+        stored, so memory grows with the number of edges rather than with sources x targets. Before being read the
+        table is compressed into a target-major (CSC) layout so that all the sources of a given target are contiguous
+        and ordered the same way as the source node-pool.
+        """
         def __init__(self, connection_map):
-            # TODO: save column and row lengths
             # Create maps between source_node gids and their row in the matrix.
-            self.__idx2src = [n.node_id for n in connection_map.source_nodes]
+            self.__idx2src = np.array(connection_map.source_nodes.columns().node_ids, dtype=np.int64)
             self.__src2idx = {node_id: i for i, node_id in enumerate(self.__idx2src)}
 
             # Create maps betwee target_node gids and their column in the matrix
-            self.__idx2trg = [n.node_id for n in connection_map.target_nodes]
+            self.__idx2trg = np.array(connection_map.target_nodes.columns().node_ids, dtype=np.int64)
             self.__trg2idx = {node_id: i for i, node_id in enumerate(self.__idx2trg)}
+            self.__src_sorter = None
+            self.__trg_sorter = None
 
-            self._nsyn_table = np.zeros((len(self.__idx2src), len(self.__idx2trg)), dtype=np.uint8)
+            # Uncompressed (src_idx, trg_idx, nsyns) entries, appended as connections are made
+            self._src_buffer = array('l')
+            self._trg_buffer = array('l')
+            self._nsyns_buffer = array('l')
+            self._blocks = []
+
+            # Compressed entries sorted by (trg_idx, src_idx), _trg_ptr[i]:_trg_ptr[i+1] are the entries of target i
+            self._src_idx = np.zeros(0, dtype=np.int64)
+            self._trg_idx = np.zeros(0, dtype=np.int64)
+            self._nsyns = np.zeros(0, dtype=np.uint32)
+            self._trg_ptr = np.zeros(len(self.__idx2trg) + 1, dtype=np.int64)
 
         def __getitem__(self, item):
-            # TODO: make sure matrix is column oriented, or swithc trg and srcs.
-            indexed_pair = (self.__src2idx[item[0]], self.__trg2idx[item[1]])
-            return self._nsyn_table[indexed_pair]
+            self._compress()
+            src_i = self.__src2idx[item[0]]
+            trg_i = self.__trg2idx[item[1]]
+            beg, end = self._trg_ptr[trg_i], self._trg_ptr[trg_i + 1]
+            indx = beg + np.searchsorted(self._src_idx[beg:end], src_i)
+            if indx < end and self._src_idx[indx] == src_i:
+                return self._nsyns[indx]
+            return 0
 
         def __setitem__(self, key, value):
             assert(len(key) == 2)
-            indexed_pair = (self.__src2idx[key[0]], self.__trg2idx[key[1]])
-            self._nsyn_table[indexed_pair] = value
+            self._src_buffer.append(self.__src2idx[key[0]])
+            self._trg_buffer.append(self.__trg2idx[key[1]])
+            self._nsyns_buffer.append(int(value))
+
+        def add_block(self, src_ids, trg_ids, nsyns):
+            """Adds arrays of connections at once.
+
+            :param src_ids: array of source node_ids
+            :param trg_ids: array of target node_ids, same size as src_ids
+            :param nsyns: array with the number of synapses for every src_ids[i] --> trg_ids[i] pair
+            """
+            if self.__src_sorter is None:
+                self.__src_sorter = np.argsort(self.__idx2src, kind='stable')
+                self.__trg_sorter = np.argsort(self.__idx2trg, kind='stable')
+
+            src_ids = np.asarray(src_ids, dtype=np.int64)
+            trg_ids = np.asarray(trg_ids, dtype=np.int64)
+            nsyns = np.asarray(nsyns)
+            assert(len(src_ids) == len(trg_ids) == len(nsyns))
+            if len(src_ids) == 0:
+                return
+
+            src_idx = np.searchsorted(self.__idx2src, src_ids, sorter=self.__src_sorter)
+            src_idx = self.__src_sorter[np.minimum(src_idx, len(self.__idx2src) - 1)]
+            trg_idx = np.searchsorted(self.__idx2trg, trg_ids, sorter=self.__trg_sorter)
+            trg_idx = self.__trg_sorter[np.minimum(trg_idx, len(self.__idx2trg) - 1)]
+            if not (np.all(self.__idx2src[src_idx] == src_ids) and np.all(self.__idx2trg[trg_idx] == trg_ids)):
+                raise KeyError('Connections contain nodes that are not part of the source/target node-pools.')
+
+            self._flush_buffers()
+            self._blocks.append((src_idx, trg_idx, nsyns.astype(np.int64)))
+
+        def _flush_buffers(self):
+            if len(self._nsyns_buffer) > 0:
+                self._blocks.append((np.frombuffer(self._src_buffer, dtype='l'),
+                                     np.frombuffer(self._trg_buffer, dtype='l'),
+                                     np.frombuffer(self._nsyns_buffer, dtype='l')))
+                self._src_buffer = array('l')
+                self._trg_buffer = array('l')
+                self._nsyns_buffer = array('l')
+
+        def _compress(self):
+            """Merges any newly added connections into the sorted, target-major arrays."""
+            self._flush_buffers()
+            if len(self._blocks) == 0:
+                return
+
+            src_idx = np.concatenate([self._src_idx] + [b[0] for b in self._blocks])
+            trg_idx = np.concatenate([self._trg_idx] + [b[1] for b in self._blocks])
+            nsyns = np.concatenate([self._nsyns] + [b[2] for b in self._blocks])
+            self._blocks = []
+
+            # Sort by target then source. The sort is stable so if a pair has been set more than once the last value
+            # comes last and will overwrite the previous ones, like it would for a dense matrix.
+            order = np.lexsort((src_idx, trg_idx))
+            src_idx, trg_idx, nsyns = src_idx[order], trg_idx[order], nsyns[order]
+            keep = np.ones(len(order), dtype=bool)
+            keep[:-1] = (src_idx[:-1] != src_idx[1:]) | (trg_idx[:-1] != trg_idx[1:])
+            keep &= nsyns > 0
+
+            self._src_idx = src_idx[keep].astype(np.int64)
+            self._trg_idx = trg_idx[keep].astype(np.int64)
+            self._nsyns = nsyns[keep].astype(np.uint32)
+            self._trg_ptr = np.zeros(len(self.__idx2trg) + 1, dtype=np.int64)
+            self._trg_ptr[1:] = np.cumsum(np.bincount(self._trg_idx, minlength=len(self.__idx2trg)))
+
+        def remove_reversed_pairs(self):
+            """Removes the connections from a to b when there is also a connection from b to a and a > b, as well as
+            the connections of a node to itself.
+            """
+            self._compress()
+            src_ids = self.__idx2src[self._src_idx]
+            trg_ids = self.__idx2trg[self._trg_idx]
+            if len(src_ids) == 0:
+                return
+
+            # encode (source, target) pairs as single keys to look for the reversed pairs
+            n_ids = int(max(src_ids.max(), trg_ids.max())) + 1
+            pair_keys = np.sort(src_ids*n_ids + trg_ids)
+            reversed_keys = trg_ids*n_ids + src_ids
+            key_idx = np.minimum(np.searchsorted(pair_keys, reversed_keys), len(pair_keys) - 1)
+            has_reversed = pair_keys[key_idx] == reversed_keys
+
+            keep = ~((has_reversed & (src_ids > trg_ids)) | (src_ids == trg_ids))
+            self._src_idx = self._src_idx[keep]
+            self._trg_idx = self._trg_idx[keep]
+            self._nsyns = self._nsyns[keep]
+            self._trg_ptr = np.zeros(len(self.__idx2trg) + 1, dtype=np.int64)
+            self._trg_ptr[1:] = np.cumsum(np.bincount(self._trg_idx, minlength=len(self.__idx2trg)))
 
         def has_target(self, node_id):
             return node_id in self.__trg2idx
 
         @property
-        def nsyn_table(self):
-            return self._nsyn_table
+        def nbytes(self):
+            """Approximate memory used by the table."""
+            self._compress()
+            return sum(a.nbytes for a in [self.__idx2src, self.__idx2trg, self._src_idx, self._trg_idx, self._nsyns,
+                                          self._trg_ptr])
+
+        @property
+        def nedges(self):
+            """Number of source/target pairs with at least one synapse."""
+            self._compress()
+            return len(self._nsyns)
+
+        @property
+        def nsyns(self):
+            """Total number of synapses in the table."""
+            self._compress()
+            return int(np.sum(self._nsyns))
 
         @property
         def target_ids(self):
@@ -486,36 +576,336 @@ class DenseNetwork(Network):
         def source_ids(self):
             return self.__idx2src
 
+        def indexed_edges(self, by_source=False):
+            """Returns the (source index, target index, nsyns) arrays of all non-zero connections. Indices refer to the
+            position in the source/target node-pools. Edges are sorted by target then source, or by source then target
+            if by_source is True.
+            """
+            self._compress()
+            if by_source:
+                order = np.lexsort((self._trg_idx, self._src_idx))
+                return self._src_idx[order], self._trg_idx[order], self._nsyns[order]
+            return self._src_idx, self._trg_idx, self._nsyns
+
+        def edges(self, by_source=False):
+            """Same as indexed_edges() but returns the source and target node_ids."""
+            src_idx, trg_idx, nsyns = self.indexed_edges(by_source)
+            return self.__idx2src[src_idx], self.__idx2trg[trg_idx], nsyns
+
         def trg_itr(self, trg_id):
+            self._compress()
             trg_i = self.__trg2idx[trg_id]
-            for src_j, src_id in enumerate(self.__idx2src):
-                nsyns = self._nsyn_table[src_j, trg_i]
-                if nsyns:
-                    yield src_id, nsyns
+            for indx in six.moves.range(self._trg_ptr[trg_i], self._trg_ptr[trg_i + 1]):
+                yield self.__idx2src[self._src_idx[indx]], self._nsyns[indx]
 
     class PropertyTable(object):
+        """Stores the values of a synaptic property for every synapse of a connection map.
+
+        Values are added one synapse at a time along with their (source, target) node ids. Before the first lookup the
+        values are sorted by (target, source), keeping the order in which the synapses of a pair were added, so that
+        finding the values of a pair is a binary search instead of a scan of the whole table.
+        """
         # TODO: add support for strings
         def __init__(self, nvalues):
             self._prop_array = np.zeros(nvalues)
             # self._prop_table = np.zeros((nvalues, 1))  # TODO: set dtype
-            self._index = np.zeros((nvalues, 2), dtype=np.uint32)
+            self._index = np.zeros((nvalues, 2), dtype=np.int64)
             self._itr_index = 0
 
+            self._index_built = False
+            self._sorted_vals = None  # property values sorted by (target, source)
+            self._sorted_keys = None  # (target, source) pairs encoded as a single sorted key
+            self._src_ids = None  # unique source ids, for encoding the keys
+            self._trg_ids = None  # unique target ids
+
+        def _build_index(self):
+            if self._index_built:
+                return
+
+            src_ids = self._index[:self._itr_index, 0]
+            trg_ids = self._index[:self._itr_index, 1]
+            order = np.lexsort((src_ids, trg_ids))
+            self._sorted_vals = self._prop_array[:self._itr_index][order]
+            self._src_ids, src_ranks = np.unique(src_ids[order], return_inverse=True)
+            self._trg_ids, trg_ranks = np.unique(trg_ids[order], return_inverse=True)
+            self._sorted_keys = trg_ranks.astype(np.int64)*len(self._src_ids) + src_ranks
+            self._index_built = True
+
+        def _find(self, src_ids, trg_ids):
+            """Returns the begin and end positions, in the sorted values, of every (src_ids[i], trg_ids[i]) pair."""
+            self._build_index()
+            src_ids = np.atleast_1d(np.asarray(src_ids, dtype=np.int64))
+            trg_ids = np.atleast_1d(np.asarray(trg_ids, dtype=np.int64))
+            if len(self._sorted_keys) == 0:
+                return np.zeros(len(src_ids), dtype=np.int64), np.zeros(len(src_ids), dtype=np.int64)
+
+            src_ranks = np.minimum(np.searchsorted(self._src_ids, src_ids), len(self._src_ids) - 1)
+            trg_ranks = np.minimum(np.searchsorted(self._trg_ids, trg_ids), len(self._trg_ids) - 1)
+            keys = trg_ranks*len(self._src_ids) + src_ranks
+            beg = np.searchsorted(self._sorted_keys, keys, side='left')
+            end = np.searchsorted(self._sorted_keys, keys, side='right')
+            missing = (self._src_ids[src_ranks] != src_ids) | (self._trg_ids[trg_ranks] != trg_ids)
+            end[missing] = beg[missing]
+            return beg, end
+
+        @property
+        def nbytes(self):
+            """Approximate memory used by the table."""
+            nbytes = self._prop_array.nbytes + self._index.nbytes
+            if self._index_built:
+                nbytes += self._sorted_vals.nbytes + self._sorted_keys.nbytes
+            return nbytes
+
         def itr_vals(self, src_id, trg_id):
-            indicies = np.where((self._index[:, 0] == src_id) & (self._index[:, 1] == trg_id))
-            for val in self._prop_array[indicies]:
+            beg, end = self._find(src_id, trg_id)
+            for val in self._sorted_vals[beg[0]:end[0]]:
                 yield val
 
+        def get_values(self, src_ids, trg_ids):
+            """Returns the values of all the synapses of the given (source, target) pairs, concatenated in the same
+            order as the pairs.
+            """
+            beg, end = self._find(src_ids, trg_ids)
+            counts = end - beg
+            offsets = np.arange(np.sum(counts)) - np.repeat(np.cumsum(counts) - counts, counts)
+            return self._sorted_vals[np.repeat(beg, counts) + offsets]
+
+        def set_values(self, src_ids, trg_ids, values):
+            """Adds the values of many synapses at once."""
+            n_vals = len(values)
+            beg, end = self._itr_index, self._itr_index + n_vals
+            if beg == 0 and n_vals == len(self._prop_array):
+                # Keep the dtype of the values, allows for non-numeric properties
+                self._prop_array = np.array(values)
+            else:
+                self._prop_array[beg:end] = values
+            self._index[beg:end, 0] = src_ids
+            self._index[beg:end, 1] = trg_ids
+            self._itr_index = end
+            self._index_built = False
+
         def __setitem__(self, key, value):
             self._index[self._itr_index, 0] = key[0]  # src_node_id
             self._index[self._itr_index, 1] = key[1]  # trg_node_id
             self._prop_array[self._itr_index] = value
             self._itr_index += 1
+            self._index_built = False
 
         def __getitem__(self, item):
-            indicies = np.where((self._index[:, 0] == item[0]) & (self._index[:, 1] == item[1]))
-            return self._prop_array[indicies]
+            beg, end = self._find(item[0], item[1])
+            return self._sorted_vals[beg[0]:end[0]]
+
+
+    class EdgesWriter(object):
+        """Writes edge tables into the edges population of a SONATA file.
+
+        Tables are buffered until their combined size goes over max_memory bytes, or until flush() is called, at which
+        point the buffered edges are sorted by target and appended to the file. With max_memory set the datasets are
+        created resizable so that a network can be written a few connection maps at a time, in that case the edges of
+        a given target may be split over more than one block of the file and it's up to the index to find them.
+
+        h5_options are the chunks, compression, shuffle and narrow_dtypes options of
+        bmtk.utils.sonata.utils.create_dataset(). Resizable datasets are never narrowed since the range of the values
+        that will be appended is not known.
+
+        With append the edges are added to an existing file. If the population is already in the file the edges are
+        appended to the end of it, edge-groups with the same columns are shared with the existing edges.
+        """
+        def __init__(self, edges_file_name, pop_name, src_network, trg_network, trg_node_ids, max_memory=None,
+                     h5_options=None, append=False):
+            self._max_memory = max_memory
+            self._resizable = max_memory is not None or append
+            self._h5_options = h5_options or {}
+            self._buffer = []
+            self._buffer_nbytes = 0
+
+            self._groups_lookup = {}  # params hash --> group id
+            self._group_columns = {}  # group id --> column names
+            self._group_dtypes = {}
+            self._group_sizes = {}
+            self._existing_groups = {}  # sorted column names --> group id, of groups already in the file
+            self._next_group_id = 0
+
+            # position of every target node in the target network, edges are written in that order
+            self._trg_net_ids = np.array(trg_node_ids, dtype=np.int64)
+            self._trg_net_order = np.argsort(self._trg_net_ids, kind='stable')
+
+            self._src_network = src_network
+            self._trg_network = trg_network
+            if append and os.path.exists(edges_file_name):
+                self._h5 = h5py.File(edges_file_name, 'a')
+                self.pop_grp = self._h5.require_group('/edges/{}'.format(pop_name))
+                self._load_population()
+            else:
+                self._h5 = h5py.File(edges_file_name, 'w')
+                add_hdf5_attrs(self._h5)
+                self.pop_grp = self._h5.create_group('/edges/{}'.format(pop_name))
+
+        def _load_population(self):
+            """Finds the edge-groups of a population that is already in the file."""
+            for ds_name, network in [('target_node_id', self._trg_network), ('source_node_id', self._src_network)]:
+                if ds_name in self.pop_grp and self.pop_grp[ds_name].attrs.get('node_population', network) != network:
+                    raise Exception('Edges of {} have a different {} population than {}.'.format(
+                        self.pop_grp.name, ds_name, network))
+
+            for grp_name, grp in self.pop_grp.items():
+                if isinstance(grp, h5py.Group) and grp_name.isdigit():
+                    col_names = [k for k, ds in grp.items() if isinstance(ds, h5py.Dataset)]
+                    group_id = int(grp_name)
+                    self._existing_groups[tuple(sorted(col_names))] = group_id
+                    self._group_sizes[group_id] = len(grp[col_names[0]]) if col_names else 0
+                    self._next_group_id = max(self._next_group_id, group_id + 1)
+
+        def add_table(self, edge_table):
+            params_hash = str(edge_table['params'].keys())
+            # If no properties just save the nsyns table.
+            columns = list(edge_table['params'].keys()) or ['nsyns']
+            group_id = self._groups_lookup.get(params_hash, None)
+            if group_id is None:
+                group_id = self._existing_groups.get(tuple(sorted(columns)), None)
+                if group_id is None:
+                    group_id = self._next_group_id
+                    self._next_group_id += 1
+                    self._group_sizes[group_id] = 0
+                self._groups_lookup[params_hash] = group_id
+
+            self._group_columns[group_id] = columns
+            self._group_dtypes[group_id] = dict(edge_table['params_dtypes'])
+            if not edge_table['params']:
+                self._group_dtypes[group_id]['nsyns'] = 'uint16'
+
+            self._buffer.append((group_id, edge_table))
+            self._buffer_nbytes += edge_table['syn_table'].nbytes
+            self._buffer_nbytes += sum(pt.nbytes for pt in edge_table['params'].values())
+            if self._max_memory is not None and self._buffer_nbytes >= self._max_memory:
+                self.flush()
+
+        def flush(self):
+            """Writes all the buffered edge tables to the file."""
+            if not self._buffer and 'target_node_id' in self.pop_grp:
+                return
+
+            # Build the edges of each table straight from the sparse tables. Tables with properties have one row for
+            # every synapse, otherwise there is one row for each source/target pair.
+            trg_gids = []
+            src_gids = []
+            edge_type_ids = []
+            edge_groups = []
+            groups = {group_id: {col: [] for col in cols} for group_id, cols in self._group_columns.items()}
+            for group_id, ets in self._buffer:
+                src_ids, trg_ids, nsyns = ets['syn_table'].edges()
+                if ets['params']:
+                    src_ids = np.repeat(src_ids, nsyns)
+                    trg_ids = np.repeat(trg_ids, nsyns)
+                    pair_src_ids, pair_trg_ids, _ = ets['syn_table'].edges()
+                    for param_name, param_table in ets['params'].items():
+                        pvals = param_table.get_values(pair_src_ids, pair_trg_ids)
+                        groups[group_id][param_name].append(pvals)
+                else:
+                    groups[group_id]['nsyns'].append(nsyns)
+
+                trg_gids.append(trg_ids)
+                src_gids.append(src_ids)
+                edge_type_ids.append(np.full(len(trg_ids), ets['edge_type_id'], dtype=np.uint32))
+                edge_groups.append(np.full(len(trg_ids), group_id, dtype=np.uint16))
+
+            self._buffer = []
+            self._buffer_nbytes = 0
+
+            trg_gids = np.concatenate(trg_gids) if trg_gids else np.zeros(0, dtype=np.uint64)
+            src_gids = np.concatenate(src_gids) if src_gids else np.zeros(0, dtype=np.uint64)
+            edge_type_ids = np.concatenate(edge_type_ids) if edge_type_ids else np.zeros(0, dtype=np.uint32)
+            edge_groups = np.concatenate(edge_groups) if edge_groups else np.zeros(0, dtype=np.uint16)
+
+            # Order the edges by the position of their target in the target network, the sort is stable so for a
+            # given target the edges keep the order of the edge tables, and within a table the order of the sources.
+            trg_positions = self._trg_net_order[np.searchsorted(self._trg_net_ids, trg_gids,
+                                                                sorter=self._trg_net_order)]
+            edge_order = np.argsort(trg_positions, kind='stable')
+
+            unsorted_groups = edge_groups
+            trg_gids = trg_gids[edge_order]
+            src_gids = src_gids[edge_order]
+            edge_type_ids = edge_type_ids[edge_order]
+            edge_groups = edge_groups[edge_order]
+
+            # Each group's rows are stored in the same order they appear in the population, which is the sorted order
+            # restricted to the group.
+            edge_group_index = np.zeros(len(edge_order), dtype=np.uint32)
+            for group_id, params_dict in groups.items():
+                grp_mask = edge_groups == group_id
+                grp_size = np.count_nonzero(grp_mask)
+                edge_group_index[grp_mask] = np.arange(grp_size) + self._group_sizes[group_id]
+                self._group_sizes[group_id] += grp_size
+
+                # edge_order indexes into the concatenation of all the tables, convert that into an index of the
+                # concatenation of only the tables in this group.
+                grp_rows = np.flatnonzero(unsorted_groups == group_id)
+                grp_order = np.searchsorted(grp_rows, edge_order[grp_mask])
+                for params_key, params_vals in params_dict.items():
+                    vals = np.concatenate(params_vals) if params_vals else np.zeros(0)
+                    params_dict[params_key] = vals[grp_order]
 
+            new_population = 'target_node_id' not in self.pop_grp
+            self._append(self.pop_grp, 'target_node_id', trg_gids, 'uint64')
+            self._append(self.pop_grp, 'source_node_id', src_gids, 'uint64')
+            if new_population:
+                self.pop_grp['target_node_id'].attrs['node_population'] = self._trg_network
+                self.pop_grp['source_node_id'].attrs['node_population'] = self._src_network
+
+            self._append(self.pop_grp, 'edge_group_id', edge_groups, 'uint16')
+            self._append(self.pop_grp, 'edge_group_index', edge_group_index, 'uint32')
+            self._append(self.pop_grp, 'edge_type_id', edge_type_ids, 'uint32')
+
+            for group_id, params_dict in groups.items():
+                model_grp = self.pop_grp.require_group(str(group_id))
+                for params_key, params_vals in params_dict.items():
+                    self._append(model_grp, params_key, params_vals, self._group_dtypes[group_id].get(params_key))
+
+        def _append(self, h5_grp, ds_name, data, dtype=None):
+            if ds_name not in h5_grp:
+                if self._resizable:
+                    data = np.asarray(data, dtype=dtype)
+                    # chunks may be True, a number of rows or a shape, capped like in _replace() since the dataset
+                    # will grow and very large chunks make partial reads slow (and hdf5 limits them to 4GB)
+                    chunks = self._h5_options.get('chunks', None)
+                    chunk_rows = chunks[0] if isinstance(chunks, tuple) else chunks
+                    if chunk_rows is None or chunk_rows is True:
+                        chunk_rows = min(max(len(data), 1024), 2**20)
+                    h5_grp.create_dataset(ds_name, data=data, maxshape=(None,) + data.shape[1:],
+                                          chunks=(max(int(chunk_rows), 1),) + data.shape[1:],
+                                          compression=self._h5_options.get('compression', None),
+                                          shuffle=self._h5_options.get('shuffle', False))
+                else:
+                    create_dataset(h5_grp, ds_name, data=data, dtype=dtype, **self._h5_options)
+            elif len(data) > 0:
+                dataset = h5_grp[ds_name]
+                data = np.asarray(data, dtype=dtype)
+                fits_dtype = np.can_cast(data.dtype, dataset.dtype) or \
+                    np.array_equal(data.astype(dataset.dtype), data)
+                if dataset.maxshape[0] is None and fits_dtype:
+                    n_rows = dataset.shape[0]
+                    dataset.resize(n_rows + len(data), axis=0)
+                    dataset[n_rows:] = data
+                else:
+                    # dataset of an existing file that was saved with a fixed size or a narrower dtype, it has to be
+                    # copied into a new resizable dataset
+                    self._replace(h5_grp, ds_name, data)
+
+        def _replace(self, h5_grp, ds_name, data):
+            dataset = h5_grp[ds_name]
+            attrs = dict(dataset.attrs)
+            compression, shuffle = dataset.compression, dataset.shuffle
+            chunks = dataset.chunks or (min(max(len(dataset) + len(data), 1024), 2**20),) + data.shape[1:]
+            data = np.concatenate((dataset[()], data))
+            del h5_grp[ds_name]
+            dataset = h5_grp.create_dataset(ds_name, data=data, maxshape=(None,) + data.shape[1:], chunks=chunks,
+                                            compression=compression, shuffle=shuffle)
+            for attr_name, attr_val in attrs.items():
+                dataset.attrs[attr_name] = attr_val
+
+        def close(self):
+            self._h5.close()
 
 def add_hdf5_attrs(hdf5_handle):
     # TODO: move this as a utility function
@@ -20,10 +20,15 @@
 # WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
-from .dm_network import DenseNetwork
+import os
+import numpy as np
+import h5py
 from mpi4py import MPI
 from heapq import heappush, heappop
-import h5py
+
+from .dm_network import DenseNetwork, add_hdf5_attrs
+from bmtk.builder.build_report import BuildReport
+from bmtk.utils.sonata.utils import create_index, create_dataset, narrow_dtype
 
 comm = MPI.COMM_WORLD
 rank = comm.Get_rank()
@@ -31,30 +36,46 @@ nprocs = comm.Get_size()
 
 
 class MPINetwork(DenseNetwork):
+    """Network builder that splits the connection maps among MPI ranks.
+
+    Every rank builds the connection maps assigned to it and writes their edges into its own shard file, afterwards
+    rank 0 concatenates the shards into the final edges file and builds the indices. Edges in the final file are grouped
+    by rank, and sorted by target within each rank.
+    """
+    merge_chunk_size = 2**20  # number of rows copied at a time when merging the shards
+
     def __init__(self, name, **network_props):
         super(MPINetwork, self).__init__(name, **network_props or {})
         self._edge_assignment = None
+        self._defer_build_report = False
+        self._build_report_dir = None
+
+    def build(self, force=False, nprocs=1, seed=None, cache_dir=None, profile=False):
+        # connection maps are already divided among the ranks, don't fork extra processes
+        super(MPINetwork, self).build(force=force, nprocs=1, seed=seed, cache_dir=cache_dir, profile=profile)
 
     def _add_edges(self, connection_map, i):
         if self._assign_to_rank(i):
             super(MPINetwork, self)._add_edges(connection_map, i)
+        else:
+            # Even without any edges every rank needs the target network to write its shard
+            target_net = connection_map.target_nodes
+            self._target_networks[target_net.network_name] = target_net.network
 
-    def save_nodes(self, nodes_file_name, node_types_file_name):
+    def save_nodes(self, nodes_file_name=None, node_types_file_name=None, **kwargs):
+        # Only rank 0 saves the nodes, but gathering the build report is collective so it has to wait until all the
+        # ranks are past the barrier.
+        self._build_report_dir = None
         if rank == 0:
-            super(MPINetwork, self).save_nodes(nodes_file_name, node_types_file_name)
+            self._defer_build_report = True
+            try:
+                super(MPINetwork, self).save_nodes(nodes_file_name, node_types_file_name, **kwargs)
+            finally:
+                self._defer_build_report = False
         comm.Barrier()
 
-    """
-    def save_edges(self, edges_file_name=None, edge_types_file_name=None, output_dir='.', src_network=None,
-                   trg_network=None, force_build=True, force_overwrite=False):
-
-        if rank == 0:
-            # print rank, len(self.edges_table())
-            super(MPINetwork, self).save_edges(edges_file_name, edge_types_file_name, output_dir, src_network,
-                                               trg_network, force_build, force_overwrite)
-
-        comm.Barrier()
-    """
+        if self._build_report is not None:
+            self._save_build_report(comm.bcast(self._build_report_dir, root=0))
 
     def edges_iter(self, trg_gids, src_network=None, trg_network=None):
         for trg_gid in trg_gids:
@@ -70,80 +91,166 @@ class MPINetwork(DenseNetwork):
 
             comm.Barrier()
 
-    def _save_edges(self, edges_file_name, src_network, trg_network):
-        target_gids = [n.node_id for n in self._target_networks[trg_network].nodes()]
-        # TODO: make sure target_gids are sorted
-
-        trg_gids_ds = []
-        src_gids_ds = []
-        edge_type_id_ds = []
-        edge_group_ds = []
-        edge_group_index_ds = []
-
-        eg_collection = {}
-        eg_ids = 0
-        eg_lookup = {}
-        eg_table = {}
-        eg_indices = {}
-        for cm in self.get_connections():
-            col_key = cm.properties_keys()
-            if col_key in eg_collection:
-                group_id = eg_collection[col_key]
-            else:
-                group_id = eg_ids
-                eg_collection[col_key] = group_id
-                eg_ids += 1
-            eg_lookup[cm.edge_type_id] = group_id
-            eg_indices[group_id] = 0
-            eg_table[group_id] = {k: [] for k in cm.property_names}
-
-        for e in self.edges_iter(target_gids, src_network=src_network, trg_network=trg_network):
-            if rank == 0:
-                trg_gids_ds.append(e.target_gid)
-                src_gids_ds.append(e.source_gid)
-                edge_type_id_ds.append(e.edge_type_id)
+    def save_edges(self, *args, **kwargs):
+        if kwargs.get('append', False):
+            raise NotImplementedError('Appending edges to existing files is not supported by MPINetwork.')
+        super(MPINetwork, self).save_edges(*args, **kwargs)
 
-                group_id = eg_lookup[e.edge_type_id]
-                edge_group_ds.append(group_id)
-                group_id_index = eg_indices[group_id]
-                edge_group_index_ds.append(group_id_index)
-                eg_indices[group_id] += 1
+    def _save_edge_types(self, edge_types_file_name, src_network, trg_network, append=False):
+        if rank == 0:
+            super(MPINetwork, self)._save_edge_types(edge_types_file_name, src_network, trg_network, append)
+        comm.Barrier()
 
-                for k, v in e.synaptic_properties.items():
-                    eg_table[group_id][k].append(v)
+    def _save_edges(self, edges_file_name, src_network, trg_network, name=None, h5_options=None, append=False):
+        pop_name = '{}_to_{}'.format(src_network, trg_network) if name is None else name
+
+        # Each rank writes the edges it has built to its own file, the storage options are only used for the merged
+        # file since the dtypes of every shard need to match.
+        shard_files = [self._shard_file_name(edges_file_name, r) for r in range(nprocs)]
+        super(MPINetwork, self)._save_edges(shard_files[rank], src_network, trg_network, pop_name)
+        comm.Barrier()
 
         if rank == 0:
-            # Create index from target_gids dataset
-            index_pointer_ds = []
-            cur_gid = 0
-            index = 0
-            while index < len(trg_gids_ds):
-                if trg_gids_ds[index] == cur_gid:
-                    index += 1
-                else:
-                    cur_gid += 1
-                    index_pointer_ds.append(index)
-            index_pointer_ds.append(len(trg_gids_ds)+1)
-
-
-            with h5py.File(edges_file_name, 'w') as hf:
-                hf.create_dataset('edges/target_gid', data=trg_gids_ds, dtype='uint64')
-                hf['edges/target_gid'].attrs['network'] = trg_network
-                hf.create_dataset('edges/source_gid', data=src_gids_ds, dtype='uint64')
-                hf['edges/source_gid'].attrs['network'] = src_network
-
-                hf.create_dataset('edges/edge_group', data=edge_group_ds, dtype='uint16')
-                hf.create_dataset('edges/edge_group_index', data=edge_group_index_ds, dtype='uint32')
-                hf.create_dataset('edges/edge_type_id', data=edge_type_id_ds, dtype='uint32')
-                hf.create_dataset('edges/index_pointer', data=index_pointer_ds, dtype='uint32')
-
-                for gid, group in eg_table.items():
-                    for col_key, col_ds in group.items():
-                        ds_loc = 'edges/{}/{}'.format(gid, col_key)
-                        hf.create_dataset(ds_loc, data=col_ds)
+            self._merge_shards(shard_files, edges_file_name, pop_name, h5_options)
+            for shard_file in shard_files:
+                os.remove(shard_file)
 
         comm.Barrier()
 
+    def _stream_edges(self, network_params, output_dir, name=None, max_memory=None, h5_options=None, append=False):
+        raise NotImplementedError('Streaming edges with max_memory is not supported by MPINetwork, call build() first.')
+
+    def _save_build_report(self, output_dir):
+        # Every rank profiles the connection maps it has built, rank 0 saves the records of all the ranks
+        if self._build_report is None:
+            return
+
+        if self._defer_build_report:
+            self._build_report_dir = output_dir
+            return
+
+        rank_records = comm.gather(self._build_report.records, root=0)
+        if rank == 0:
+            report = BuildReport(self.name)
+            for r, records in enumerate(rank_records):
+                for record in records:
+                    report.records.append(dict(record, rank=r))
+            report.save(output_dir)
+        comm.Barrier()
+
+    @staticmethod
+    def _shard_file_name(edges_file_name, shard_rank):
+        base, ext = os.path.splitext(edges_file_name)
+        return '{}.rank{}{}'.format(base, shard_rank, ext or '.h5')
+
+    def _merge_shards(self, shard_files, edges_file_name, pop_name, h5_options=None):
+        """Concatenates the edges population of every shard into a single file, merging the edge-groups that have the
+        same columns. Datasets are copied in chunks so the memory used doesn't depend on the size of the shards.
+        """
+        h5_options = dict(h5_options or {})
+        narrow_dtypes = h5_options.pop('narrow_dtypes', False)
+
+        shard_h5s = [h5py.File(f, 'r') for f in shard_files]
+        shard_pops = [h5['/edges'][pop_name] for h5 in shard_h5s]
+
+        # Find the merged group-id for each group in every shard, plus the offset of the shard's group rows in the
+        # merged group.
+        merged_groups = {}  # sorted column names --> merged group id
+        merged_group_cols = []  # merged group id --> {column name: list of h5py.Dataset of every shard}
+        merged_group_sizes = []
+        group_lookups = []  # for every shard a lookup array from the shard's group id to the merged group id
+        group_offsets = []  # for every shard a lookup array from shard's group id to the offset in the merged group
+        for pop_grp in shard_pops:
+            shard_groups = {int(k): g for k, g in pop_grp.items() if isinstance(g, h5py.Group) and k.isdigit()}
+            max_grp_id = max(shard_groups.keys()) if shard_groups else -1
+            lookup = np.zeros(max_grp_id + 1, dtype=np.uint16)
+            offsets = np.zeros(max_grp_id + 1, dtype=np.uint64)
+            for grp_id, grp in shard_groups.items():
+                col_names = tuple(sorted(k for k, ds in grp.items() if isinstance(ds, h5py.Dataset)))
+                if col_names not in merged_groups:
+                    merged_groups[col_names] = len(merged_group_cols)
+                    merged_group_cols.append({k: [] for k in col_names})
+                    merged_group_sizes.append(0)
+                merged_id = merged_groups[col_names]
+                for col_name in col_names:
+                    merged_group_cols[merged_id][col_name].append(grp[col_name])
+                lookup[grp_id] = merged_id
+                offsets[grp_id] = merged_group_sizes[merged_id]
+                merged_group_sizes[merged_id] += len(grp[col_names[0]]) if col_names else 0
+            group_lookups.append(lookup)
+            group_offsets.append(offsets)
+
+        n_edges = sum(len(pop_grp['target_node_id']) for pop_grp in shard_pops)
+        chunk_size = self.merge_chunk_size
+        with h5py.File(edges_file_name, 'w') as hf:
+            add_hdf5_attrs(hf)
+            out_grp = hf.create_group('/edges/{}'.format(pop_name))
+            for ds_name in ['target_node_id', 'source_node_id', 'edge_group_id', 'edge_group_index', 'edge_type_id']:
+                ds_dtype = self._merged_dtype([pop_grp[ds_name] for pop_grp in shard_pops], narrow_dtypes)
+                create_dataset(out_grp, ds_name, shape=(n_edges,), dtype=ds_dtype, **h5_options)
+            for ds_name in ['target_node_id', 'source_node_id']:
+                for attr_name, attr_val in shard_pops[0][ds_name].attrs.items():
+                    out_grp[ds_name].attrs[attr_name] = attr_val
+
+            # Copy the edges of every shard one after the other, mapping the group ids/indices
+            edge_offset = 0
+            for pop_grp, lookup, offsets in zip(shard_pops, group_lookups, group_offsets):
+                n_shard_edges = len(pop_grp['target_node_id'])
+                for beg in range(0, n_shard_edges, chunk_size):
+                    end = min(beg + chunk_size, n_shard_edges)
+                    out_beg, out_end = edge_offset + beg, edge_offset + end
+                    for ds_name in ['target_node_id', 'source_node_id', 'edge_type_id']:
+                        out_grp[ds_name][out_beg:out_end] = pop_grp[ds_name][beg:end]
+                    grp_ids = pop_grp['edge_group_id'][beg:end]
+                    grp_indices = pop_grp['edge_group_index'][beg:end]
+                    out_grp['edge_group_id'][out_beg:out_end] = lookup[grp_ids]
+                    out_grp['edge_group_index'][out_beg:out_end] = grp_indices + offsets[grp_ids]
+                edge_offset += n_shard_edges
+
+            # Copy the group columns
+            for merged_id, (col_dsets, grp_size) in enumerate(zip(merged_group_cols, merged_group_sizes)):
+                model_grp = out_grp.create_group(str(merged_id))
+                for col_name, shard_dsets in col_dsets.items():
+                    col_dtype = self._merged_dtype(shard_dsets, narrow_dtypes)
+                    create_dataset(model_grp, col_name, shape=(grp_size,) + shard_dsets[0].shape[1:], dtype=col_dtype,
+                                   **h5_options)
+
+            for pop_grp, lookup, offsets in zip(shard_pops, group_lookups, group_offsets):
+                for grp_id in range(len(lookup)):
+                    if str(grp_id) not in pop_grp:
+                        continue
+                    shard_grp = pop_grp[str(grp_id)]
+                    model_grp = out_grp[str(lookup[grp_id])]
+                    for col_name, col_ds in shard_grp.items():
+                        n_rows = len(col_ds)
+                        for beg in range(0, n_rows, chunk_size):
+                            end = min(beg + chunk_size, n_rows)
+                            out_beg = int(offsets[grp_id]) + beg
+                            model_grp[col_name][out_beg:(out_beg + end - beg)] = col_ds[beg:end]
+
+            create_index(out_grp['target_node_id'], out_grp, index_type='target')
+            create_index(out_grp['source_node_id'], out_grp, index_type='source')
+
+        for h5 in shard_h5s:
+            h5.close()
+
+    def _merged_dtype(self, shard_datasets, narrow_dtypes=False):
+        """Returns the dtype of the concatenation of the shard datasets. When narrow_dtypes is True it is the narrowed
+        dtype (see bmtk.utils.sonata.utils.narrow_dtype) if the values of every shard can be narrowed.
+        """
+        dtype = shard_datasets[0].dtype
+        if not narrow_dtypes or dtype.kind not in ('i', 'u', 'f') or dtype.itemsize <= 4:
+            return dtype
+
+        narrowed_dtype = dtype
+        for shard_ds in shard_datasets:
+            for beg in range(0, len(shard_ds), self.merge_chunk_size):
+                chunk_dtype = narrow_dtype(shard_ds[beg:(beg + self.merge_chunk_size)], dtype)
+                if chunk_dtype == dtype:
+                    return dtype
+                narrowed_dtype = chunk_dtype
+        return narrowed_dtype
+
     def _assign_to_rank(self, i):
         if self._edge_assignment is None:
             self._build_rank_assignments()
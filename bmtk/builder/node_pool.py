@@ -22,6 +22,9 @@
 #
 from ast import literal_eval
 from six import string_types
+import numpy as np
+
+from .node_set import _as_column
 
 
 class NodePool(object):
@@ -45,15 +48,22 @@ class NodePool(object):
         self.__filter_str = None
 
     def __len__(self):
-        return sum(1 for _ in self)
+        return len(self.__network._query_nodes(self.__properties))
 
     def __iter__(self):
-        return (n for n in self.__network.nodes_iter() if self.__query_object_properties(n, self.__properties))
+        nodes = self.__network._nodes_columns().nodes
+        return (nodes[i] for i in self.__network._query_nodes(self.__properties))
 
     @property
     def network(self):
         return self.__network
 
+    def columns(self):
+        """Returns a dictionary-like NodeColumns object of all node properties in the pool as numpy arrays, in the
+        same order the nodes are iterated.
+        """
+        return self.__network._nodes_columns().take(self.__network._query_nodes(self.__properties))
+
     @property
     def network_name(self):
         return self.__network.name
@@ -85,22 +95,111 @@ class NodePool(object):
             properties[var] = literal_eval(val)
         return cls(network, position=None, **properties)
 
-    def __query_object_properties(self, obj, props):
-        if props is None:
-            return True
-
-        for k, v in props.items():
-            ov = obj.get(k, None)
-            if ov is None:
-                return False
-
-            if hasattr(v, '__call__'):
-                if not v(ov):
-                    return False
-            elif isinstance(v, list):
-                if ov not in v:
-                    return False
-            elif ov != v:
-                return False
-
-        return True
+
+def _match_value(value, query_value):
+    """Checks a single node property against the query value of a NodePool."""
+    if value is None:
+        return False
+
+    if hasattr(query_value, '__call__'):
+        return bool(query_value(value))
+    elif isinstance(query_value, list):
+        return value in query_value
+    else:
+        return value == query_value
+
+
+class NodeColumns(object):
+    """Columnar (property name --> numpy array) view of the properties of a list of nodes.
+
+    Columns are only built the first time they are accessed, so vectorized connection rules only pay for the properties
+    they actually use. Nodes that are missing a property will have a None value in the column. nodes may also be a
+    sequence that has a column(name) method, in which case the columns are fetched from it.
+
+    srcs = net.nodes(ei='e').columns()
+    dist = np.linalg.norm(srcs['positions'] - [0.0, 0.0, 0.0], axis=1)
+    """
+
+    def __init__(self, nodes, rows=None, cache=None):
+        self._nodes = nodes
+        self._rows = rows  # optional selection/repetition of the nodes, see take()
+        self._columns = cache if cache is not None else {}
+
+    @property
+    def node_ids(self):
+        return self['node_id']
+
+    @property
+    def nodes(self):
+        """List of the node objects, in the same order as the columns."""
+        if self._rows is None:
+            return self._nodes
+        return [self._nodes[r] for r in self._rows]
+
+    def keys(self):
+        col_names = set()
+        for node in self.nodes:
+            col_names.update(node.params.keys())
+            col_names.update(node.node_type_properties.keys())
+        return list(col_names)
+
+    def take(self, rows):
+        """Returns a NodeColumns with the nodes at the given rows, rows may be repeated (eg. one row per synapse). The
+        columns of the original nodes are shared and only built once.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if self._rows is not None:
+            rows = self._rows[rows]
+        return NodeColumns(self._nodes, rows, self._columns)
+
+    def __getitem__(self, column_name):
+        if column_name not in self._columns:
+            if hasattr(self._nodes, 'column'):
+                # nodes are already stored as columns (eg. imported nodes)
+                self._columns[column_name] = self._nodes.column(column_name)
+            elif column_name == 'node_id':
+                self._columns[column_name] = np.array([n.node_id for n in self._nodes], dtype=np.int64)
+            else:
+                # mixed types (eg. ints and strings) are kept as objects so they aren't matched as strings
+                self._columns[column_name] = _as_column([n.get(column_name, None) for n in self._nodes])
+
+        if self._rows is None:
+            return self._columns[column_name]
+        else:
+            return self._columns[column_name][self._rows]
+
+    def query(self, properties):
+        """Returns the rows of the nodes that match all of the (property name --> value) pairs, using the same rules as
+        NodePool: values can be a literal, a list of allowed values or a function, and nodes without the property
+        never match. Comparisons against literals are done on the whole column at once.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for prop_name, query_value in properties.items():
+            mask &= self._match_column(prop_name, query_value)
+        return np.flatnonzero(mask)
+
+    def _match_column(self, prop_name, query_value):
+        if not hasattr(query_value, '__call__'):
+            column = self[prop_name]
+            if column.ndim == 1 and column.dtype != object:
+                query_values = query_value if isinstance(query_value, list) else [query_value]
+                matches = np.zeros(len(column), dtype=bool)
+                for val in query_values:
+                    if not np.isscalar(val) or isinstance(val, string_types) != (column.dtype.kind in 'US'):
+                        break
+                    val_matches = column == val
+                    if not isinstance(val_matches, np.ndarray) or val_matches.shape != column.shape:
+                        # numpy couldn't compare the types element-wise (eg. str column with an int)
+                        break
+                    matches |= val_matches
+                else:
+                    return matches
+
+        # Columns with missing values, objects or functions have to be checked node-by-node
+        return np.array([_match_value(n.get(prop_name, None), query_value) for n in self.nodes], dtype=bool)
+
+    def __contains__(self, column_name):
+        return any(column_name in n for n in self.nodes)
+
+    def __len__(self):
+        return len(self._nodes) if self._rows is None else len(self._rows)
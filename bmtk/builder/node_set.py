@@ -20,14 +20,22 @@
 # WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
+import warnings
 import six
+import numpy as np
 from .node import Node
 
 
 class NodeSet(object):
+    """Nodes created by a single add_nodes() call.
+
+    The per-node parameters are copied into numpy columns, and after build() the node-set acts as a sequence of its
+    nodes. Node objects are only created, as a view of a row, when a node is accessed, so the memory of
+    a node-set is its node ids plus its parameter columns. Use column() to get a property of all the nodes at once.
+    """
     def __init__(self, N, node_params, node_type_properties):
         self.__N = N
-        self.__node_params = node_params
+        self.__node_params = {key: _as_column(values) for key, values in node_params.items()}
         self.__node_type_properties = node_type_properties
 
         assert('node_type_id' in node_type_properties)
@@ -37,6 +45,7 @@ class NodeSet(object):
         columns = list(self.__node_params.keys())
         columns.sort()
         self.__params_col_hash = hash(str(columns))
+        self.__node_ids = None
 
     @property
     def N(self):
@@ -46,6 +55,10 @@ class NodeSet(object):
     def node_type_id(self):
         return self.__node_type_id
 
+    @property
+    def node_type_properties(self):
+        return self.__node_type_properties
+
     @property
     def params_keys(self):
         return self.__node_params.keys()
@@ -54,18 +67,198 @@ class NodeSet(object):
     def params_hash(self):
         return self.__params_col_hash
 
+    @property
+    def node_ids(self):
+        """node_ids of the nodes, only available after build() has been called."""
+        return self.__node_ids
+
+    def params_column(self, key):
+        """Returns the values of a node param for all the nodes in the set."""
+        return self.__node_params[key]
+
     def build(self, nid_generator):
+        """Assigns the node ids, returns the node-set as a sequence of Node objects."""
         # fetch existing node ids or create new ones
         node_ids = self.__node_params.get('node_id', None)
         if node_ids is None:
             node_ids = [nid for nid in nid_generator(self.N)]
+        self.__node_ids = np.array(node_ids, dtype=np.uint64)
+        return self
+
+    def column(self, column_name):
+        """Returns the values of a node property for all the nodes, params take precedence over node-type properties
+        and nodes without the property get None."""
+        if column_name == 'node_id':
+            return self.__node_ids.astype(np.int64)
+        elif column_name in self.__node_params:
+            values = np.asarray(self.__node_params[column_name])
+            if len(values) < self.N:
+                # nodes past the end of a short param list don't have the property
+                padded_values = np.full(self.N, None, dtype=object)
+                padded_values[:len(values)] = list(values)
+                return padded_values
+            return values
+        else:
+            value = self.__node_type_properties.get(column_name, None)
+            return np.full(self.N, value, dtype=object if value is None else None)
+
+    def __getitem__(self, row):
+        node_params = {key: plist[row] for key, plist in self.__node_params.items() if row < len(plist)}
+        return Node(int(self.__node_ids[row]), node_params, self.__node_type_properties, self.__params_col_hash)
+
+    def __iter__(self):
+        return (self[i] for i in six.moves.range(self.N))
+
+    def __len__(self):
+        return self.N
+
+
+def _as_column(values):
+    """Copies a list of per-node values into a numpy array. Values that don't make a regular array (eg. lists of
+    different lengths) or would be coerced into strings (eg. a mix of numbers and strings) are kept as objects."""
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            column = np.array(values)
+    except (ValueError, Warning):
+        column = None
+
+    if column is None or (column.dtype.kind in 'US' and
+                          not all(isinstance(v, six.string_types + (bytes, np.character)) for v in values)):
+        column = np.empty(len(values), dtype=object)
+        for i, v in enumerate(values):
+            column[i] = v
+    return column
+
+
+class ImportedNodeSet(object):
+    """Nodes of a population imported from an existing SONATA nodes file.
+
+    The node ids, types and group properties are kept as numpy columns; a Node object is only created, as a view of a
+    row, when a node is accessed. Use column() to get the values of a property for all the nodes at once.
+    """
+    def __init__(self, node_pop):
+        self._node_ids = np.asarray(node_pop.node_ids)
+        self._node_type_ids = np.asarray(node_pop.type_ids)
+        self._group_ids = np.asarray(node_pop.group_id_ds)
+        self._group_indices = np.asarray(node_pop.group_index_ds)
+        self._node_types = {int(ntid): node_pop.node_types_table[int(ntid)] for ntid in np.unique(self._node_type_ids)}
+
+        self._group_columns = {}  # group_id --> {column name: numpy array}
+        for grp in node_pop.groups:
+            self._group_columns[grp.group_id] = {col.name: np.asarray(grp.get_dataset(col.name))
+                                                 for col in grp.group_columns}
+
+    @property
+    def N(self):
+        return len(self._node_ids)
+
+    @property
+    def node_ids(self):
+        return self._node_ids
+
+    @property
+    def node_type_ids(self):
+        return self._node_type_ids
+
+    @property
+    def group_ids(self):
+        return self._group_ids
+
+    @property
+    def group_indices(self):
+        return self._group_indices
+
+    @property
+    def node_types(self):
+        """node_type_id --> node-type properties of all the node types used by the nodes."""
+        return self._node_types
+
+    @property
+    def group_columns(self):
+        """group_id --> {column name: numpy array} of the group properties."""
+        return self._group_columns
+
+    def column(self, column_name):
+        """Returns the values of a node property for all the nodes. Group properties take precedence over node-type
+        properties, nodes without the property get None."""
+        if column_name == 'node_id':
+            return self._node_ids.astype(np.int64)
+
+        values = None
+        found = np.zeros(self.N, dtype=bool)
+        for grp_id, grp_columns in self._group_columns.items():
+            if column_name not in grp_columns:
+                continue
+
+            grp_mask = self._group_ids == grp_id
+            grp_values = grp_columns[column_name][self._group_indices[grp_mask]]
+            if np.all(grp_mask):
+                return grp_values
+
+            if values is None:
+                values = np.full(self.N, None, dtype=object)
+            values[grp_mask] = list(grp_values)
+            found |= grp_mask
+
+        type_ids, type_rows = np.unique(self._node_type_ids[~found], return_inverse=True)
+        type_values = np.array([self._node_types[int(ntid)].get(column_name, None) for ntid in type_ids])
+        if values is None:
+            return type_values[type_rows]
+
+        values[~found] = list(type_values[type_rows])
+        return values
+
+    def __getitem__(self, row):
+        grp_index = self._group_indices[row]
+        node_params = {k: col[grp_index] for k, col in self._group_columns[self._group_ids[row]].items()}
+        return Node(int(self._node_ids[row]), node_params, self._node_types[int(self._node_type_ids[row])])
+
+    def __iter__(self):
+        return (self[i] for i in six.moves.range(self.N))
+
+    def __len__(self):
+        return self.N
+
+
+class ChainedNodes(object):
+    """A sequence made of lists of nodes, NodeSets and/or ImportedNodeSets."""
+    def __init__(self, parts):
+        self._parts = [p for p in parts if len(p) > 0]
+        self._offsets = np.cumsum([0] + [len(p) for p in self._parts])
+
+    def column(self, column_name):
+        columns = []
+        for part in self._parts:
+            if hasattr(part, 'column'):
+                columns.append(part.column(column_name))
+            elif column_name == 'node_id':
+                columns.append(np.array([n.node_id for n in part], dtype=np.int64))
+            else:
+                columns.append(_as_column([n.get(column_name, None) for n in part]))
+
+        if len(columns) == 0:
+            return np.zeros(0)
+        elif len(set((c.dtype.kind, c.shape[1:]) for c in columns)) == 1:
+            return np.concatenate(columns)
+        elif len(set(c.shape[1:] for c in columns)) == 1 and all(c.dtype.kind in 'biuf' for c in columns):
+            # numbers of different types, same as numpy does when creating an array from a list of mixed numbers
+            return np.concatenate(columns)
+        else:
+            # Avoid numpy casting between types (eg. ints to strings)
+            values = np.empty(len(self), dtype=object)
+            for beg, col in zip(self._offsets, columns):
+                values[beg:(beg + len(col))] = list(col)
+            return values
+
+    def __getitem__(self, row):
+        part_idx = np.searchsorted(self._offsets, row, side='right') - 1
+        return self._parts[part_idx][row - self._offsets[part_idx]]
 
-        # turn node_params from dictionary of lists to a list of dictionaries.
-        ap_flat = [{} for _ in six.moves.range(self.N)]
-        for key, plist in self.__node_params.items():
-            for i, val in enumerate(plist):
-                ap_flat[i][key] = val
+    def __iter__(self):
+        for part in self._parts:
+            for node in part:
+                yield node
 
-        # create node objects
-        return [Node(nid, params, self.__node_type_properties, self.__params_col_hash)
-                for (nid, params) in zip(node_ids, ap_flat)]
+    def __len__(self):
+        return int(self._offsets[-1])
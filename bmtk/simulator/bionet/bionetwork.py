@@ -256,6 +256,8 @@ class BioNetwork(SimNetwork):
         for edge_pop in recurrent_edge_pops:
             if edge_pop.recurrent_connections:
                 source_population = edge_pop.source_nodes
+                edge_pop.load_index('target', node_ids=list(self._rank_node_ids[edge_pop.target_nodes].keys()))
+                edge_pop.load_index('source', node_ids=list(self._rank_node_ids[source_population].keys()))
                 for trg_nid, trg_cell in self._rank_node_ids[edge_pop.target_nodes].items():
                     for edge in edge_pop.get_target(trg_nid):
                         src_node = self.get_node_id(source_population, edge.source_node_id)
@@ -284,6 +286,7 @@ class BioNetwork(SimNetwork):
                 # node to see if is virtual (bc virtual nodes can't be built yet). This conditional can significantly
                 # slow down build time so we use a special loop that can be ignored.
                 source_population = edge_pop.source_nodes
+                edge_pop.load_index('target', node_ids=list(self._rank_node_ids[edge_pop.target_nodes].keys()))
                 for trg_nid, trg_cell in self._rank_node_ids[edge_pop.target_nodes].items():
                     for edge in edge_pop.get_target(trg_nid):
                         src_node = self.get_node_id(source_population, edge.source_node_id)
@@ -312,6 +315,7 @@ class BioNetwork(SimNetwork):
             source_population = src_node_pop.name
             for edge_pop in self.find_edges(source_nodes=source_population):
                 if edge_pop.virtual_connections:
+                    edge_pop.load_index('target', node_ids=list(self._rank_node_ids[edge_pop.target_nodes].keys()))
                     for trg_nid, trg_cell in self._rank_node_ids[edge_pop.target_nodes].items():
                         for edge in edge_pop.get_target(trg_nid):
                             src_cell = self.get_virtual_cells(source_population, edge.source_node_id, spike_trains)
@@ -9,7 +9,7 @@ from itertools import product
 from .sim_module import SimulatorMod
 from bmtk.simulator.bionet.biocell import BioCell
 from bmtk.simulator.bionet.io_tools import io
-from bmtk.utils.sonata.utils import add_hdf5_magic, add_hdf5_version
+from bmtk.utils.sonata.utils import add_hdf5_magic, add_hdf5_version, create_index
 from bmtk.simulator.bionet.pointprocesscell import PointProcessCell
 
 
@@ -172,39 +172,10 @@ class H5Merger(object):
 
     def _create_index(self, pop_root, index_type='target'):
         if index_type == 'target':
-            edge_nodes = np.array(pop_root['target_node_id'], dtype=np.int64)
-            output_grp = pop_root.create_group('indices/target_to_source')
-        elif index_type == 'source':
-            edge_nodes = np.array(pop_root['source_node_id'], dtype=np.int64)
-            output_grp = pop_root.create_group('indices/source_to_target')
-
-        edge_nodes = np.append(edge_nodes, [-1])
-        n_targets = np.max(edge_nodes)
-        ranges_list = [[] for _ in range(n_targets + 1)]
-
-        n_ranges = 0
-        begin_index = 0
-        cur_trg = edge_nodes[begin_index]
-        for end_index, trg_gid in enumerate(edge_nodes):
-            if cur_trg != trg_gid:
-                ranges_list[cur_trg].append((begin_index, end_index))
-                cur_trg = int(trg_gid)
-                begin_index = end_index
-                n_ranges += 1
-
-        node_id_to_range = np.zeros((n_targets + 1, 2))
-        range_to_edge_id = np.zeros((n_ranges, 2))
-        range_index = 0
-        for node_index, trg_ranges in enumerate(ranges_list):
-            if len(trg_ranges) > 0:
-                node_id_to_range[node_index, 0] = range_index
-                for r in trg_ranges:
-                    range_to_edge_id[range_index, :] = r
-                    range_index += 1
-                node_id_to_range[node_index, 1] = range_index
-
-        output_grp.create_dataset('range_to_edge_id', data=range_to_edge_id, dtype='uint64')
-        output_grp.create_dataset('node_id_to_range', data=node_id_to_range, dtype='uint64')
+            edge_nodes = pop_root['target_node_id']
+        else:
+            edge_nodes = pop_root['source_node_id']
+        create_index(edge_nodes, pop_root, index_type=index_type, index_grp_name='indices')
 
 
 
@@ -303,39 +274,10 @@ class ConnectionWriter(object):
 
         def _create_index(self, index_type='target'):
             if index_type == 'target':
-                edge_nodes = np.array(self._pop_root['target_node_id'], dtype=np.int64)
-                output_grp = self._pop_root.create_group('indices/target_to_source')
-            elif index_type == 'source':
-                edge_nodes = np.array(self._pop_root['source_node_id'], dtype=np.int64)
-                output_grp = self._pop_root.create_group('indices/source_to_target')
-
-            edge_nodes = np.append(edge_nodes, [-1])
-            n_targets = np.max(edge_nodes)
-            ranges_list = [[] for _ in range(n_targets + 1)]
-
-            n_ranges = 0
-            begin_index = 0
-            cur_trg = edge_nodes[begin_index]
-            for end_index, trg_gid in enumerate(edge_nodes):
-                if cur_trg != trg_gid:
-                    ranges_list[cur_trg].append((begin_index, end_index))
-                    cur_trg = int(trg_gid)
-                    begin_index = end_index
-                    n_ranges += 1
-
-            node_id_to_range = np.zeros((n_targets + 1, 2))
-            range_to_edge_id = np.zeros((n_ranges, 2))
-            range_index = 0
-            for node_index, trg_ranges in enumerate(ranges_list):
-                if len(trg_ranges) > 0:
-                    node_id_to_range[node_index, 0] = range_index
-                    for r in trg_ranges:
-                        range_to_edge_id[range_index, :] = r
-                        range_index += 1
-                    node_id_to_range[node_index, 1] = range_index
-
-            output_grp.create_dataset('range_to_edge_id', data=range_to_edge_id, dtype='uint64')
-            output_grp.create_dataset('node_id_to_range', data=node_id_to_range, dtype='uint64')
+                edge_nodes = self._pop_root['target_node_id']
+            else:
+                edge_nodes = self._pop_root['source_node_id']
+            create_index(edge_nodes, self._pop_root, index_type=index_type, index_grp_name='indices')
 
         def close_h5(self):
             self._h5_file.close()
@@ -71,3 +71,7 @@ class EdgesReader(object):
     def initialize(self, network):
         raise NotImplementedError()
 
+    def load_index(self, index_type, node_ids=None):
+        """Optional, lets the reader keep the target (or source) index of node_ids in memory before get_target() or
+        get_source() is called for every one of them."""
+        pass
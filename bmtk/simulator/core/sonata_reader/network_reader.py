@@ -176,6 +176,9 @@ class SonataEdges(EdgesReader):
         self._edge_adaptors = {grp.group_id: self._adaptor_cls.create_adaptor(grp, network)
                                for grp in self._edge_pop.groups}
 
+    def load_index(self, index_type, node_ids=None):
+        self._edge_pop.load_index(index_type, node_ids=node_ids)
+
     def get_target(self, node_id):
         for edge in self._edge_pop.get_target(node_id):
             yield self._edge_adaptors[edge.group_id].get_edge(edge)
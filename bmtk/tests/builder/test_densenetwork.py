@@ -1,4 +1,6 @@
 import os
+import gc
+import json
 import shutil
 import pytest
 import numpy as np
@@ -7,6 +9,7 @@ import h5py
 import tempfile
 
 from bmtk.builder import NetworkBuilder
+from bmtk.utils import sonata
 
 
 def test_create_network():
@@ -274,6 +277,552 @@ def test_save_multinetwork():
     assert(edge_types_csv['ctype_1'].iloc[0] == 'n2_rec')
 
 
+def test_sparse_edge_table():
+    net = NetworkBuilder('NET1')
+    net.add_nodes(N=200, ei='e')
+    net.add_nodes(N=100, ei='i')
+    net.add_edges(source={'ei': 'e'}, target={'ei': 'i'},
+                  connection_rule=lambda s, t: 2 if s.node_id == (t.node_id - 200)*2 else 0)
+    net.build()
+    assert(net.nedges == 200)
+
+    edge_table = net.edges_table()[0]['syn_table']
+    assert(edge_table.nedges == 100)
+    assert(edge_table.nsyns == 200)
+    src_ids, trg_ids, nsyns = edge_table.edges()
+    assert(np.all(src_ids == np.arange(0, 200, 2)))
+    assert(np.all(trg_ids == np.arange(200, 300)))
+    assert(np.all(nsyns == 2))
+    assert(edge_table[4, 202] == 2)
+    assert(edge_table[5, 202] == 0)
+
+    # Overwriting a connection should replace, not add to, the number of synapses
+    edge_table[4, 202] = 5
+    edge_table[5, 202] = 1
+    assert(edge_table[4, 202] == 5)
+    assert(list(edge_table.trg_itr(202)) == [(4, 5), (5, 1)])
+    assert(edge_table.nsyns == 204)
+
+
+def test_vectorized_edges():
+    def nsyns_rule(s, t):
+        return (s.node_id + t.node_id) % 3
+
+    def nsyns_vec_rule(sources, targets):
+        return np.add.outer(sources['node_id'], targets['node_id']) % 3
+
+    net = NetworkBuilder('NET1')
+    net.add_nodes(N=100, ei='e')
+    net.add_nodes(N=50, ei='i')
+    net.add_edges(source={'ei': 'e'}, target={'ei': 'i'}, connection_rule=nsyns_rule)
+    net.add_edges(source={'ei': 'e'}, target={'ei': 'i'}, connection_rule=nsyns_vec_rule, iterator='all_to_all')
+    net.build()
+
+    pairs_table = net.edges_table()[0]['syn_table']
+    vec_table = net.edges_table()[1]['syn_table']
+    assert(vec_table.nsyns == pairs_table.nsyns)
+    for pairs_arr, vec_arr in zip(pairs_table.edges(), vec_table.edges()):
+        assert(np.all(pairs_arr == vec_arr))
+
+
+def test_property_table():
+    pt = NetworkBuilder.PropertyTable(6)
+    pt[10, 1] = 0.1
+    pt[2, 5] = 0.2
+    pt[10, 1] = 0.3
+    pt[3, 1] = 0.4
+    pt[2, 5] = 0.5
+    pt[10, 2] = 0.6
+
+    assert(np.allclose(pt[10, 1], [0.1, 0.3]))
+    assert(np.allclose(list(pt.itr_vals(2, 5)), [0.2, 0.5]))
+    assert(len(pt[2, 1]) == 0)
+    assert(len(pt[100, 100]) == 0)
+    assert(np.allclose(pt.get_values([10, 3, 99, 2], [2, 1, 1, 5]), [0.6, 0.4, 0.2, 0.5]))
+
+
+def test_vectorized_properties():
+    net = NetworkBuilder('NET1')
+    net.add_nodes(N=20, x=np.arange(20), ei='e')
+    net.add_nodes(N=10, x=np.arange(10), ei='i')
+    cm = net.add_edges(source={'ei': 'e'}, target={'ei': 'i'}, connection_rule=lambda s, t: (s['x'] + t['x']) % 3)
+    cm.add_properties('syn_weight', rule=lambda s, t: s['x']*0.5 + t['x'], dtypes=float)
+    cm.add_properties(['sec_id', 'sec_x'], rule=lambda s, t: [s['x'], 0.5], dtypes=[int, float])
+
+    cm = net.add_edges(source={'ei': 'e'}, target={'ei': 'i'}, connection_rule=lambda s, t: (s['x'] + t['x']) % 3)
+    cm.add_properties('syn_weight', rule=lambda srcs, trgs: srcs['x']*0.5 + trgs['x'], dtypes=float, vectorized=True)
+    cm.add_properties(['sec_id', 'sec_x'], rule=lambda srcs, trgs: [srcs['x'], 0.5], dtypes=[int, float],
+                      vectorized=True)
+    net.build()
+
+    net_dir = tempfile.mkdtemp()
+    net.save_edges('tmp_edges.h5', 'tmp_edge_types.csv', output_dir=net_dir)
+    edges_h5 = h5py.File('{}/tmp_edges.h5'.format(net_dir), 'r')
+    edges_grp = edges_h5['/edges/NET1_to_NET1']
+    assert(len(edges_grp['edge_type_id']) == net.nedges)
+    for prop in ['syn_weight', 'sec_id', 'sec_x']:
+        # both connection-maps are in the same group, make sure the values of each edge-type match
+        vals = edges_grp['0'][prop][()]
+        assert(np.allclose(vals[edges_grp['edge_type_id'][()] == 100], vals[edges_grp['edge_type_id'][()] == 101]))
+
+    src_ids = edges_grp['source_node_id'][()]
+    trg_ids = edges_grp['target_node_id'][()]
+    assert(np.allclose(edges_grp['0']['syn_weight'][()], src_ids*0.5 + (trg_ids - 20)))
+    assert(np.all(edges_grp['0']['sec_id'][()] == src_ids))
+
+
+def test_parallel_build():
+    def build_net(nprocs):
+        net = NetworkBuilder('NET1')
+        net.add_nodes(N=50, ei='e')
+        net.add_nodes(N=50, ei='i')
+        for src, trg in [('e', 'e'), ('e', 'i'), ('i', 'e'), ('i', 'i')]:
+            cm = net.add_edges(source={'ei': src}, target={'ei': trg},
+                               connection_rule=lambda s, t: np.random.randint(0, 3))
+            cm.add_properties('syn_weight', rule=lambda s, t: np.random.rand(), dtypes=float)
+        net.build(nprocs=nprocs, seed=100)
+        return net
+
+    serial_net = build_net(nprocs=1)
+    parallel_net = build_net(nprocs=3)
+    assert(serial_net.nedges == parallel_net.nedges)
+    for serial_et, parallel_et in zip(serial_net.edges_table(), parallel_net.edges_table()):
+        serial_edges = serial_et['syn_table'].edges()
+        parallel_edges = parallel_et['syn_table'].edges()
+        for serial_arr, parallel_arr in zip(serial_edges, parallel_edges):
+            assert(np.all(serial_arr == parallel_arr))
+
+        serial_weights = serial_et['params']['syn_weight'].get_values(*serial_edges[:2])
+        parallel_weights = parallel_et['params']['syn_weight'].get_values(*parallel_edges[:2])
+        assert(np.all(serial_weights == parallel_weights))
+
+
+def test_parallel_build_unseeded():
+    # Without a seed the forked workers must still not draw the same random connections for every connection map
+    net = NetworkBuilder('NET1')
+    net.add_nodes(N=50, ei='e')
+    for _ in range(4):
+        net.add_edges(source={'ei': 'e'}, target={'ei': 'e'}, connection_rule=lambda s, t: np.random.randint(0, 3))
+    net.build(nprocs=4)
+
+    edge_tables = [et['syn_table'].edges() for et in net.edges_table()]
+    assert(len(edge_tables) == 4)
+    for i in range(1, 4):
+        assert(len(edge_tables[i][2]) != len(edge_tables[0][2]) or np.any(edge_tables[i][2] != edge_tables[0][2]))
+
+
+def test_streaming_save_edges():
+    def build_net():
+        net = NetworkBuilder('NET1')
+        net.add_nodes(N=30, ei='e')
+        net.add_nodes(N=20, ei='i')
+        net.add_edges(source={'ei': 'e'}, target={'ei': 'i'}, connection_rule=lambda s, t: (s.node_id + t.node_id) % 3)
+        cm = net.add_edges(source={'ei': 'i'}, target={'ei': 'e'}, connection_rule=lambda s, t: t.node_id % 2)
+        cm.add_properties('syn_weight', rule=lambda s, t: float(s.node_id*100 + t.node_id), dtypes=float)
+        net.add_edges(source={'ei': 'e'}, target={'ei': 'e'}, connection_rule=1)
+        return net
+
+    def read_edges(edges_file):
+        edges_h5 = h5py.File(edges_file, 'r')
+        pop_grp = edges_h5['/edges/NET1_to_NET1']
+        edges = []
+        for i, (grp_id, grp_idx) in enumerate(zip(pop_grp['edge_group_id'], pop_grp['edge_group_index'])):
+            grp = pop_grp[str(grp_id)]
+            edges.append((pop_grp['source_node_id'][i], pop_grp['target_node_id'][i], pop_grp['edge_type_id'][i]) +
+                         tuple(grp[col][grp_idx] for col in sorted(grp.keys())))
+
+        # check every edge of a target can be found from the index
+        trg_ids = pop_grp['target_node_id'][()]
+        node_id_to_range = pop_grp['indicies/target_to_source/node_id_to_range'][()]
+        range_to_edge_id = pop_grp['indicies/target_to_source/range_to_edge_id'][()]
+        for node_id, (rng_beg, rng_end) in enumerate(node_id_to_range):
+            edge_ids = [e for r in range(rng_beg, rng_end) for e in range(*range_to_edge_id[r])]
+            assert(sorted(edge_ids) == list(np.flatnonzero(trg_ids == node_id)))
+        return sorted(edges)
+
+    net_dir = tempfile.mkdtemp()
+    built_net = build_net()
+    built_net.build()
+    built_net.save_edges(output_dir=os.path.join(net_dir, 'built'))
+
+    streamed_net = build_net()
+    streamed_net.save_edges(output_dir=os.path.join(net_dir, 'streamed'), max_memory=1)
+    assert(streamed_net.edges_built is False)
+
+    built_edges = read_edges(os.path.join(net_dir, 'built', 'NET1_NET1_edges.h5'))
+    streamed_edges = read_edges(os.path.join(net_dir, 'streamed', 'NET1_NET1_edges.h5'))
+    assert(built_edges == streamed_edges)
+    shutil.rmtree(net_dir)
+
+
+def test_spatial_distance_connector():
+    from bmtk.builder.auxi.edge_connectors import spatial_distance_connector
+
+    np.random.seed(1)
+    net = NetworkBuilder('NET1')
+    net.add_nodes(N=200, positions=np.random.uniform(0.0, 100.0, (200, 3)), ei='e')
+    net.add_edges(source={'ei': 'e'}, target={'ei': 'e'}, iterator='all_to_all',
+                  connection_rule=spatial_distance_connector,
+                  connection_params={'d_weight_min': 0.0, 'd_weight_max': 1.0, 'd_max': 20.0, 'nsyn_min': 1,
+                                     'nsyn_max': 3})
+    net.build()
+    assert(net.nedges > 0)
+
+    positions = {n.node_id: np.array(n['positions']) for n in net.nodes()}
+    src_ids, trg_ids, nsyns = net.edges_table()[0]['syn_table'].edges()
+    distances = np.array([np.linalg.norm(positions[s] - positions[t]) for s, t in zip(src_ids, trg_ids)])
+    assert(np.all(distances <= 20.0))
+    assert(np.all(src_ids != trg_ids))
+    assert(np.all((nsyns >= 1) & (nsyns <= 3)))
+
+
+@pytest.mark.parametrize('connector,params', [
+    ('fixed_indegree_connector', {'indegree': 20}),
+    ('fixed_outdegree_connector', {'outdegree': 150}),
+    ('binomial_connector', {'p': 0.1}),
+    ('fixed_total_connector', {'n_edges': 5000})
+])
+def test_sampling_connectors(connector, params):
+    from bmtk.builder.auxi import edge_connectors
+
+    def build_edges(seed):
+        net = NetworkBuilder('NET1')
+        net.add_nodes(N=200, ei='e')
+        net.add_nodes(N=50, ei='i')
+        net.add_edges(source={'ei': 'e'}, target={'ei': 'e'}, iterator='all_to_all',
+                      connection_rule=getattr(edge_connectors, connector), connection_params=dict(params, nsyns=2))
+        net.build(seed=seed)
+        return net.edges_table()[0]['syn_table'].edges()
+
+    src_ids, trg_ids, nsyns = build_edges(seed=10)
+    assert(np.all(src_ids != trg_ids) and np.all(src_ids < 200) and np.all(trg_ids < 200))
+    assert(len(set(zip(src_ids, trg_ids))) == len(src_ids))
+    assert(np.all(nsyns == 2))
+    if connector == 'fixed_indegree_connector':
+        assert(np.all(np.bincount(trg_ids) == 20))
+    elif connector == 'fixed_outdegree_connector':
+        assert(np.all(np.bincount(src_ids) == 150))
+    elif connector == 'fixed_total_connector':
+        assert(len(src_ids) == 5000)
+    else:
+        assert(3000 < len(src_ids) < 5000)
+
+    assert(all(np.array_equal(a, b) for a, b in zip(build_edges(seed=10), (src_ids, trg_ids, nsyns))))
+
+
+def test_import_nodes():
+    net_dir = tempfile.mkdtemp()
+    net = NetworkBuilder('V1')
+    net.add_nodes(N=10, ei='e', model_type='biophysical', x=np.arange(10.0))
+    net.add_nodes(N=5, ei='i', model_type='point', x=np.arange(10.0, 15.0), tuning=np.arange(5))
+    net.build()
+    net.save_nodes(output_dir=net_dir)
+
+    imported_net = NetworkBuilder('V1')
+    imported_net.import_nodes(nodes_file_name=os.path.join(net_dir, 'V1_nodes.h5'),
+                              node_types_file_name=os.path.join(net_dir, 'V1_node_types.csv'))
+    assert(len(imported_net.nodes()) == 15)
+    assert(len(imported_net.nodes(ei='i')) == 5)
+    assert(len(imported_net.nodes(model_type='biophysical', x=3.0)) == 1)
+    assert(len(imported_net.nodes(tuning=[1, 2])) == 2)
+
+    nodes = list(imported_net.nodes(ei='i'))
+    assert([n.node_id for n in nodes] == list(range(10, 15)))
+    assert(nodes[0]['x'] == 10.0 and nodes[0]['tuning'] == 0 and nodes[0]['model_type'] == 'point')
+    assert(list(imported_net.nodes().columns()['x']) == list(np.arange(15.0)))
+
+    # imported nodes can be used as the targets of another network
+    inputs = NetworkBuilder('LGN')
+    inputs.add_nodes(N=3, model_type='virtual')
+    inputs.add_edges(source=inputs.nodes(), target=imported_net.nodes(ei='e'), connection_rule=2)
+    inputs.build()
+    assert(inputs.nedges == 3*10*2)
+    shutil.rmtree(net_dir)
+
+
+class _RuleCalls(object):
+    count = 0
+
+
+def _counted_rule(source, target, nsyns):
+    _RuleCalls.count += 1
+    return nsyns
+
+
+def _build_cached_network(cache_dir, nsyns_e, nsyns_i):
+    net = NetworkBuilder('NET1')
+    net.add_nodes(N=20, ei='e', x=np.arange(20.0))
+    net.add_nodes(N=10, ei='i', x=np.arange(10.0))
+    net.add_edges(source={'ei': 'e'}, target={'ei': 'i'}, connection_rule=_counted_rule,
+                  connection_params={'nsyns': nsyns_e})
+    cm = net.add_edges(source={'ei': 'i'}, target={'ei': 'e'}, connection_rule=_counted_rule,
+                       connection_params={'nsyns': nsyns_i})
+    cm.add_properties('syn_weight', rule=lambda s, t: np.random.uniform(0.0, 1.0, len(t)), dtypes=float,
+                      vectorized=True)
+    net.build(seed=100, cache_dir=cache_dir)
+    return net
+
+
+def test_build_cache():
+    cache_dir = tempfile.mkdtemp()
+    _RuleCalls.count = 0
+    net = _build_cached_network(cache_dir, 2, 3)
+    assert(_RuleCalls.count == 2*20*10)
+    assert(len(os.listdir(cache_dir)) == 2)
+    edges = [(e.source_gid, e.target_gid, e.synaptic_properties) for e in net.edges()]
+
+    # nothing changed, both connection maps are loaded from the cache
+    _RuleCalls.count = 0
+    net = _build_cached_network(cache_dir, 2, 3)
+    assert(_RuleCalls.count == 0)
+    assert(net.nedges == 20*10*2 + 10*20*3)
+    assert([(e.source_gid, e.target_gid, e.synaptic_properties) for e in net.edges()] == edges)
+
+    # only the connection map with a changed parameter is rebuilt
+    _RuleCalls.count = 0
+    net = _build_cached_network(cache_dir, 2, 1)
+    assert(_RuleCalls.count == 10*20)
+    assert(net.nedges == 20*10*2 + 10*20*1)
+    assert(len(os.listdir(cache_dir)) == 3)
+    shutil.rmtree(cache_dir)
+
+
+_HELPER_SRC = """
+import functools
+
+def nsyns_helper(source, target):
+    return {}
+
+def countdown(n):
+    return 0 if n == 0 else countdown(n - 1)
+
+def helper_rule(source, target):
+    return nsyns_helper(source, target) + countdown(2)
+
+partial_helper = functools.partial(nsyns_helper, target=None)
+
+def partial_rule(source, target):
+    return partial_helper(source)
+"""
+
+
+def test_build_cache_helpers():
+    # editing a helper function called by a rule must invalidate the cached edges
+    cache_dir = tempfile.mkdtemp()
+    for nsyns in [1, 2, 2]:
+        rule_globals = {}
+        exec(_HELPER_SRC.format(nsyns), rule_globals)
+        for rule in ['helper_rule', 'partial_rule']:
+            net = NetworkBuilder('NET1')
+            net.add_nodes(N=10, ei='e')
+            net.add_edges(source={'ei': 'e'}, target={'ei': 'e'}, connection_rule=rule_globals[rule])
+            net.build(cache_dir=cache_dir)
+            assert(net.nedges == 10*10*nsyns)
+
+    assert(len(os.listdir(cache_dir)) == 4)
+    shutil.rmtree(cache_dir)
+
+def test_build_cache_imported_nodes():
+    # changing the properties of imported nodes, with the same node ids, must not reuse the cached edges
+    net_dir = tempfile.mkdtemp()
+    cache_dir = os.path.join(net_dir, 'cache')
+    for x_offset, n_edges in [(0.0, 0), (10.0, 8)]:
+        nodes_dir = os.path.join(net_dir, str(x_offset))
+        net = NetworkBuilder('V1')
+        net.add_nodes(N=8, ei='e', x=np.arange(8.0) + x_offset)
+        net.build()
+        net.save_nodes(output_dir=nodes_dir)
+
+        imported_net = NetworkBuilder('V1')
+        imported_net.import_nodes(nodes_file_name=os.path.join(nodes_dir, 'V1_nodes.h5'),
+                                  node_types_file_name=os.path.join(nodes_dir, 'V1_node_types.csv'))
+        inputs = NetworkBuilder('LGN')
+        inputs.add_nodes(N=1, model_type='virtual')
+        inputs.add_edges(source=inputs.nodes(), target=imported_net.nodes(),
+                         connection_rule=lambda s, t: 1 if t['x'] >= 10.0 else 0)
+        inputs.build(cache_dir=cache_dir)
+        assert(inputs.nedges == n_edges)
+
+    assert(len(os.listdir(cache_dir)) == 2)
+    shutil.rmtree(net_dir)
+
+
+def test_build_report():
+    net_dir = tempfile.mkdtemp()
+    net = NetworkBuilder('NET1')
+    net.add_nodes(N=20, ei='e')
+    net.add_nodes(N=10, ei='i')
+    net.add_edges(source={'ei': 'e'}, target={'ei': 'i'}, connection_rule=2)
+    net.add_edges(source={'ei': 'i'}, target={'ei': 'e'},
+                  connection_rule=lambda s, t: 1 if t.node_id % 2 == 0 else 0)
+    net.build(profile=True)
+    net.save(output_dir=net_dir)
+
+    with open(os.path.join(net_dir, 'NET1_build_report.json')) as json_file:
+        records = json.load(json_file)['records']
+    cm_records = [r for r in records if r['stage'] == 'connection_map']
+    assert([r['cm_index'] for r in cm_records] == [0, 1])
+    assert([r['max_pairs'] for r in cm_records] == [200, 200])
+    assert([r['edges'] for r in cm_records] == [200, 100])
+    assert([r['synapses'] for r in cm_records] == [400, 100])
+    assert(all(r['wall_time'] >= 0.0 for r in records))
+    assert(all(r['rss'] is None or r['rss'] > 0 for r in records))
+    assert(set(r['stage'] for r in records) == {'build_nodes', 'connection_map', 'build', 'save_nodes', 'save_edges'})
+
+    report_df = pd.read_csv(os.path.join(net_dir, 'NET1_build_report.csv'), sep=' ')
+    assert(len(report_df) == len(records))
+    shutil.rmtree(net_dir)
+
+
+def test_save_compressed():
+    net_dir = tempfile.mkdtemp()
+    net = NetworkBuilder('NET1')
+    net.add_nodes(N=100, ei='e', x=np.linspace(0.0, 1.0, 100), depth=np.arange(100)*1000)
+    net.add_nodes(N=50, ei='i', x=np.arange(50.0), depth=np.arange(50))
+    cm = net.add_edges(source={'ei': 'e'}, target={'ei': 'i'}, connection_rule=lambda s, t: (s.node_id + t.node_id) % 3)
+    cm.add_properties('syn_weight', rule=lambda s, t: float(s.node_id) + 0.5, dtypes=float)
+    net.build()
+    net.save(output_dir=os.path.join(net_dir, 'default'))
+    net.save(output_dir=os.path.join(net_dir, 'compressed'), chunks=16, compression='gzip', shuffle=True,
+             narrow_dtypes=True)
+    net.save_edges(output_dir=os.path.join(net_dir, 'lzf'), compression='lzf', max_memory=1)
+    net.save_edges(output_dir=os.path.join(net_dir, 'chunked'), chunks=(8,), max_memory=1)
+
+    with h5py.File(os.path.join(net_dir, 'compressed', 'NET1_nodes.h5'), 'r') as h5:
+        pop_grp = h5['/nodes/NET1']
+        assert(pop_grp['node_id'].dtype == np.uint32)
+        assert(pop_grp['node_id'].compression == 'gzip' and pop_grp['node_id'].shuffle)
+        assert(pop_grp['node_id'].chunks == (16,))
+        assert(pop_grp['0/depth'].dtype == np.int32)
+        assert(pop_grp['0/x'].dtype == np.float64)  # linspace values aren't exact as float32
+
+    with h5py.File(os.path.join(net_dir, 'compressed', 'NET1_NET1_edges.h5'), 'r') as h5:
+        pop_grp = h5['/edges/NET1_to_NET1']
+        assert(pop_grp['target_node_id'].dtype == np.uint32)
+        assert(pop_grp['0/syn_weight'].dtype == np.float32)
+
+    # the sonata readers see the same nodes and edges
+    def read_network(output_dir, edges_dir=None):
+        edges_dir = edges_dir or output_dir
+        net_file = sonata.File(data_files=[os.path.join(output_dir, 'NET1_nodes.h5'),
+                                           os.path.join(edges_dir, 'NET1_NET1_edges.h5')],
+                               data_type_files=[os.path.join(output_dir, 'NET1_node_types.csv'),
+                                                os.path.join(edges_dir, 'NET1_NET1_edge_types.csv')])
+        nodes = [(n.node_id, n['x'], n['depth']) for n in net_file.nodes['NET1']]
+        edges = sorted((e.source_node_id, e.target_node_id, e['syn_weight']) for e in net_file.edges['NET1_to_NET1'])
+        return nodes, edges
+
+    default_nodes, default_edges = read_network(os.path.join(net_dir, 'default'))
+    assert(read_network(os.path.join(net_dir, 'compressed')) == (default_nodes, default_edges))
+    assert(read_network(os.path.join(net_dir, 'default'), os.path.join(net_dir, 'lzf'))[1] == default_edges)
+    assert(read_network(os.path.join(net_dir, 'default'), os.path.join(net_dir, 'chunked'))[1] == default_edges)
+    with h5py.File(os.path.join(net_dir, 'chunked', 'NET1_NET1_edges.h5'), 'r') as h5:
+        assert(h5['/edges/NET1_to_NET1/target_node_id'].chunks == (8,))
+    with h5py.File(os.path.join(net_dir, 'lzf', 'NET1_NET1_edges.h5'), 'r') as h5:
+        assert(h5['/edges/NET1_to_NET1/target_node_id'].chunks[0] <= 2**20)
+    shutil.rmtree(net_dir)
+
+
+def test_gap_junctions():
+    net_dir = tempfile.mkdtemp()
+    net = NetworkBuilder('NET1', gj_id_start=100)
+    net.add_nodes(N=10, model_type='biophysical')
+    net.add_gap_junctions(source={'model_type': 'biophysical'}, target={'model_type': 'biophysical'},
+                          iterator='one_to_one',
+                          connection_rule=lambda s, t: 1 if abs(s.node_id - t.node_id) == 1 else 0, symmetric=True)
+    net.build()
+    net.save_edges(output_dir=net_dir)
+
+    with h5py.File(os.path.join(net_dir, 'NET1_gap_juncs.h5'), 'r') as h5:
+        assert(list(h5['source_ids'][()]) == list(range(9)))
+        assert(list(h5['target_ids'][()]) == list(range(1, 10)))
+        assert(list(h5['src_gap_ids'][()]) == list(range(100, 118, 2)))
+        assert(list(h5['trg_gap_ids'][()]) == list(range(101, 119, 2)))
+    shutil.rmtree(net_dir)
+
+
+def test_gap_junctions_cache():
+    # changing only symmetric must not reuse the cached gap junctions
+    net_dir = tempfile.mkdtemp()
+    cache_dir = os.path.join(net_dir, 'cache')
+    for symmetric, n_gap_juncs in [(False, 18), (True, 9)]:
+        net = NetworkBuilder('NET1')
+        net.add_nodes(N=10, model_type='biophysical')
+        net.add_gap_junctions(source={'model_type': 'biophysical'}, target={'model_type': 'biophysical'},
+                              iterator='one_to_one',
+                              connection_rule=lambda s, t: 1 if abs(s.node_id - t.node_id) == 1 else 0,
+                              symmetric=symmetric)
+        net.build(cache_dir=cache_dir)
+        net.save_edges(output_dir=net_dir)
+        with h5py.File(os.path.join(net_dir, 'NET1_gap_juncs.h5'), 'r') as h5:
+            assert(len(h5['source_ids']) == n_gap_juncs)
+
+    assert(len(os.listdir(cache_dir)) == 2)
+    shutil.rmtree(net_dir)
+
+def test_append_edges():
+    net_dir = tempfile.mkdtemp()
+
+    def build_network(connections):
+        net = NetworkBuilder('NET1')
+        net.add_nodes(N=50, ei='e')
+        net.add_nodes(N=50, ei='i')
+        for edge_type_id, src, trg, nsyns in connections:
+            cm = net.add_edges(source={'ei': src}, target={'ei': trg}, connection_rule=nsyns,
+                               edge_type_id=edge_type_id, model_template='exp2syn')
+            cm.add_properties('syn_weight', rule=float(edge_type_id), dtypes=float)
+        net.build()
+        return net
+
+    def read_edges(edges_file, edge_types_file, population='NET1_to_NET1', target_id=75):
+        edges_h5 = sonata.File(data_files=[os.path.join(net_dir, 'NET1_nodes.h5'), edges_file],
+                               data_type_files=[os.path.join(net_dir, 'NET1_node_types.csv'), edge_types_file])
+        edges = edges_h5.edges[population]
+        edges_list = sorted((e.source_node_id, e.target_node_id, e.edge_type_id, e['syn_weight'], e['model_template'])
+                            for e in edges)
+        trg_edges = sorted((e.source_node_id, e.edge_type_id) for e in edges.get_target(target_id))
+        del edges_h5, edges
+        gc.collect()  # closes the files
+        return edges_list, trg_edges
+
+    edges_file = os.path.join(net_dir, 'NET1_NET1_edges.h5')
+    edge_types_file = os.path.join(net_dir, 'NET1_NET1_edge_types.csv')
+    net = build_network([(100, 'e', 'i', 1)])
+    net.save_nodes(output_dir=net_dir)
+    net.save_edges(output_dir=net_dir)
+
+    # add edges to the existing population
+    net = build_network([(101, 'i', 'i', 2)])
+    net.save_edges(output_dir=net_dir, append=True)
+    full_net = build_network([(100, 'e', 'i', 1), (101, 'i', 'i', 2)])
+    full_net.save_edges(output_dir=os.path.join(net_dir, 'full'))
+    appended_edges, appended_trg_edges = read_edges(edges_file, edge_types_file)
+    full_edges, full_trg_edges = read_edges(os.path.join(net_dir, 'full', 'NET1_NET1_edges.h5'),
+                               os.path.join(net_dir, 'full', 'NET1_NET1_edge_types.csv'))
+    assert(len(appended_edges) == 50*50 + 50*50*2)
+    assert(appended_edges == full_edges)
+    assert(appended_trg_edges == full_trg_edges)
+    with h5py.File(edges_file, 'r') as h5:
+        assert(set(h5['/edges/NET1_to_NET1'].keys()) == {'0', 'edge_group_id', 'edge_group_index', 'edge_type_id',
+                                                          'indicies', 'source_node_id', 'target_node_id'})
+
+    # add a new population to the file
+    net = build_network([(102, 'e', 'e', 1)])
+    net.save_edges(output_dir=net_dir, name='NET1_extra', append=True)
+    extra_edges, _ = read_edges(edges_file, edge_types_file, population='NET1_extra', target_id=25)
+    assert(len(extra_edges) == 50*50 and all(e[2] == 102 for e in extra_edges))
+    assert(read_edges(edges_file, edge_types_file)[0] == full_edges)
+
+    # an edge type id can't be re-used with different properties
+    net = NetworkBuilder('NET1')
+    net.add_nodes(N=100)
+    net.add_edges(connection_rule=1, edge_type_id=100, model_template='alpha')
+    net.build()
+    with pytest.raises(Exception):
+        net.save_edges(output_dir=net_dir, append=True)
+    shutil.rmtree(net_dir)
+
+
 @pytest.mark.xfail
 def test_save_multinetwork_1():
     net1 = NetworkBuilder('NET1')
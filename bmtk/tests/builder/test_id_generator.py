@@ -34,3 +34,12 @@ def test_remove():
     assert(generator.next() == 103)
     assert(generator.next() == 105)
     assert(generator.next() == 107)
+
+
+def test_next_ids():
+    generator = IDGenerator(init_val=10)
+    generator.remove_ids([12, 13, 16, 30])
+    ids = generator.next_ids(5)
+    assert(list(ids) == [10, 11, 14, 15, 17])
+    assert(generator.next() == 18)
+    assert(list(generator.next_ids(3)) == [19, 20, 21])
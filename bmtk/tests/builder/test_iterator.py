@@ -1,5 +1,6 @@
 import pytest
 import itertools
+import numpy as np
 
 from bmtk.builder import connector, iterator
 from bmtk.builder import NetworkBuilder
@@ -124,3 +125,33 @@ def test_all2one_list(net):
     for v in itr(net.nodes(ei='i'), net.nodes(ei='e'), conr):
         src_id, trg_id, val = v
         assert(src_id == val)
+
+
+def test_all2all_matrix(net):
+    def connector_fnc(sources, targets):
+        assert(len(sources) == 100)
+        assert(len(targets) == 50)
+        assert(np.all(sources['ei'] == 'i'))
+        return np.equal.outer(sources['x'], targets['x']).astype(np.uint8)*3
+
+    conr = connector.create(connector_fnc)
+    assert(iterator.is_vectorized('all_to_all', conr))
+    itr = iterator.create_block_iterator('all_to_all', conr)
+    blocks = list(itr(net.nodes(ei='i'), net.nodes(ei='e'), conr))
+    assert(len(blocks) == 1)
+    src_ids, trg_ids, nsyns = blocks[0]
+    assert(np.all(src_ids == np.arange(50)))
+    assert(np.all(trg_ids == np.arange(100, 150)))
+    assert(np.all(nsyns == 3))
+
+
+def test_all2all_triple(net):
+    def connector_fnc(sources, targets, n):
+        return np.arange(n), np.arange(n)[::-1], np.full(n, 2)
+
+    conr = connector.create(connector_fnc, n=10)
+    itr = iterator.create('all_to_all', conr)
+    edges = list(itr(net.nodes(ei='i'), net.nodes(ei='e'), conr))
+    assert(len(edges) == 10)
+    assert(edges[0] == (0, 109, 2))
+    assert(edges[-1] == (9, 100, 2))
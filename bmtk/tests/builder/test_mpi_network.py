@@ -0,0 +1,115 @@
+import os
+import gc
+import tempfile
+import shutil
+import pytest
+import h5py
+
+pytest.importorskip('mpi4py')
+from bmtk.builder.networks import mpi_network
+from bmtk.builder import NetworkBuilder
+from bmtk.utils import sonata
+
+
+class RecordingComm(object):
+    """Stands in for the communicator of one rank, recording the collective calls made by that rank."""
+    def __init__(self, rank, output_dir):
+        self.rank = rank
+        self.output_dir = output_dir
+        self.calls = []
+
+    def Barrier(self):
+        self.calls.append('Barrier')
+
+    def gather(self, obj, root=0):
+        self.calls.append('gather')
+        return [obj, []] if self.rank == root else None
+
+    def bcast(self, obj, root=0):
+        self.calls.append('bcast')
+        return obj if self.rank == root else self.output_dir
+
+
+def test_save_nodes_profile(monkeypatch):
+    # every rank has to make the same sequence of collective calls, otherwise saving the report deadlocks
+    output_dir = tempfile.mkdtemp()
+    rank_calls = []
+    for r in [0, 1]:
+        comm = RecordingComm(r, output_dir)
+        monkeypatch.setattr(mpi_network, 'comm', comm)
+        monkeypatch.setattr(mpi_network, 'rank', r)
+        monkeypatch.setattr(mpi_network, 'nprocs', 2)
+
+        net = mpi_network.MPINetwork('NET1')
+        net.add_nodes(N=10, ei='e')
+        net.build(profile=True)
+        net.save_nodes(output_dir=output_dir)
+        rank_calls.append(comm.calls)
+
+    assert(rank_calls[0] == rank_calls[1])
+    assert('gather' in rank_calls[0])
+    shutil.rmtree(output_dir)
+
+
+def test_save_edges_merge(monkeypatch):
+    # the edges file merged from the shards of every rank should have the same edges as a DenseNetwork
+    net_dir = tempfile.mkdtemp()
+    monkeypatch.setattr(mpi_network.MPINetwork, 'merge_chunk_size', 100)
+
+    def build_network(network_cls):
+        net = network_cls('NET1')
+        net.add_nodes(N=50, ei='e')
+        net.add_nodes(N=50, ei='i')
+        for edge_type_id, src, trg, nsyns in [(100, 'e', 'i', 1), (101, 'i', 'i', 2), (102, 'i', 'e', 1)]:
+            cm = net.add_edges(source={'ei': src}, target={'ei': trg}, connection_rule=nsyns,
+                               edge_type_id=edge_type_id, model_template='exp2syn')
+            if edge_type_id == 102:
+                cm.add_properties('delay', rule=lambda s, t: float(s.node_id + t.node_id), dtypes=float)
+            else:
+                cm.add_properties('syn_weight', rule=lambda s, t: float(s.node_id*t.node_id), dtypes=float)
+        net.build()
+        return net
+
+    def read_edges(edges_dir):
+        edges_h5 = sonata.File(data_files=[os.path.join(net_dir, 'NET1_nodes.h5'),
+                                           os.path.join(edges_dir, 'NET1_NET1_edges.h5')],
+                               data_type_files=[os.path.join(net_dir, 'NET1_node_types.csv'),
+                                                os.path.join(edges_dir, 'NET1_NET1_edge_types.csv')])
+        edges = edges_h5.edges['NET1_to_NET1']
+
+        def edge_values(e):
+            return (e.source_node_id, e.target_node_id, e.edge_type_id, e['model_template'],
+                    e['delay'] if e.edge_type_id == 102 else e['syn_weight'])
+
+        edges_list = sorted(edge_values(e) for e in edges)
+        trg_edges = [sorted(edge_values(e) for e in edges.get_target(i)) for i in range(100)]
+        src_edges = [sorted(edge_values(e) for e in edges.get_source(i)) for i in range(100)]
+        del edges_h5, edges
+        gc.collect()  # closes the files
+
+        with h5py.File(os.path.join(edges_dir, 'NET1_NET1_edges.h5'), 'r') as h5:
+            pop_grp = h5['/edges/NET1_to_NET1']
+            group_cols = sorted(tuple(sorted(g.keys())) for k, g in pop_grp.items() if k.isdigit())
+            index_grps = sorted(pop_grp['indicies'].keys())
+        return edges_list, trg_edges, src_edges, group_cols, index_grps
+
+    # run rank 1 first so its shard already exists when rank 0 merges the shards
+    mpi_dir = os.path.join(net_dir, 'mpi')
+    for r in [1, 0]:
+        monkeypatch.setattr(mpi_network, 'comm', RecordingComm(r, net_dir))
+        monkeypatch.setattr(mpi_network, 'rank', r)
+        monkeypatch.setattr(mpi_network, 'nprocs', 2)
+        net = build_network(mpi_network.MPINetwork)
+        net.save_edges(output_dir=mpi_dir)
+
+    assert(sorted(os.listdir(mpi_dir)) == ['NET1_NET1_edge_types.csv', 'NET1_NET1_edges.h5'])  # shards are removed
+
+    dense_net = build_network(NetworkBuilder)
+    dense_net.save_nodes(output_dir=net_dir)
+    dense_net.save_edges(output_dir=os.path.join(net_dir, 'dense'))
+
+    mpi_edges = read_edges(mpi_dir)
+    dense_edges = read_edges(os.path.join(net_dir, 'dense'))
+    assert(len(mpi_edges[0]) == 50*50 + 50*50*2 + 50*50)
+    assert(mpi_edges == dense_edges)
+    shutil.rmtree(net_dir)
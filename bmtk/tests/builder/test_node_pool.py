@@ -78,5 +78,36 @@ def test_failed_search():
     assert(len(node_pool) == 0)
 
 
+def test_list_and_function_search():
+    net = NetworkBuilder('NET1')
+    net.add_nodes(N=10, model='a', param1=range(10))
+    net.add_nodes(N=10, model='b', param1=range(10, 20))
+    net.add_nodes(N=10, model='c')
+    assert(len(net.nodes(model=['a', 'c'])) == 20)
+    assert(len(net.nodes(param1=[1, 11, 25])) == 2)
+    assert(len(net.nodes(param1=lambda p: p >= 15)) == 5)
+    assert(len(net.nodes(model='a', param1='1')) == 0)
+
+
+def test_mixed_type_search():
+    # a column mixing ints and strings must not be compared as strings
+    net = NetworkBuilder('NET1')
+    net.add_nodes(N=4, label=[1, '1', 2, 'b'])
+    net.add_nodes(N=2, label=['1', 'a'])
+    assert([n.node_id for n in net.nodes(label=1)] == [0])
+    assert([n.node_id for n in net.nodes(label='1')] == [1, 4])
+    assert([n.node_id for n in net.nodes(label=[2, 'a'])] == [2, 5])
+
+
+def test_cached_search():
+    net = NetworkBuilder('NET1')
+    net.add_nodes(N=10, ei='e')
+    net.add_nodes(N=5, ei='i')
+    assert([n.node_id for n in net.nodes(ei='e')] == list(range(10)))
+    assert([n.node_id for n in net.nodes(ei='e')] == list(range(10)))
+    assert([n.node_id for n in net.nodes(ei='i')] == list(range(10, 15)))
+    assert(list(net.nodes(ei='i').columns().node_ids) == list(range(10, 15)))
+
+
 if __name__ == '__main__':
     test_multi_search()
\ No newline at end of file
@@ -1,4 +1,5 @@
 import pytest
+import numpy as np
 from bmtk.builder.node_set import NodeSet
 from bmtk.builder.node import Node
 from bmtk.builder.id_generator import IDGenerator
@@ -49,6 +50,44 @@ def test_node():
     assert(node_1.params_hash == node_set1.params_hash)
 
 
+def test_node_set_columns():
+    node_set = NodeSet(N=1000, node_params={'x': np.arange(1000.0), 'y': list(range(1000))},
+                       node_type_properties={'ei': 'e', 'node_type_id': 1})
+    nodes = node_set.build(IDGenerator(10))
+    assert(nodes is node_set)
+    assert(list(node_set.column('node_id')[:3]) == [10, 11, 12])
+    assert(node_set.column('x').dtype == np.float64 and node_set.column('x')[5] == 5.0)
+    assert(list(node_set.column('ei')[:2]) == ['e', 'e'])
+    assert(node_set.column('z')[0] is None)
+
+    # Node objects are created as views of a row when accessed
+    node = nodes[999]
+    assert(isinstance(node, Node))
+    assert(node.node_id == 1009 and isinstance(node.node_id, int))
+    assert(node['x'] == 999.0 and node['y'] == 999 and node['ei'] == 'e')
+    assert(nodes[999] is not node)
+    assert([n.node_id for n in nodes][-2:] == [1008, 1009])
+
+
+def test_node_set_params_copied():
+    # params are copied into numpy columns once, changing the caller's lists afterwards doesn't change the nodes
+    depths = [10.0, 20.0, 30.0]
+    names = ['a', 'b', 'c']
+    mixed = [1, 'a', 2.5]
+    ragged = [[0], [0, 1], [0, 1, 2]]
+    node_set = NodeSet(N=3, node_params={'depth': depths, 'name': names, 'mixed': mixed, 'ragged': ragged},
+                       node_type_properties={'node_type_id': 1})
+    nodes = node_set.build(IDGenerator())
+    depths[0] = -1.0
+    names.append('d')
+
+    assert(node_set.column('depth').dtype == np.float64 and list(node_set.column('depth')) == [10.0, 20.0, 30.0])
+    assert(node_set.column('depth') is node_set.params_column('depth'))
+    assert(list(node_set.column('name')) == ['a', 'b', 'c'])
+    assert(node_set.column('mixed').dtype == object and list(node_set.column('mixed')) == [1, 'a', 2.5])
+    assert(nodes[2]['ragged'] == [0, 1, 2] and nodes[0]['depth'] == 10.0)
+
+
 if __name__ == '__main__':
     test_node_set()
     #test_node()
\ No newline at end of file
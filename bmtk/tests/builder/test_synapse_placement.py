@@ -0,0 +1,97 @@
+import os
+import shutil
+import tempfile
+import pytest
+import numpy as np
+import h5py
+
+from bmtk.builder import NetworkBuilder
+from bmtk.builder.bionet import SynapsePlacer, MorphologySegments
+
+
+def morphology_segments():
+    # soma (sec 0), two basal segments (sec 1) and three apical segments (sec 2), each segment is 10 um long
+    return MorphologySegments(sec_ids=[0, 1, 1, 2, 2, 2],
+                              sec_xs=[0.5, 0.25, 0.75, 1.0/6, 0.5, 5.0/6],
+                              seg_types=[1, 3, 3, 4, 4, 4],
+                              seg_dists=[0.0, 10.0, 20.0, 10.0, 20.0, 30.0],
+                              seg_lengths=[10.0]*6)
+
+
+def test_find_segments():
+    segments = morphology_segments()
+    seg_ix, probs = segments.find_segments(['basal', 'apical'], [0.0, 1.0e20])
+    assert(list(seg_ix) == [1, 2, 3, 4, 5])
+    assert(np.allclose(probs, 0.2))
+
+    # the segment from 15 to 25 um only half overlaps with the range
+    seg_ix, probs = segments.find_segments(['apical'], [0.0, 20.0])
+    assert(list(seg_ix) == [3, 4])
+    assert(np.allclose(probs, [2.0/3, 1.0/3]))
+
+    with pytest.raises(Exception):
+        segments.find_segments(['axonal'], [0.0, 100.0])
+
+
+def test_choose_sections():
+    segments = morphology_segments()
+    sec_ids, sec_xs = segments.choose_sections(['apical'], [0.0, 100.0], n_sections=1000,
+                                               prng=np.random.RandomState(1))
+    assert(len(sec_ids) == 1000)
+    assert(np.all(sec_ids == 2))
+    assert(set(sec_xs) == {1.0/6, 0.5, 5.0/6})
+
+
+def test_synapse_placer():
+    net_dir = tempfile.mkdtemp()
+    net = NetworkBuilder('NET1')
+    net.add_nodes(N=10, model_type='biophysical', morphology='cell_a.swc')
+    net.add_nodes(N=10, model_type='biophysical', morphology='cell_b.swc')
+    net.add_nodes(N=5, model_type='virtual')
+
+    cell_b = MorphologySegments(sec_ids=[0, 1], sec_xs=[0.5, 0.5], seg_types=[1, 3], seg_dists=[0.0, 100.0],
+                                seg_lengths=[10.0, 10.0])
+    placer = SynapsePlacer(['basal'], [0.0, 200.0], seed=100,
+                           morphologies={'cell_a.swc': morphology_segments(), 'cell_b.swc': cell_b})
+    cm = net.add_edges(source={'model_type': 'virtual'}, target={'model_type': 'biophysical'}, connection_rule=3)
+    cm.add_properties(['sec_id', 'sec_x'], rule=placer, dtypes=[np.int32, np.float64], vectorized=True)
+    net.build()
+    net.save_edges(output_dir=net_dir)
+
+    with h5py.File(os.path.join(net_dir, 'NET1_NET1_edges.h5'), 'r') as h5:
+        pop_grp = h5['/edges/NET1_to_NET1']
+        trg_ids = pop_grp['target_node_id'][()]
+        sec_ids = pop_grp['0/sec_id'][()]
+        sec_xs = pop_grp['0/sec_x'][()]
+
+    assert(len(trg_ids) == 5*20*3)
+    assert(sec_ids.dtype == np.int32)
+    assert(np.all(sec_ids[trg_ids < 10] == 1))
+    assert(set(sec_xs[trg_ids < 10]) == {0.25, 0.75})
+    assert(np.all(sec_ids[trg_ids >= 10] == 1))
+    assert(np.all(sec_xs[trg_ids >= 10] == 0.5))
+    shutil.rmtree(net_dir)
+
+
+def test_synapse_placer_parallel():
+    # a seeded placer shared by several connection maps places the same synapses in serial and parallel builds
+    def build_net(nprocs):
+        net = NetworkBuilder('NET1')
+        net.add_nodes(N=10, model_type='biophysical', morphology='cell_a.swc')
+        net.add_nodes(N=5, model_type='virtual')
+        placer = SynapsePlacer(['basal', 'apical'], [0.0, 200.0], seed=100,
+                               morphologies={'cell_a.swc': morphology_segments()})
+        for nsyns in [1, 2, 3]:
+            cm = net.add_edges(source={'model_type': 'virtual'}, target={'model_type': 'biophysical'},
+                               connection_rule=nsyns)
+            cm.add_properties(['sec_id', 'sec_x'], rule=placer, dtypes=[np.int32, np.float64], vectorized=True)
+        net.build(nprocs=nprocs)
+        return [(et['params']['sec_id'].get_values(*et['syn_table'].edges()[:2]),
+                 et['params']['sec_x'].get_values(*et['syn_table'].edges()[:2])) for et in net.edges_table()]
+
+    serial_syns = build_net(nprocs=1)
+    parallel_syns = build_net(nprocs=3)
+    assert(len(serial_syns) == len(parallel_syns) == 3)
+    for (serial_ids, serial_xs), (parallel_ids, parallel_xs) in zip(serial_syns, parallel_syns):
+        assert(np.array_equal(serial_ids, parallel_ids))
+        assert(np.array_equal(serial_xs, parallel_xs))
@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+import pytest
+import numpy as np
+import h5py
+
+from bmtk.utils import sonata
+
+
+@pytest.fixture
+def nodes_file():
+    tmp_dir = tempfile.mkdtemp()
+    nodes_h5 = os.path.join(tmp_dir, 'nodes.h5')
+    node_types_csv = os.path.join(tmp_dir, 'node_types.csv')
+    with h5py.File(nodes_h5, 'w') as h5:
+        h5['/'].attrs['magic'] = np.uint32(0x0A7A)
+        h5['/'].attrs['version'] = [np.uint32(0), np.uint32(1)]
+        pop_grp = h5.create_group('/nodes/V1')
+        pop_grp.create_dataset('node_id', data=np.arange(10, 20))
+        pop_grp.create_dataset('node_type_id', data=[100, 101]*5)
+        pop_grp.create_dataset('node_group_id', data=[0]*8 + [1]*2)
+        pop_grp.create_dataset('node_group_index', data=[7, 6, 5, 4, 3, 2, 1, 0, 0, 1])
+        pop_grp.create_dataset('0/depth', data=np.arange(8, dtype=float))
+        pop_grp.create_dataset('0/layer', data=['L4', 'L5', 'L5', 'L4']*2, dtype=h5py.string_dtype())
+        pop_grp.create_dataset('0/positions', data=[[float(i % 2), 0.0, 1.0] for i in range(8)])
+        pop_grp.create_dataset('1/tau', data=[1.0, 2.0])
+
+    with open(node_types_csv, 'w') as csv_file:
+        csv_file.write('node_type_id ei pop_name\n100 e Scnn1a\n101 i PV\n')
+
+    yield sonata.File(data_files=nodes_h5, data_type_files=node_types_csv)
+    shutil.rmtree(tmp_dir)
+
+
+def test_filter(nodes_file):
+    nodes = nodes_file.nodes['V1']
+    grp = nodes.get_group(0)
+
+    assert(list(grp.filter_indicies(ei='e')) == [0, 2, 4, 6])
+    assert(list(grp.filter_node_ids(ei='i', layer='L4')) == [13, 17])  # group rows 4 and 0
+    assert(list(grp.filter_node_ids(depth=[0.0, 7.0])) == [10, 17])
+    assert(list(grp.filter_node_ids(pop_name=['PV', 'Scnn1a'], node_ids=[11, 12, 19])) == [11, 12])
+    assert(list(grp.filter_node_ids(positions=[1.0, 0.0, 1.0])) == [10, 12, 14, 16])
+    assert(len(grp.filter_node_ids(ei='e', pop_name='PV')) == 0)
+
+    node_list = list(grp.filter(ei='i', depth=4.0))
+    assert(len(node_list) == 1)
+    assert(node_list[0].node_id == 13 and node_list[0]['pop_name'] == 'PV')
+
+    assert(list(nodes.filter_node_ids(ei='i')) == [11, 13, 15, 17, 19])
+    assert(list(nodes.filter_node_ids(pop_name='PV', node_id=[11, 14, 19])) == [11, 19])
+
+
+def test_column_cache_rows(nodes_file):
+    nodes = nodes_file.nodes['V1']
+    expected = [(n.node_id, n.node_type_id, n['depth'] if n.group_id == 0 else n['tau']) for n in nodes]
+    positions = nodes.get_node_id(12)['positions']
+
+    cache = nodes_file.nodes.enable_column_cache(10**6)
+    for _ in range(2):
+        assert([(n.node_id, n.node_type_id, n['depth'] if n.group_id == 0 else n['tau']) for n in nodes] == expected)
+    assert(cache.hits > 0 and cache.misses == len(cache))
+
+    node_positions = nodes.get_node_id(12)['positions']
+    assert(np.array_equal(node_positions, positions) and node_positions.flags.writeable)
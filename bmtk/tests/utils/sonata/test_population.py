@@ -0,0 +1,164 @@
+import os
+import shutil
+import tempfile
+import pytest
+import numpy as np
+import h5py
+
+from bmtk.utils import sonata
+from bmtk.utils.sonata.population import EdgePopulation
+from bmtk.utils.sonata.utils import create_index
+
+
+@pytest.fixture
+def edges_file():
+    # 12 edges, group 0 has a syn_weight and a sec_name, group 1 only a delay
+    tmp_dir = tempfile.mkdtemp()
+    edges_h5 = os.path.join(tmp_dir, 'edges.h5')
+    edge_types_csv = os.path.join(tmp_dir, 'edge_types.csv')
+    with h5py.File(edges_h5, 'w') as h5:
+        h5['/'].attrs['magic'] = np.uint32(0x0A7A)
+        h5['/'].attrs['version'] = [np.uint32(0), np.uint32(1)]
+        pop_grp = h5.create_group('/edges/V1_to_V1')
+        pop_grp.create_dataset('source_node_id', data=np.arange(12) % 4)
+        pop_grp.create_dataset('target_node_id', data=np.arange(12) // 4)
+        pop_grp.create_dataset('edge_type_id', data=[100, 101, 102]*4)
+        pop_grp.create_dataset('edge_group_id', data=[0, 0, 1]*4)
+        pop_grp.create_dataset('edge_group_index', data=[0, 1, 0, 2, 3, 1, 4, 5, 2, 6, 7, 3])
+        pop_grp.create_dataset('0/syn_weight', data=np.arange(8, dtype=float))
+        pop_grp.create_dataset('0/sec_name', data=['soma', 'dend']*4, dtype=h5py.string_dtype())
+        pop_grp.create_dataset('1/delay', data=[1.0, 2.0, 1.0, 2.0])
+        create_index(pop_grp['target_node_id'], pop_grp, index_type='target')
+        create_index(pop_grp['source_node_id'], pop_grp, index_type='source')
+
+    with open(edge_types_csv, 'w') as csv_file:
+        csv_file.write('edge_type_id model_template\n100 exp2syn\n101 exp2syn\n102 gap\n')
+
+    chunk_size = EdgePopulation.filter_chunk_size
+    EdgePopulation.filter_chunk_size = 5
+    yield sonata.File(data_files=edges_h5, data_type_files=edge_types_csv)
+    EdgePopulation.filter_chunk_size = chunk_size
+    shutil.rmtree(tmp_dir)
+
+
+def test_edges_filter(edges_file):
+    edges = edges_file.edges['V1_to_V1']
+    assert(list(edges.filter_indicies(edge_type_id=101)) == [1, 4, 7, 10])
+    assert(list(edges.filter_indicies(edge_type_id=[100, 102], group_id=1)) == [2, 5, 8, 11])
+    assert(list(edges.filter_indicies(model_template='exp2syn', sec_name='soma')) == [0, 3, 6, 9])
+    assert(list(edges.filter_indicies(syn_weight=[1.0, 6.0], model_template='exp2syn')) == [1, 9])
+    assert(list(edges.filter_indicies(delay=2.0)) == [5, 11])
+    assert(len(edges.filter_indicies(delay=2.0, edge_type_id=100)) == 0)
+    with pytest.raises(Exception):
+        edges.filter_indicies(tau=1.0)
+
+    edge_list = list(edges.filter(sec_name='dend', syn_weight=5.0))
+    assert(len(edge_list) == 1)
+    assert(edge_list[0].source_node_id == 3 and edge_list[0].target_node_id == 1 and edge_list[0]['syn_weight'] == 5.0)
+
+    cols = edges.filter_columns(['target_node_id', 'syn_weight', 'model_template'], model_template='exp2syn')
+    assert(list(cols['target_node_id']) == [0, 0, 0, 1, 1, 1, 2, 2])
+    assert(list(cols['syn_weight']) == list(range(8)))
+    assert(list(cols['model_template']) == ['exp2syn']*8)
+
+    cols = edges.filter_columns(delay=1.0)
+    assert(set(cols.keys()) == {'source_node_id', 'target_node_id', 'edge_type_id'})
+    assert(list(cols['source_node_id']) == [2, 0])
+    assert(list(cols['edge_type_id']) == [102, 102])
+    assert(len(edges.filter_columns(['delay'], delay=3.0)['delay']) == 0)
+
+
+@pytest.mark.parametrize('coalesce_gap', [0, 2**12])
+def test_get_target_columns(edges_file, coalesce_gap):
+    edges = edges_file.edges['V1_to_V1']
+    edges.coalesce_gap = coalesce_gap
+    cols = edges.get_target_columns([2, 0, 7], columns=['source_node_id', 'target_node_id', 'edge_type_id',
+                                                        'model_template'])
+    expected = [(e.source_node_id, e.target_node_id, e.edge_type_id) for e in edges.get_targets([2, 0])]
+    assert(list(zip(cols['source_node_id'], cols['target_node_id'], cols['edge_type_id'])) == expected)
+    assert(list(cols['model_template'][:3]) == ['gap', 'exp2syn', 'exp2syn'])
+
+    cols = edges.get_source_columns(np.array([1, 3]), columns=['target_node_id', 'edge_type_id'])
+    assert(list(cols['target_node_id']) == [0, 1, 2, 0, 1, 2])
+    assert(list(cols['edge_type_id']) == [101, 102, 100, 100, 101, 102])
+
+    grp_cols = edges.get_source_columns(2, columns=['target_node_id', 'syn_weight', 'sec_name', 'delay'],
+                                        by_group=True)
+    assert(set(grp_cols.keys()) == {0, 1})
+    assert(list(grp_cols[0]['target_node_id']) == [1, 2])
+    assert(list(grp_cols[0]['sec_name']) == ['soma', 'dend'] and 'delay' not in grp_cols[0])
+    assert(list(grp_cols[1]['target_node_id']) == [0] and list(grp_cols[1]['delay']) == [1.0])
+    with pytest.raises(Exception):
+        edges.get_source_columns(2, columns=['syn_weight'])
+
+    assert(len(edges.get_target_columns([], columns=['syn_weight'])['syn_weight']) == 0)
+
+
+def test_column_cache(edges_file):
+    edges = edges_file.edges['V1_to_V1']
+    cache = edges_file.edges.enable_column_cache(10**6)
+    assert(edges.column_cache is cache)
+
+    for _ in range(2):
+        assert(list(edges.filter_indicies(model_template='exp2syn', sec_name='soma')) == [0, 3, 6, 9])
+        cols = edges.get_source_columns([1, 3], columns=['target_node_id', 'edge_type_id'])
+        assert(list(cols['target_node_id']) == [0, 1, 2, 0, 1, 2])
+    assert(cache.misses == len(cache))  # every column was only read from the file once
+    assert(cache.hits > 0 and cache.evictions == 0)
+    assert(list(cache.get(edges._group_id_ds, None)) == [0, 0, 1]*4)
+
+    # budget only big enough for one int64 column at a time
+    cache = edges_file.edges.enable_column_cache(12*8)
+    assert(list(edges.filter_indicies(edge_type_id=[100, 102], group_id=1)) == [2, 5, 8, 11])
+    assert(len(cache) == 1 and cache.evictions > 0 and cache.nbytes <= cache.max_bytes)
+
+    edges_file.edges.disable_column_cache()
+    assert(edges.column_cache is None)
+    assert(list(edges.filter_indicies(delay=2.0)) == [5, 11])
+
+
+def test_column_cache_rows(edges_file):
+    edges = edges_file.edges['V1_to_V1']
+    expected = [(e.source_node_id, e.target_node_id, e.edge_type_id, e.group_id, e['syn_weight'] if e.group_id == 0
+                 else e['delay']) for e in edges.get_target(1)]
+    expected_row = edges.get_row(4)
+    expected_delays = list(edges.get_group(1).get_values('delay', all_rows=True))
+
+    cache = edges_file.edges.enable_column_cache(10**6)
+    for _ in range(2):
+        edges_list = [(e.source_node_id, e.target_node_id, e.edge_type_id, e.group_id,
+                       e['syn_weight'] if e.group_id == 0 else e['delay']) for e in edges.get_target(1)]
+        assert(edges_list == expected)
+    misses = cache.misses
+    assert(cache.hits > 0 and misses > 0)
+
+    row = edges.get_row(4)
+    assert(cache.misses == misses)  # every column get_row() reads has already been loaded by get_target()
+    assert((row.source_node_id, row.target_node_id, row['syn_weight'], row['sec_name']) ==
+           (expected_row.source_node_id, expected_row.target_node_id, expected_row['syn_weight'],
+            expected_row['sec_name']))
+    assert(list(edges.get_group(1).get_values('delay', all_rows=True)) == expected_delays)
+
+@pytest.mark.parametrize('node_ids', [None, [2, 0], [1]])
+def test_load_index(edges_file, node_ids):
+    edges = edges_file.edges['V1_to_V1']
+    trg_ids = [2, 0, 1, 7]
+    src_ids = [3, 1, 0, 2]
+    expected_trgs = [(e.source_node_id, e.target_node_id, e.edge_type_id) for e in edges.get_targets(trg_ids)]
+    expected_srcs = [(e.source_node_id, e.target_node_id, e.edge_type_id) for e in edges.get_sources(src_ids)]
+    expected_cols = edges.get_target_columns(trg_ids)
+
+    edges.load_index('target', node_ids=node_ids)
+    edges.load_index('source', node_ids=node_ids)
+    assert([(e.source_node_id, e.target_node_id, e.edge_type_id) for e in edges.get_targets(trg_ids)] == expected_trgs)
+    assert([(e.source_node_id, e.target_node_id, e.edge_type_id) for e in edges.get_sources(src_ids)] == expected_srcs)
+    assert([e.source_node_id for e in edges.get_target(2)] == [0, 1, 2, 3])
+    assert([e.target_node_id for e in edges.get_source(1)] == [0, 1, 2])
+    assert(len(list(edges.get_target(100))) == 0)
+    cols = edges.get_target_columns(trg_ids)
+    assert(all(np.array_equal(cols[c], expected_cols[c]) for c in expected_cols))
+
+    edges.unload_index('target')
+    assert([(e.source_node_id, e.target_node_id, e.edge_type_id) for e in edges.get_targets(trg_ids)] == expected_trgs)
+    with pytest.raises(Exception):
+        edges.load_index('edge_type')
@@ -0,0 +1,29 @@
+import pytest
+import numpy as np
+
+from bmtk.utils.sonata.utils import build_index_tables, narrow_dtype
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 1000])
+def test_build_index_tables(chunk_size):
+    node_ids = np.array([2, 2, 0, 0, 0, 2, 5, 5, 0])
+    node_id_to_range, range_to_edge_id = build_index_tables(node_ids, chunk_size=chunk_size)
+    assert(node_id_to_range.dtype == np.uint64 and range_to_edge_id.dtype == np.uint64)
+    assert(np.all(node_id_to_range == [[0, 2], [0, 0], [2, 4], [0, 0], [0, 0], [4, 5]]))
+    assert(np.all(range_to_edge_id == [[2, 5], [8, 9], [0, 2], [5, 6], [6, 8]]))
+
+
+def test_build_index_tables_empty():
+    node_id_to_range, range_to_edge_id = build_index_tables(np.zeros(0, dtype=np.uint64))
+    assert(node_id_to_range.shape == (0, 2))
+    assert(range_to_edge_id.shape == (0, 2))
+
+
+def test_narrow_dtype():
+    assert(narrow_dtype(np.arange(10, dtype=np.uint64)) == np.uint32)
+    assert(narrow_dtype(np.array([-1, 2**31 - 1], dtype=np.int64)) == np.int32)
+    assert(narrow_dtype(np.array([0, 2**32], dtype=np.uint64)) == np.uint64)
+    assert(narrow_dtype([0.5, 1.25, np.nan], dtype=np.float64) == np.float32)
+    assert(narrow_dtype(np.array([0.1, 0.2])) == np.float64)
+    assert(narrow_dtype(np.array([1, 2], dtype=np.uint16)) == np.uint16)
+    assert(narrow_dtype(np.zeros(0, dtype=np.int64)) == np.int64)
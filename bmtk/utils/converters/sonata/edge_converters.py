@@ -5,6 +5,7 @@ import pandas as pd
 import h5py
 
 from bmtk.utils.sonata.utils import add_hdf5_magic, add_hdf5_version
+from bmtk.utils.sonata import utils as sonata_utils
 
 
 column_renames = {
@@ -245,37 +246,4 @@ INDEX_SOURCE = 1
 
 
 def create_index(node_ids_ds, output_grp, index_type=INDEX_TARGET):
-    if index_type == INDEX_TARGET:
-        edge_nodes = np.array(node_ids_ds, dtype=np.int64)
-        output_grp = output_grp.create_group('indicies/target_to_source')
-    elif index_type == INDEX_SOURCE:
-        edge_nodes = np.array(node_ids_ds, dtype=np.int64)
-        output_grp = output_grp.create_group('indicies/source_to_target')
-
-    edge_nodes = np.append(edge_nodes, [-1])
-    n_targets = np.max(edge_nodes)
-    ranges_list = [[] for _ in range(n_targets + 1)]
-
-    n_ranges = 0
-    begin_index = 0
-    cur_trg = edge_nodes[begin_index]
-    for end_index, trg_gid in enumerate(edge_nodes):
-        if cur_trg != trg_gid:
-            ranges_list[cur_trg].append((begin_index, end_index))
-            cur_trg = int(trg_gid)
-            begin_index = end_index
-            n_ranges += 1
-
-    node_id_to_range = np.zeros((n_targets+1, 2))
-    range_to_edge_id = np.zeros((n_ranges, 2))
-    range_index = 0
-    for node_index, trg_ranges in enumerate(ranges_list):
-        if len(trg_ranges) > 0:
-            node_id_to_range[node_index, 0] = range_index
-            for r in trg_ranges:
-                range_to_edge_id[range_index, :] = r
-                range_index += 1
-            node_id_to_range[node_index, 1] = range_index
-
-    output_grp.create_dataset('range_to_edge_id', data=range_to_edge_id, dtype='uint64')
-    output_grp.create_dataset('node_id_to_range', data=node_id_to_range, dtype='uint64')
+    sonata_utils.create_index(node_ids_ds, output_grp, index_type='target' if index_type == INDEX_TARGET else 'source')
@@ -0,0 +1,136 @@
+# Copyright 2017. Allen Institute. All rights reserved
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the
+# following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following
+# disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided with the distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote
+# products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+import sys
+import weakref
+from collections import OrderedDict
+import numpy as np
+import h5py
+
+
+class ColumnCache(object):
+    """A least-recently-used cache of whole hdf5 columns (datasets) kept in memory as numpy arrays.
+
+    Columns are loaded in full the first time they are used and served from memory afterwards, as long as the cache
+    stays under max_bytes; when it goes over the columns that were used the longest time ago are dropped. Columns that
+    are larger than max_bytes by themselves are never cached. Cached arrays are read-only since they are shared.
+    """
+    def __init__(self, max_bytes):
+        self._max_bytes = int(max_bytes)
+        self._columns = OrderedDict()  # (file name, dataset path) --> (values, nbytes), least recently used first
+        self._nbytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        # id(dataset) --> (weakref, key, nbytes, is_string), looking these up in h5py costs more than reading one value
+        self._datasets_info = {}
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    @property
+    def hits(self):
+        return self._hits
+
+    @property
+    def misses(self):
+        return self._misses
+
+    @property
+    def evictions(self):
+        return self._evictions
+
+    def stats(self):
+        return {'hits': self._hits, 'misses': self._misses, 'evictions': self._evictions, 'columns': len(self),
+                'nbytes': self._nbytes, 'max_bytes': self._max_bytes}
+
+    def fits(self, dataset):
+        """True if the (estimated) size of the dataset is within the cache budget."""
+        return self._dataset_info(dataset)[1] <= self._max_bytes
+
+    def is_string(self, dataset):
+        return self._dataset_info(dataset)[2]
+
+    def get(self, dataset, loader):
+        """Returns all the values of dataset, calling loader(dataset) to read them if they aren't in the cache."""
+        key = self._key(dataset)
+        if key in self._columns:
+            # move to the end, the most recently used
+            entry = self._columns.pop(key)
+            self._columns[key] = entry
+            self._hits += 1
+            return entry[0]
+
+        self._misses += 1
+        values = loader(dataset)
+        nbytes = self._array_nbytes(values)
+        if nbytes > self._max_bytes:
+            return values
+
+        values.setflags(write=False)
+        self._columns[key] = (values, nbytes)
+        self._nbytes += nbytes
+        while self._nbytes > self._max_bytes:
+            _, (_, evicted_nbytes) = self._columns.popitem(last=False)
+            self._nbytes -= evicted_nbytes
+            self._evictions += 1
+
+        return values
+
+    def clear(self):
+        self._columns.clear()
+        self._nbytes = 0
+
+    def _key(self, dataset):
+        return self._dataset_info(dataset)[0]
+
+    def _dataset_info(self, dataset):
+        ds_id = id(dataset)
+        info = self._datasets_info.get(ds_id, None)
+        if info is not None and info[0]() is dataset:
+            return info[1:]
+
+        info = ((dataset.file.filename, dataset.name), dataset.size*dataset.dtype.itemsize,
+                h5py.check_string_dtype(dataset.dtype) is not None)
+        datasets_info = self._datasets_info
+        # forget the dataset once it's deleted, so its id can't be mistaken for a new dataset
+        ds_ref = weakref.ref(dataset, lambda _, ds_id=ds_id: datasets_info.pop(ds_id, None))
+        datasets_info[ds_id] = (ds_ref, ) + info
+        return info
+
+    @staticmethod
+    def _array_nbytes(values):
+        nbytes = values.nbytes
+        if values.dtype == object:
+            nbytes += sum(sys.getsizeof(v) for v in values.flat)
+        return nbytes
+
+    def __contains__(self, dataset):
+        return self._key(dataset) in self._columns
+
+    def __len__(self):
+        return len(self._columns)
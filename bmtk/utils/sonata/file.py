@@ -25,7 +25,8 @@ from .file_root import NodesRoot, EdgesRoot
 
 
 class File(object):
-    def __init__(self, data_files, data_type_files, mode='r', gid_table=None, require_magic=True):
+    def __init__(self, data_files, data_type_files, mode='r', gid_table=None, require_magic=True,
+                 column_cache_size=None):
         if mode != 'r':
             raise Exception('Currently only read mode is supported.')
 
@@ -68,10 +69,12 @@ class File(object):
             raise Exception('Could not find neither nodes nor edges for the given file(s).')
 
         if self._has_nodes:
-            self._nodes = NodesRoot(nodes=self._nodes_groups, node_types=self._node_types_dataframes, gid_table=gid_table)
+            self._nodes = NodesRoot(nodes=self._nodes_groups, node_types=self._node_types_dataframes,
+                                    gid_table=gid_table, column_cache_size=column_cache_size)
 
         if self._has_edges:
-            self._edges = EdgesRoot(edges=self._edges_groups, edge_types=self._edge_types_dataframes)
+            self._edges = EdgesRoot(edges=self._edges_groups, edge_types=self._edge_types_dataframes,
+                                    column_cache_size=column_cache_size)
 
     @property
     def nodes(self):
@@ -28,18 +28,20 @@ import pandas as pd
 import numpy as np
 
 from . import utils
+from .column_cache import ColumnCache
 from .population import NodePopulation, EdgePopulation
 from .types_table import NodeTypesTable, EdgeTypesTable
 
 
 class FileRoot(object):
     """Base class for both /nodes and /edges root group in h5 file"""
-    def __init__(self, root_name, h5_files, h5_mode, csv_files):
+    def __init__(self, root_name, h5_files, h5_mode, csv_files, column_cache_size=None):
         """
         :param root_name: should either be 'nodes' or 'edges'
         :param h5_files: file (or list of files) containing nodes/edges
         :param h5_mode: currently only supporting 'r' mode in h5py
         :param csv_files: file (or list of files) containing node/edge types
+        :param column_cache_size: if set, the max number of bytes of columns the populations will keep in memory
         """
         self._root_name = root_name
         self._h5_handles = [utils.load_h5(f, h5_mode) for f in utils.listify(h5_files)]
@@ -58,6 +60,11 @@ class FileRoot(object):
         # overhead).
         self._populations_cache = {}
 
+        # Optional LRU cache of whole columns shared by all the populations, see enable_column_cache()
+        self._column_cache = None
+        if column_cache_size is not None:
+            self.enable_column_cache(column_cache_size)
+
         self.check_format()
 
     @property
@@ -80,6 +87,27 @@ class FileRoot(object):
     def types_table(self, types_table):
         self._types_table = types_table
 
+    @property
+    def column_cache(self):
+        return self._column_cache
+
+    def enable_column_cache(self, max_bytes):
+        """Keeps up to max_bytes of the columns (node_ids, type ids, group columns, etc) read by the populations in
+        memory, so that repeated filtering/lookups don't have to read them from the hdf5 file again.
+
+        :param max_bytes: memory budget of the cache, the least recently used columns are dropped when it's exceeded.
+        :return: the ColumnCache, its stats() can be used to check the hit rate.
+        """
+        self._column_cache = ColumnCache(max_bytes)
+        for pop_obj in self._populations_cache.values():
+            pop_obj.column_cache = self._column_cache
+        return self._column_cache
+
+    def disable_column_cache(self):
+        self._column_cache = None
+        for pop_obj in self._populations_cache.values():
+            pop_obj.column_cache = None
+
     def _build_types_table(self):
         raise NotImplementedError
 
@@ -123,13 +151,15 @@ class FileRoot(object):
         else:
             h5_grp = self._populations_groups[population_name]
             pop_obj = self._build_population(population_name, h5_grp)
+            pop_obj.column_cache = self._column_cache
             self._populations_cache[population_name] = pop_obj
             return pop_obj
 
 
 class NodesRoot(FileRoot):
-    def __init__(self, nodes, node_types, mode='r', gid_table=None):
-        super(NodesRoot, self).__init__('nodes', h5_files=nodes, h5_mode=mode, csv_files=node_types)
+    def __init__(self, nodes, node_types, mode='r', gid_table=None, column_cache_size=None):
+        super(NodesRoot, self).__init__('nodes', h5_files=nodes, h5_mode=mode, csv_files=node_types,
+                                        column_cache_size=column_cache_size)
 
         # load the gid <--> (node_id, population) map if specified.
         self._gid_table = gid_table
@@ -253,8 +283,9 @@ class NodesRoot(FileRoot):
 
 
 class EdgesRoot(FileRoot):
-    def __init__(self, edges, edge_types, mode='r'):
-        super(EdgesRoot, self).__init__(root_name='edges', h5_files=edges, h5_mode=mode, csv_files=edge_types)
+    def __init__(self, edges, edge_types, mode='r', column_cache_size=None):
+        super(EdgesRoot, self).__init__(root_name='edges', h5_files=edges, h5_mode=mode, csv_files=edge_types,
+                                        column_cache_size=column_cache_size)
 
 
     @property
@@ -22,6 +22,7 @@
 #
 import numpy as np
 import pandas as pd
+import h5py
 
 from .column_property import ColumnProperty
 from .node import Node, NodeSet
@@ -132,13 +133,32 @@ class Group(object):
         """
         raise NotImplementedError
 
+    @staticmethod
+    def _read_column(col_ds, beg=None, end=None):
+        """Reads rows beg:end of a column dataset, strings are returned as str rather than bytes."""
+        if h5py.check_string_dtype(col_ds.dtype) is not None:
+            return np.array(col_ds.asstr()[beg:end], dtype=object)
+        return col_ds[beg:end]
+
+    @staticmethod
+    def _match(col_vals, filter_val):
+        """Mask of the rows of col_vals equal to filter_val, or in filter_val when it's a list."""
+        if isinstance(filter_val, list) and col_vals.ndim == 1:
+            return np.in1d(col_vals, filter_val)
+
+        is_match = col_vals == filter_val
+        if np.ndim(is_match) > 1:
+            # multi-dimensional columns (eg positions) must match on every dimension
+            is_match = np.all(is_match, axis=tuple(range(1, is_match.ndim)))
+        return np.broadcast_to(is_match, (len(col_vals),))
+
     def __len__(self):
         return self._nrows
 
     def __getitem__(self, group_index):
         group_props = {}
         for cname, h5_obj in self._group_table.items():
-            group_props[cname] = h5_obj[group_index]
+            group_props[cname] = self._parent._get_value(h5_obj, group_index)
         return group_props
 
     def __contains__(self, prop_name):
@@ -155,13 +175,12 @@ class NodeGroup(Group):
     @property
     def node_ids(self):
         self.build_indicies()
-        # print self._parent_indicies
-        return self._parent.inode_ids(self._parent_indicies)
+        return self._parent_column(self._parent._node_id_ds, self._parent_indicies)
 
     @property
     def node_type_ids(self):
         self.build_indicies()
-        return self._parent.inode_type_ids(self._parent_indicies)
+        return self._parent_column(self._parent._type_id_ds, self._parent_indicies)
 
     @property
     def gids(self):
@@ -185,26 +204,26 @@ class NodeGroup(Group):
         if property_name in self._group_columns:
             if not filtered_indicies:
                 # Just return all values in dataset
-                return np.array(self._group_table[property_name])
+                return np.array(self._parent._get_column(self._group_table[property_name]))
             else:
                 # Return only those values for group indicies with associated nodes
-                grp_indicies = self._parent.igroup_indicies(self._parent_indicies)
+                grp_indicies = self._parent_column(self._parent._group_index_ds, self._parent_indicies)
                 # It is possible that the group_index is unorderd or contains duplicates which will cause h5py slicing
                 # to fail. Thus convert to a numpy array
                 # TODO: loading the entire table is not good if the filtered nodes is small, consider building.
-                tmp_array = np.array(self._group_table[property_name])
+                tmp_array = self._parent._get_column(self._group_table[property_name])
                 return tmp_array[grp_indicies]
 
         elif property_name in self._parent.node_types_table.columns:
-            # For properties that come from node-types table we need to build the results from scratch
-            # TODO: Need to performance test, I think this code could be optimized.
+            # For properties that come from node-types table the value of every node_type_id is only looked up once
             node_types_table = self._parent.node_types_table
             nt_col = node_types_table.column(property_name)
-            tmp_array = np.empty(shape=len(self._parent_indicies), dtype=nt_col.dtype)
-            for i, ntid in enumerate(self.node_type_ids):
-                tmp_array[i] = node_types_table[ntid][property_name]
+            unique_ids, type_rows = np.unique(self.node_type_ids, return_inverse=True)
+            type_vals = np.empty(shape=len(unique_ids), dtype=nt_col.dtype)
+            for i, ntid in enumerate(unique_ids):
+                type_vals[i] = node_types_table[int(ntid)][property_name]
 
-            return tmp_array
+            return type_vals[type_rows]
 
     def to_dataframe(self):
         self.build_indicies()
@@ -217,9 +236,10 @@ class NodeGroup(Group):
                 for i in range(col.dimension):
                     # TODO: see if column name exists in the attributes
                     col_name = '{}.{}'.format(col.name, i)
-                    properties_df[col_name] = pd.Series(self._h5_group[col.name][:, i])
+                    properties_df[col_name] = pd.Series(self._parent._get_value(self._h5_group[col.name],
+                                                                                (slice(None), i)))
             else:
-                properties_df[col.name] = pd.Series(self._h5_group[col.name])
+                properties_df[col.name] = pd.Series(self._parent._get_value(self._h5_group[col.name], slice(None)))
 
         # Build a dataframe of parent node (node_id, gid, node_types, etc)
         root_df = pd.DataFrame()
@@ -246,70 +266,71 @@ class NodeGroup(Group):
         """Filter all nodes in the group by key=value pairs.
 
         The filter specifications may apply to either node_type or group column properties. Currently at the moment
-        it only supports equivlency. An intersection (and operator) is done for every different filter pair. This will
-        produce a generator of all nodes matching the the filters.
+        it only supports equivlency (or membership when the value is a list). An intersection (and operator) is done
+        for every different filter pair. This will produce a generator of all nodes matching the the filters.
 
         for node in filter(pop_name='VIp', depth=10.0):
            assert(node['pop_name'] == 'VIp' and node['depth'] == 10.0)
 
+        The filters are evaluated on whole columns (see filter_indicies()), Node objects are only created for the
+        matching nodes.
+
         :param filter_props: keys and their values to filter nodes on.
         :return: A generator that produces all valid nodes within the group with matching key==value pairs.
         """
-        # TODO: Integrate this with NodeSet.
+        for indx in self.filter_indicies(**filter_props):
+            yield self._parent.get_row(indx)
+
+    def filter_node_ids(self, **filter_props):
+        """Same as filter() but returns an array of the node_ids of the matching nodes."""
+        return self._parent_column(self._parent._node_id_ds, self.filter_indicies(**filter_props))
+
+    def filter_indicies(self, **filter_props):
+        """Returns an array of the population rows of the nodes in the group matching all the key=value pairs of
+        filter_props. Each filter is evaluated as a mask over the whole group, only the columns used in the filters
+        are read.
+        """
         self.build_indicies()
         node_types_table = self._parent.node_types_table
-        node_type_filter = set(node_types_table.node_type_ids)  # list of valid node_type_ids
-        type_filter = False
-        group_prop_filter = {}  # list of 'prop_name'==prov_val for group datasets
-        group_filter = False
-        node_id_filter = []
+        row_indicies = np.asarray(self._parent_indicies, dtype=np.int64)
+        mask = np.ones(len(row_indicies), dtype=bool)
+        node_type_filter = None  # list of valid node_type_ids
+        grp_indicies = None
 
-        # Build key==value lists
+        # Build key==value masks
         for filter_key, filter_val in filter_props.items():
             # TODO: Check if node_type_id is an input
             if filter_key in self._group_columns:
-                # keep of list of group_popertiess to filter
-                group_prop_filter[filter_key] = filter_val
-                group_filter = True
+                if grp_indicies is None:
+                    grp_indicies = self._parent_column(self._parent._group_index_ds, row_indicies)
+                col_vals = self._parent._get_column(self._group_table[filter_key])[grp_indicies]
+                mask &= self._match(col_vals, filter_val)
 
             elif filter_key in node_types_table.columns:
                 # for node_types we just keep a list of all node_type_ids with matching key==value pairs
-                node_type_filter &= set(node_types_table.find(filter_key, filter_val))
-                type_filter = True
+                matching_ids = set(node_types_table.find(filter_key, filter_val))
+                node_type_filter = matching_ids if node_type_filter is None else node_type_filter & matching_ids
 
             elif filter_key in ['node_id', 'node_ids']:
-                node_id_filter += filter_val
+                node_ids = self._parent_column(self._parent._node_id_ds, row_indicies)
+                mask &= np.in1d(node_ids, np.asarray(filter_val).flatten())
 
             else:
                 # TODO: should we raise an exception?
                 # TODO: User logger
                 print('Could not find property {} in either group or types table. Ignoring.'.format(filter_key))
 
-        # iterate through all nodes, skipping ones that don't have matching key==value pairs
-        for indx in self._parent_indicies:
-            # TODO: Don't build the node until you filter out node_type_id
-            node = self._parent.get_row(indx)
-            if type_filter and node.node_type_id not in node_type_filter:
-                # confirm node_type_id is a correct one
-                continue
-
-            if node_id_filter and node.node_id not in node_id_filter:
-                continue
-
-            if group_filter:
-                # Filter by group property values
-                # TODO: Allow group properties to handle lists
-                src_failed = True
-                for k, v in group_prop_filter.items():
-                    if node[k] != v:
-                        break
-                else:
-                    src_failed = False
+        if node_type_filter is not None:
+            node_type_ids = self._parent_column(self._parent._type_id_ds, row_indicies)
+            mask &= np.in1d(node_type_ids, list(node_type_filter))
 
-                if src_failed:
-                    continue
+        return row_indicies[mask]
 
-            yield node
+    def _parent_column(self, parent_ds, row_indicies):
+        """Values of a population dataset at the given rows, read with a single call."""
+        if len(row_indicies) == 0:
+            return np.zeros(0, dtype=parent_ds.dtype)
+        return self._parent._get_column(parent_ds)[row_indicies]
 
     def __iter__(self):
         self.build_indicies()
@@ -347,9 +368,10 @@ class EdgeGroup(Group):
                 for i in range(col.dimension):
                     # TODO: see if column name exists in the attributes
                     col_name = '{}.{}'.format(col.name, i)
-                    properties_df[col_name] = pd.Series(self._h5_group[col.name][:, i])
+                    properties_df[col_name] = pd.Series(self._parent._get_value(self._h5_group[col.name],
+                                                                                (slice(None), i)))
             else:
-                properties_df[col.name] = pd.Series(self._h5_group[col.name])
+                properties_df[col.name] = pd.Series(self._parent._get_value(self._h5_group[col.name], slice(None)))
 
         # Build a dataframe of parent node
         root_df = pd.DataFrame()
@@ -378,7 +400,7 @@ class EdgeGroup(Group):
         for indx_range in self._parent_indicies:
             indx_beg, indx_end = indx_range[0], indx_range[1]
             n_indx = c_indx + (indx_end - indx_beg)
-            ds_vals[c_indx:n_indx] = parent_ds[indx_beg:indx_end]
+            ds_vals[c_indx:n_indx] = self._parent._get_value(parent_ds, slice(indx_beg, indx_end))
             c_indx = n_indx
 
         return ds_vals
@@ -401,7 +423,7 @@ class EdgeGroup(Group):
             raise KeyError
 
         if all_rows:
-            return np.array(self._h5_group[property_name])
+            return np.array(self._parent._get_value(self._h5_group[property_name], slice(None)))
         else:
             self.build_indicies()
             # Go through all ranges and build the return list
@@ -410,7 +432,7 @@ class EdgeGroup(Group):
             i = 0
             for r_beg, r_end in self._parent_indicies:
                 r_len = r_end - r_beg
-                return_list[i:(i+r_len)] = dataset[r_beg:r_end]
+                return_list[i:(i+r_len)] = self._parent._get_value(dataset, slice(r_beg, r_end))
                 i += r_len
             return return_list
 
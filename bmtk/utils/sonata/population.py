@@ -50,6 +50,8 @@ class Population(object):
         self._group_indicies = {}  # grp-id --> list of rows indicies
         self._group_indicies_cache_built = False
 
+        self._column_cache = None  # ColumnCache shared by all the populations of a FileRoot, when enabled
+
     @property
     def name(self):
         """name of current population"""
@@ -71,7 +73,41 @@ class Population(object):
 
     @property
     def type_ids(self):
-        return np.array(self._type_id_ds)
+        return np.array(self._get_column(self._type_id_ds))
+
+    @property
+    def column_cache(self):
+        return self._column_cache
+
+    @column_cache.setter
+    def column_cache(self, column_cache):
+        self._column_cache = column_cache
+
+    def _get_column(self, dataset):
+        """Returns all the values of a dataset of the population, served from the column cache when it is enabled
+        (strings are returned as str)."""
+        if self._column_cache is not None and self._column_cache.fits(dataset):
+            return self._column_cache.get(dataset, NodeGroup._read_column)
+        return NodeGroup._read_column(dataset)
+
+    def _column_slice(self, dataset, beg, end):
+        """Returns rows beg:end of a dataset of the population, from the column cache when it is enabled."""
+        if self._column_cache is not None and self._column_cache.fits(dataset):
+            return self._column_cache.get(dataset, NodeGroup._read_column)[beg:end]
+        return NodeGroup._read_column(dataset, beg, end)
+
+    def _get_value(self, dataset, index):
+        """Returns dataset[index] (a row or a slice), from the column cache when it is enabled. Used by the row by row
+        readers (get_row, Group.__getitem__, etc), string columns are always read from the file so their values are
+        the same with or without the cache.
+        """
+        if self._column_cache is None or isinstance(dataset, np.ndarray) or self._column_cache.is_string(dataset) \
+                or not self._column_cache.fits(dataset):
+            return dataset[index]
+
+        value = self._column_cache.get(dataset, NodeGroup._read_column)[index]
+        # cached columns are read-only and shared, don't hand out views of them
+        return value.copy() if isinstance(value, np.ndarray) else value
 
     @property
     def group_id_ds(self):
@@ -122,7 +158,7 @@ class Population(object):
         else:
             tmp_index = pd.DataFrame()
             # TODO: Need to check the memory overhead, especially for edges. See if an iterative search is just as fast
-            tmp_index['grp_id'] = pd.Series(self._group_id_ds[()], dtype=self._group_id_ds.dtype)
+            tmp_index['grp_id'] = pd.Series(self._get_column(self._group_id_ds), dtype=self._group_id_ds.dtype)
             tmp_index['row_indx'] = pd.Series(range_itr(self._nrows), dtype=np.uint32)
             if build_cache:
                 # save all indicies as arrays
@@ -197,7 +233,7 @@ class NodePopulation(Population):
 
     @property
     def node_ids(self):
-        return np.array(self._node_id_ds)
+        return np.array(self._get_column(self._node_id_ds))
 
     @property
     def gids(self):
@@ -252,10 +288,10 @@ class NodePopulation(Population):
     def get_row(self, row_indx):
         # TODO: Use helper function so we don't have to lookup gid/node_id twice
         # Note: I'm not cacheing the nodes for memory purposes, but it might be beneificial too.
-        node_id = self._node_id_ds[row_indx]
-        node_type_id = self._type_id_ds[row_indx]
-        node_group_id = self._group_id_ds[row_indx]
-        node_group_index = self._group_index_ds[row_indx]
+        node_id = self._get_value(self._node_id_ds, row_indx)
+        node_type_id = self._get_value(self._type_id_ds, row_indx)
+        node_group_id = self._get_value(self._group_id_ds, row_indx)
+        node_group_index = self._get_value(self._group_index_ds, row_indx)
 
         node_type_props = self.node_types_table[node_type_id]
         node_group_props = self.get_group(node_group_id)[node_group_index]
@@ -304,6 +340,14 @@ class NodePopulation(Population):
             for node in grp.filter(**filter_props):
                 yield node
 
+    def filter_node_ids(self, **filter_props):
+        """Returns an array of the node_ids, in population order, of all the nodes matching the key=value pairs (see
+        NodeGroup.filter_indicies()).
+        """
+        row_indicies = [grp.filter_indicies(**filter_props) for grp in self.groups]
+        row_indicies = np.sort(np.concatenate(row_indicies)) if row_indicies else np.zeros(0, dtype=np.int64)
+        return self._get_column(self._node_id_ds)[row_indicies]
+
     def _build_node_id_index(self, force=False):
         if self._node_id_index_built and not force:
             return
@@ -347,12 +391,29 @@ class NodePopulation(Population):
 
 
 class EdgePopulation(Population):
+    filter_chunk_size = 2**22  # number of rows read at a time by filter()
+    coalesce_gap = 2**12  # rows closer than this are read with a single slice by get_target_columns()
+
     class __IndexStruct(object):
-        """Class sto store indicies subgroup"""
+        """Class sto store indicies subgroup.
+
+        The tables are either the h5py datasets or, after load_index(), numpy arrays. An in-memory index may only have
+        a subset of the node ids loaded (loaded_ids mask), the others are looked up in the on-disk index (h5_index).
+        """
         # TODO: Use collections.namedtuple
-        def __init__(self, lookup_table, edge_table):
+        def __init__(self, lookup_table, edge_table, loaded_ids=None, h5_index=None):
             self.lookup_table = lookup_table
             self.edge_table = edge_table
+            self.loaded_ids = loaded_ids
+            self.h5_index = h5_index
+
+        @property
+        def in_memory(self):
+            return self.h5_index is not None
+
+        def has_ids(self, node_ids):
+            """True if all the node_ids can be looked up in this index (rather than the on-disk one)."""
+            return self.loaded_ids is None or bool(np.all(self.loaded_ids[node_ids]))
 
     def __init__(self, pop_name, pop_group, edge_types_tables):
         super(EdgePopulation, self).__init__(pop_name=pop_name, pop_group=pop_group, types_table=edge_types_tables)
@@ -499,88 +560,310 @@ class EdgePopulation(Population):
     '''
 
     def get_row(self, index):
-        src_node = self._source_node_id_ds[index]
-        trg_node = self._target_node_id_ds[index]
-        edge_type_id = self._type_id_ds[index]
+        src_node = self._get_value(self._source_node_id_ds, index)
+        trg_node = self._get_value(self._target_node_id_ds, index)
+        edge_type_id = self._get_value(self._type_id_ds, index)
         edge_types_props = self.edge_types_table[edge_type_id]
 
-        edge_group_id = self._group_id_ds[index]
-        edge_group_index = self._group_index_ds[index]
+        edge_group_id = self._get_value(self._group_id_ds, index)
+        edge_group_index = self._get_value(self._group_index_ds, index)
         edge_group_props = self.get_group(edge_group_id)[edge_group_index]
         return Edge(trg_node_id=trg_node, src_node_id=src_node, source_pop=self.source_population,
                     target_pop=self.target_population, group_id = edge_group_id,
                     group_props=edge_group_props, edge_types_props=edge_types_props)
 
     def filter(self, **filter_props):
-        selected_edge_types = set(self.edge_types_table.edge_type_ids)
-        types_filter = False  # Do we need to filter results by edge_type_id
+        """Generator of all the edges matching the key=value pairs of filter_props.
+
+        Keys can be edge_type_id, group_id, a group property or an edge-types property, values may be a list to match
+        any of the values. The filters are evaluated on blocks of filter_chunk_size rows at a time (see
+        filter_indicies()) and Edge objects are only created for the matching edges.
+        """
+        for edge_indicies in self._filter_chunks(filter_props):
+            for indx in edge_indicies:
+                yield self.get_row(indx)
+
+    def filter_indicies(self, **filter_props):
+        """Returns an array of the (sorted) row indicies of all edges matching the key=value pairs, see filter()."""
+        edge_indicies = list(self._filter_chunks(filter_props))
+        return np.concatenate(edge_indicies) if edge_indicies else np.zeros(0, dtype=np.int64)
+
+    def filter_columns(self, columns=None, **filter_props):
+        """Returns the columns of all edges matching the key=value pairs (see filter()) as a dictionary of arrays.
+
+        :param columns: list of columns to return, any of source_node_id, target_node_id, edge_type_id,
+            edge_group_id, edge_group_index, group properties or edge-types properties. By default the source and target
+            node ids and the edge_type_id.
+        """
+        columns = columns or ['source_node_id', 'target_node_id', 'edge_type_id']
+        edge_cols = {col_name: [] for col_name in columns}
+        for edge_indicies in self._filter_chunks(filter_props):
+            for col_name, col_vals in self._edge_columns(edge_indicies, columns).items():
+                edge_cols[col_name].append(col_vals)
+
+        return {col_name: np.concatenate(col_vals) for col_name, col_vals in edge_cols.items()}
+
+    def _parse_filter(self, filter_props):
+        """Converts the key=value filters into the selected edge_type_ids, the selected group_ids (None when not
+        filtering on them) and the group property filters."""
+        filter_props = dict(filter_props)
+        selected_edge_types = None
         if 'edge_type_id' in filter_props:
             # TODO: Make sure the edge_type_id is valid
-            selected_edge_types = set([filter_props['edge_type_id']])
-            del filter_props['edge_type_id']
-            types_filter = True
+            selected_edge_types = set(np.atleast_1d(filter_props.pop('edge_type_id')).tolist())
 
+        selected_groups = None
         if 'group_id' in filter_props:
-            grp_id = filter_props['group_id']
-            grp_id = [grp_id] if np.isscalar(grp_id) else grp_id
-            selected_groups = set(grp_id)
-            del filter_props['group_id']
-        else:
-            selected_groups = set(self._group_map.keys())  # list of grp_id's that will be used
+            selected_groups = set(np.atleast_1d(filter_props.pop('group_id')).tolist())
 
         group_prop_filter = {}  # list of actual query statements
-        group_filter = False  # do we need to filter results by group_id
-
-        # Go through filter key==value pairs, create filters for groups and edge_types
         for filter_key, filter_val in filter_props.items():
-            # Find out what groups, if any, the column should search in.
-            group_query = False  # If it's querying a group property don't look in edge_types
-            types_query = False
-            for grp_id, grp_h5 in self._group_map.items():
-                if filter_key in grp_h5:
-                    # TODO: Need to check the dtype's match
-                    selected_groups &= set([grp_id])
-                    group_prop_filter[filter_key] = filter_val
-                    group_query = True
-                    group_filter = True
-
-            if (not group_query) and filter_key in self.edge_types_table.columns:
+            # Find out what groups, if any, the column should search in. If it's querying a group property don't look
+            # in edge_types
+            prop_groups = set(grp_id for grp_id, grp_h5 in self._group_map.items() if filter_key in grp_h5)
+            if prop_groups:
+                selected_groups = prop_groups if selected_groups is None else selected_groups & prop_groups
+                group_prop_filter[filter_key] = filter_val
+
+            elif filter_key in self.edge_types_table.columns:
                 # Presearch the edge types and get only those edge_type_ids which match key==val
-                selected_edge_types &= set(self.edge_types_table.find(filter_key, filter_val))
-                types_filter = True
-                types_query = True
+                matching_types = set(self.edge_types_table.find(filter_key, filter_val))
+                selected_edge_types = matching_types if selected_edge_types is None \
+                    else selected_edge_types & matching_types
 
-            if not (group_query or types_query):
+            else:
                 # Property key neither exists in a group or the edge_types_table
                 raise Exception('Could not find property {}'.format(filter_key))
 
-        # Iterate through all nodes, only returning those that match the filter
-        for indx in range_itr(self._nrows):
-            # Filter by edge_type_id
-            if types_filter:
-                # TODO: Invert the selected_edge_types, it will be faster to fail immeditely than search the entire list
-                if self._type_id_ds[indx] not in selected_edge_types:
-                    continue
+        return selected_edge_types, selected_groups, group_prop_filter
+
+    def _filter_chunks(self, filter_props):
+        """Generator of the indicies of the edges matching the filters, evaluated on filter_chunk_size rows at a time
+        so the memory used doesn't depend on the number of edges."""
+        selected_edge_types, selected_groups, group_prop_filter = self._parse_filter(filter_props)
+        for beg in range_itr(0, self._nrows, self.filter_chunk_size):
+            end = min(beg + self.filter_chunk_size, self._nrows)
+            mask = np.ones(end - beg, dtype=bool)
+            if selected_edge_types is not None:
+                mask &= np.in1d(self._column_slice(self._type_id_ds, beg, end), list(selected_edge_types))
+
+            if selected_groups is not None:
+                grp_ids = self._column_slice(self._group_id_ds, beg, end)
+                mask &= np.in1d(grp_ids, list(selected_groups))
+                if group_prop_filter:
+                    grp_indicies = self._column_slice(self._group_index_ds, beg, end)
+                    for grp_id in selected_groups:
+                        grp_mask = mask & (grp_ids == grp_id)
+                        if not np.any(grp_mask):
+                            continue
+
+                        # only read the part of the group columns used by this block of edges
+                        grp_rows = grp_indicies[grp_mask].astype(np.int64)
+                        rows_beg, rows_end = grp_rows.min(), grp_rows.max() + 1
+                        grp_match = np.ones(len(grp_rows), dtype=bool)
+                        for prop_key, prop_val in group_prop_filter.items():
+                            prop_ds = self._group_map[grp_id][prop_key]
+                            prop_vals = self._column_slice(prop_ds, rows_beg, rows_end)[grp_rows - rows_beg]
+                            grp_match &= EdgeGroup._match(prop_vals, prop_val)
+                        mask[grp_mask] = grp_match
+
+            yield beg + np.flatnonzero(mask)
+
+    def _edge_columns(self, edge_indicies, columns, by_group=False):
+        """Returns {column: values} for an array of edge indicies, in the same order as edge_indicies. With by_group
+        the result is {group_id: {column: values}} with the edges of each group, and group properties are only
+        returned for the groups that have them.
+        """
+        edge_indicies = np.asarray(edge_indicies, dtype=np.int64)
+        pop_datasets = {'source_node_id': self._source_node_id_ds, 'target_node_id': self._target_node_id_ds,
+                        'edge_type_id': self._type_id_ds, 'edge_group_id': self._group_id_ds,
+                        'edge_group_index': self._group_index_ds}
+        group_columns = [c for c in columns if c not in pop_datasets and
+                         any(c in grp_h5 for grp_h5 in self._group_map.values())]
+        for col_name in columns:
+            if col_name not in pop_datasets and col_name not in group_columns and \
+                    col_name not in self.edge_types_table.columns:
+                raise Exception('Could not find property {}'.format(col_name))
+
+        pop_cols = {}
+
+        def read_pop_column(col_name, rows=None):
+            if col_name not in pop_cols:
+                pop_cols[col_name] = self._read_rows(pop_datasets[col_name], edge_indicies)
+            return pop_cols[col_name] if rows is None else pop_cols[col_name][rows]
+
+        def edge_types_column(col_name, rows=None):
+            unique_ids, type_rows = np.unique(read_pop_column('edge_type_id', rows), return_inverse=True)
+            type_vals = [self.edge_types_table[int(type_id)][col_name] for type_id in unique_ids]
+            return np.array(type_vals + [None], dtype=object)[:-1][type_rows]
+
+        grp_ids = read_pop_column('edge_group_id') if (group_columns or by_group) else None
+        grp_indicies = read_pop_column('edge_group_index') if group_columns else None
+        if by_group:
+            grp_edge_cols = {}
+            for grp_id in np.unique(grp_ids):
+                grp_rows = np.flatnonzero(grp_ids == grp_id)
+                grp_h5 = self._group_map[int(grp_id)]
+                edge_cols = {}
+                for col_name in columns:
+                    if col_name in pop_datasets:
+                        edge_cols[col_name] = read_pop_column(col_name, grp_rows)
+                    elif col_name in group_columns:
+                        if col_name in grp_h5:
+                            edge_cols[col_name] = self._read_rows(grp_h5[col_name], grp_indicies[grp_rows])
+                    else:
+                        edge_cols[col_name] = edge_types_column(col_name, grp_rows)
+                grp_edge_cols[int(grp_id)] = edge_cols
+            return grp_edge_cols
+
+        edge_cols = {}
+        for col_name in columns:
+            if col_name in pop_datasets:
+                edge_cols[col_name] = read_pop_column(col_name)
+
+            elif col_name in group_columns:
+                col_vals = None
+                for grp_id in np.unique(grp_ids):
+                    grp_h5 = self._group_map[int(grp_id)]
+                    if col_name not in grp_h5:
+                        raise Exception('Property {} is missing from edge group {}.'.format(col_name, grp_id))
+                    grp_mask = grp_ids == grp_id
+                    grp_vals = self._read_rows(grp_h5[col_name], grp_indicies[grp_mask])
+                    if col_vals is None:
+                        col_vals = np.zeros((len(edge_indicies),) + grp_vals.shape[1:], dtype=grp_vals.dtype)
+                    col_vals[grp_mask] = grp_vals
+
+                if col_vals is None:
+                    col_ds = [grp_h5[col_name] for grp_h5 in self._group_map.values() if col_name in grp_h5][0]
+                    col_vals = self._read_rows(col_ds, [])
+                edge_cols[col_name] = col_vals
 
-            # Filter by group properties
-            if group_filter:
-                # TODO: Invert group search
-                grp_id = self._group_id_ds[indx]
-                if grp_id not in selected_groups:
-                    continue
+            else:
+                edge_cols[col_name] = edge_types_column(col_name)
 
-                grp_index = self._group_index_ds[indx]
-                search_failed = True
-                for prop_key, prop_val in group_prop_filter.items():
-                    if prop_val != self._group_map[grp_id][prop_key][grp_index]:
-                        break
-                else:
-                    search_failed = False
+        return edge_cols
 
-                if search_failed:
-                    continue
+    def _read_rows(self, dataset, rows):
+        """Reads the given rows of a dataset. Rows are sorted and those less than coalesce_gap apart are read together
+        with a single slice, so there is one read for every block of nearby rows rather than one for every row.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if self._column_cache is not None and self._column_cache.fits(dataset):
+            return self._get_column(dataset)[rows]
+
+        is_str = h5py.check_string_dtype(dataset.dtype) is not None
+        vals = np.empty((len(rows),) + dataset.shape[1:], dtype=object if is_str else dataset.dtype)
+        if len(rows) == 0:
+            return vals
+
+        row_order = np.argsort(rows, kind='stable')
+        sorted_rows = rows[row_order]
+        block_starts = np.concatenate(([0], np.flatnonzero(np.diff(sorted_rows) > self.coalesce_gap) + 1))
+        block_ends = np.append(block_starts[1:], len(rows))
+        for blk_beg, blk_end in zip(block_starts, block_ends):
+            rows_beg, rows_end = sorted_rows[blk_beg], sorted_rows[blk_end - 1] + 1
+            block_vals = EdgeGroup._read_column(dataset, rows_beg, rows_end)
+            vals[row_order[blk_beg:blk_end]] = block_vals[sorted_rows[blk_beg:blk_end] - rows_beg]
+        return vals
+
+    def _index_rows(self, table, rows):
+        """Rows of an index table, which is either an in-memory array or an h5py dataset."""
+        if isinstance(table, np.ndarray):
+            return table[rows]
+        return self._read_rows(table, rows).astype(np.int64)
+
+    def _index_ranges(self, index_struct, node_ids):
+        """Returns the [beg, end) edge ranges of all the node_ids, in the order of node_ids."""
+        node_ids = np.atleast_1d(np.asarray(node_ids, dtype=np.int64))
+        node_ids = node_ids[(node_ids >= 0) & (node_ids < len(index_struct.lookup_table))]
+        if index_struct.in_memory and not index_struct.has_ids(node_ids):
+            index_struct = index_struct.h5_index
+
+        node_ranges = self._index_rows(index_struct.lookup_table, node_ids).reshape(-1, 2)
+        range_ids = _expand_ranges(node_ranges[:, 0], node_ranges[:, 1])
+        return self._index_rows(index_struct.edge_table, range_ids).reshape(-1, 2)
+
+    def _index_edge_indicies(self, index_struct, node_ids):
+        """Uses a target_to_source or source_to_target index to find the indicies of all the edges of node_ids, edges
+        are in the same order as the node_ids. Node ids not in the index have no edges."""
+        edge_ranges = self._index_ranges(index_struct, node_ids)
+        return _expand_ranges(edge_ranges[:, 0], edge_ranges[:, 1])
+
+    def load_index(self, index_type='target', node_ids=None):
+        """Loads the target_to_source (or source_to_target) index into memory, so that get_target(s)/get_source(s)
+        and get_target_columns/get_source_columns don't have to read node_id_to_range and range_to_edge_id from the
+        hdf5 file for every lookup.
+
+        :param index_type: 'target' or 'source'
+        :param node_ids: if set only the index of these node ids is loaded (eg. the nodes of the current rank), other
+            node ids are still looked up in the hdf5 file.
+        """
+        if index_type == 'target':
+            assert(self._has_target_index)
+            index_struct = self._targets_index
+        elif index_type == 'source':
+            assert(self._has_source_index)
+            index_struct = self._sources_index
+        else:
+            raise Exception('Unknown index type {}, must be either target or source.'.format(index_type))
+
+        h5_index = index_struct.h5_index if index_struct.in_memory else index_struct
+        n_ids = len(h5_index.lookup_table)
+        if node_ids is None:
+            lookup_table = np.array(h5_index.lookup_table, dtype=np.int64).reshape(-1, 2)
+            edge_table = np.array(h5_index.edge_table, dtype=np.int64).reshape(-1, 2)
+            loaded_ids = None
+        else:
+            # Keep only the ranges of node_ids, renumbered so they are contiguous in edge_table
+            node_ids = np.unique(np.asarray(node_ids, dtype=np.int64))
+            node_ids = node_ids[(node_ids >= 0) & (node_ids < n_ids)]
+            edge_table = self._index_ranges(h5_index, node_ids)
+            node_ranges = self._index_rows(h5_index.lookup_table, node_ids).reshape(-1, 2)
+            range_ends = np.cumsum(node_ranges[:, 1] - node_ranges[:, 0])
+
+            lookup_table = np.zeros((n_ids, 2), dtype=np.int64)
+            lookup_table[node_ids, 0] = range_ends - (node_ranges[:, 1] - node_ranges[:, 0])
+            lookup_table[node_ids, 1] = range_ends
+            loaded_ids = np.zeros(n_ids, dtype=bool)
+            loaded_ids[node_ids] = True
+
+        index_obj = self.__IndexStruct(lookup_table, edge_table, loaded_ids=loaded_ids, h5_index=h5_index)
+        if index_type == 'target':
+            self._targets_index = index_obj
+        else:
+            self._sources_index = index_obj
+
+    def unload_index(self, index_type='target'):
+        """Go back to using the hdf5 index, see load_index()."""
+        if index_type == 'target' and self._has_target_index and self._targets_index.in_memory:
+            self._targets_index = self._targets_index.h5_index
+        elif index_type == 'source' and self._has_source_index and self._sources_index.in_memory:
+            self._sources_index = self._sources_index.h5_index
+
+    def get_target_columns(self, target_node_ids, columns=None, by_group=False):
+        """Returns the edges of all the targets in target_node_ids as a dictionary of arrays, one for each column.
+
+        Edges are found using the target_to_source index and read in a few large slices rather than one edge at a
+        time, ordered by target in the order of target_node_ids.
+
+        :param target_node_ids: a node id or array of node ids.
+        :param columns: list of columns to return, any of source_node_id, target_node_id, edge_type_id,
+            edge_group_id, edge_group_index, group properties or edge-types properties. By default the source and target
+            node ids and the edge_type_id.
+        :param by_group: if True returns {group_id: {column: values}}, the columns of every group only include the
+            group properties that exist in that group.
+        """
+        assert(self._has_target_index)
+        edge_indicies = self._index_edge_indicies(self._targets_index, target_node_ids)
+        columns = columns or ['source_node_id', 'target_node_id', 'edge_type_id']
+        return self._edge_columns(edge_indicies, columns, by_group)
 
-            yield self.get_row(indx)
+    def get_source_columns(self, source_node_ids, columns=None, by_group=False):
+        """Same as get_target_columns() for the edges of the sources in source_node_ids."""
+        assert(self._has_source_index)
+        edge_indicies = self._index_edge_indicies(self._sources_index, source_node_ids)
+        columns = columns or ['source_node_id', 'target_node_id', 'edge_type_id']
+        return self._edge_columns(edge_indicies, columns, by_group)
 
     def get_target(self, target_node_id):
         # TODO: Raise an exception, or call find() and log a warning that the index is not available
@@ -591,32 +874,32 @@ class EdgePopulation(Population):
     def get_targets(self, target_node_ids):
         # TODO: verify input is iterable
         assert(self._has_target_index)
-        trg_index = self._targets_index
-        for trg_id in target_node_ids:
-            for edge in self._get_index(trg_index, trg_id):
-                yield edge
+        # the index ranges of all the targets are resolved at once, rather than one target at a time
+        for edge_indx in self._index_edge_indicies(self._targets_index, list(target_node_ids)):
+            yield self.get_row(edge_indx)
 
     def get_source(self, source_node_id):
         assert(self._has_source_index)
         return self._get_index(self._sources_index, source_node_id)
 
     def get_sources(self, source_node_ids):
-        assert(self._has_target_index)
-        trg_index = self._sources_index
-        for src_id in source_node_ids:
-            for edge in self._get_index(trg_index, src_id):
-                yield edge
+        assert(self._has_source_index)
+        for edge_indx in self._index_edge_indicies(self._sources_index, list(source_node_ids)):
+            yield self.get_row(edge_indx)
 
     def _get_index(self, index_struct, lookup_id):
         # TODO: Use a EdgeSet instead
         if lookup_id >= len(index_struct.lookup_table):
             # TODO: Store length in index
-            raise StopIteration
+            return
+
+        if index_struct.in_memory and not index_struct.has_ids(lookup_id):
+            index_struct = index_struct.h5_index
 
         edges_table = index_struct.edge_table
-        lookup_beg, lookup_end = index_struct.lookup_table[lookup_id]
+        lookup_beg, lookup_end = self._get_value(index_struct.lookup_table, lookup_id)
         for i in range_itr(lookup_beg, lookup_end):
-            edge_indx_beg, edge_indx_end = edges_table[i]
+            edge_indx_beg, edge_indx_end = self._get_value(edges_table, i)
             for edge_indx in range_itr(edge_indx_beg, edge_indx_end):
                 yield self.get_row(edge_indx)
 
@@ -634,3 +917,11 @@ class EdgePopulation(Population):
 
     def next(self):
         return self.__next__()
+
+
+def _expand_ranges(range_begs, range_ends):
+    """Concatenation of np.arange(beg, end) for all the [beg, end) ranges."""
+    range_lens = range_ends - range_begs
+    n_total = int(np.sum(range_lens))
+    range_offsets = np.cumsum(range_lens) - range_lens
+    return np.arange(n_total, dtype=np.int64) - np.repeat(range_offsets - range_begs, range_lens)
@@ -50,11 +50,24 @@ def listify(files):
         return files
 
 
+# Size of the chunk cache of each dataset when reading. Compressed datasets are decompressed one chunk at a time, a
+# larger cache keeps recently used chunks around so that reading rows one at a time doesn't decompress the same chunk
+# again.
+H5_CHUNK_CACHE_SIZE = 16*2**20
+
+
 def load_h5(h5file, mode='r'):
     # TODO: Allow for h5py.Group also
     if isinstance(h5file, h5py.File):
         return h5file
 
+    if mode == 'r':
+        try:
+            return h5py.File(h5file, mode, rdcc_nbytes=H5_CHUNK_CACHE_SIZE, rdcc_nslots=10007)
+        except TypeError:
+            # older versions of h5py
+            pass
+
     return h5py.File(h5file, mode)
 
 
@@ -115,6 +128,137 @@ def get_node_ids(nodes_path, population):
     return node_ids
 
 
+def build_index_tables(node_ids, chunk_size=2**22):
+    """Builds the SONATA node_id_to_range and range_to_edge_id tables for a column of edge source or target node ids.
+
+    Every run of consecutive edges with the same node id becomes one range. The column is read chunk_size rows at a
+    time, so for a h5py dataset only the runs (usually about one per node) and not the whole column need to be in
+    memory.
+
+    :param node_ids: array or h5py dataset of node ids, one for each edge.
+    :param chunk_size: number of rows read at once.
+    :return: node_id_to_range (max(node_id)+1 x 2), range_to_edge_id (n_ranges x 2), both uint64 arrays
+    """
+    n_edges = len(node_ids)
+    run_nodes = []
+    run_starts = []
+    prev_node = None
+    for chunk_beg in range_itr(0, n_edges, chunk_size):
+        chunk = np.asarray(node_ids[chunk_beg:(chunk_beg + chunk_size)], dtype=np.int64)
+        is_start = np.empty(len(chunk), dtype=bool)
+        is_start[0] = prev_node is None or chunk[0] != prev_node
+        is_start[1:] = chunk[1:] != chunk[:-1]
+        starts = np.flatnonzero(is_start)
+        run_nodes.append(chunk[starts])
+        run_starts.append(starts + chunk_beg)
+        prev_node = chunk[-1]
+
+    run_nodes = np.concatenate(run_nodes) if run_nodes else np.zeros(0, dtype=np.int64)
+    run_starts = np.concatenate(run_starts) if run_starts else np.zeros(0, dtype=np.int64)
+    run_ends = np.append(run_starts[1:], n_edges)
+
+    # Group the ranges by node id, for a given node ranges stay in the order they appear in the edges
+    range_order = np.argsort(run_nodes, kind='stable')
+    range_to_edge_id = np.column_stack((run_starts[range_order], run_ends[range_order])).astype(np.uint64)
+
+    n_nodes = int(run_nodes.max()) + 1 if len(run_nodes) > 0 else 0
+    ranges_count = np.bincount(run_nodes, minlength=n_nodes)
+    ranges_end = np.cumsum(ranges_count)
+    node_id_to_range = np.column_stack((ranges_end - ranges_count, ranges_end)).astype(np.uint64)
+    node_id_to_range[ranges_count == 0] = 0
+
+    return node_id_to_range.reshape(n_nodes, 2), range_to_edge_id.reshape(len(run_nodes), 2)
+
+
+def create_index(node_ids_ds, output_grp, index_type='target', index_grp_name='indicies', chunk_size=2**22):
+    """Creates the <index_grp_name>/target_to_source (or source_to_target) index group of an edges population.
+
+    :param node_ids_ds: target_node_id (or source_node_id) dataset/array of the population.
+    :param output_grp: h5py group of the edges population.
+    :param index_type: 'target' or 'source'
+    :param index_grp_name: name of the group containing the indices
+    :param chunk_size: number of rows of node_ids_ds read at once.
+    """
+    if index_type == 'target':
+        output_grp = output_grp.create_group('{}/target_to_source'.format(index_grp_name))
+    elif index_type == 'source':
+        output_grp = output_grp.create_group('{}/source_to_target'.format(index_grp_name))
+    else:
+        raise Exception('Unknown index type {}, expected "target" or "source".'.format(index_type))
+
+    node_id_to_range, range_to_edge_id = build_index_tables(node_ids_ds, chunk_size=chunk_size)
+    output_grp.create_dataset('range_to_edge_id', data=range_to_edge_id, dtype='uint64')
+    output_grp.create_dataset('node_id_to_range', data=node_id_to_range, dtype='uint64')
+
+
+def narrow_dtype(data, dtype=None):
+    """Returns the smallest dtype that stores data without any loss. 64 bit integers become 32 bit integers (of the
+    same signedness) when all the values are within range, and 64 bit floats become 32 bit floats if every value is
+    exactly representable. Any other dtype is returned unchanged.
+
+    :param data: array of values
+    :param dtype: dtype the values would otherwise be saved as, by default the dtype of data.
+    :return: numpy dtype
+    """
+    data = np.asarray(data, dtype=dtype)
+    dtype = data.dtype
+    if data.size == 0 or dtype.itemsize <= 4:
+        return dtype
+
+    if dtype.kind in ('i', 'u'):
+        small_dtype = np.dtype('{}4'.format(dtype.kind))
+        dtype_info = np.iinfo(small_dtype)
+        if data.min() >= dtype_info.min and data.max() <= dtype_info.max:
+            return small_dtype
+
+    elif dtype.kind == 'f' and dtype.itemsize == 8:
+        with np.errstate(over='ignore'):
+            small_data = data.astype(np.float32)
+        if np.all((small_data == data) | np.isnan(data)):
+            return np.dtype(np.float32)
+
+    return dtype
+
+
+def create_dataset(h5_grp, name, data=None, shape=None, dtype=None, chunks=None, compression=None, shuffle=False,
+                   narrow_dtypes=False, **kwargs):
+    """Creates a h5py dataset with optional chunking, compression and dtype narrowing. Files saved with any of these
+    options are read the same way as regular files, h5py applies the filters transparently.
+
+    :param h5_grp: h5py group to create the dataset in
+    :param name: name of the dataset
+    :param data: values of the dataset, or None to create an empty dataset of the given shape
+    :param shape: shape of the dataset when data is None
+    :param dtype: dtype of the dataset
+    :param chunks: True to let h5py guess the chunk shape, or the number of rows in each chunk
+    :param compression: 'gzip', 'lzf' or an integer between 0 and 9 for gzip with a given level
+    :param shuffle: True to use the shuffle filter, it often improves the compression of numeric columns
+    :param narrow_dtypes: True to save numeric columns with the smallest lossless dtype (see narrow_dtype())
+    :return: h5py.Dataset
+    """
+    if data is not None and narrow_dtypes:
+        data = np.asarray(data, dtype=dtype)
+        if data.dtype.kind in ('i', 'u', 'f'):
+            dtype = narrow_dtype(data)
+
+    ds_shape = np.shape(data) if data is not None else tuple(shape)
+    if len(ds_shape) > 0 and ds_shape[0] > 0:
+        # chunked layouts aren't supported for empty datasets
+        if chunks is not None and chunks is not True and not isinstance(chunks, tuple):
+            chunks = (max(min(int(chunks), ds_shape[0]), 1),) + tuple(ds_shape[1:])
+        if chunks is not None:
+            kwargs['chunks'] = chunks
+        if compression is not None:
+            kwargs['compression'] = compression
+        if shuffle:
+            kwargs['shuffle'] = True
+
+    if data is not None:
+        return h5_grp.create_dataset(name, data=data, dtype=dtype, **kwargs)
+    else:
+        return h5_grp.create_dataset(name, shape=ds_shape, dtype=dtype, **kwargs)
+
+
 if sys.version_info[0] == 3:
     using_py3 = True
     range_itr = range